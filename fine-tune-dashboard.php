@@ -441,8 +441,25 @@ function handle_generate_qa_request(WP_REST_Request $request) {
     if (!$post || $post->post_status !== 'publish') {
         return new WP_REST_Response(array('message' => 'Post not found or not published'), 404);
     }
+
+    // With async=1 the request returns a job ID at once; poll /generate_qa_status for progress and the result
+    if ($request->get_param('async')) {
+        $job = fine_tune_start_qa_job($post_id, $post->post_content);
+
+        if (!$job) {
+            return new WP_REST_Response(array('message' => 'Failed to start Q/A generation'), 500);
+        }
+
+        return new WP_REST_Response(array('job_id' => $job['job_id'], 'status' => 'queued'), 202);
+    }
     
-    $post_content = escapeshellarg($post->post_content);
+    // Prefer the long-running Q/A server (generate_qa.py --serve) so each post skips interpreter startup;
+    // the script only runs here when the server can't be reached, so a post is never generated twice
+    $response = fine_tune_generate_qa_via_server($post_id, $post->post_content);
+
+    if ($response !== null) {
+        return $response;
+    }
 
     // Escape the path to the Python script to handle spaces
     $python_script = escapeshellarg(plugin_dir_path(__FILE__) . 'qa-generator/scripts/generate_qa.py');
@@ -450,13 +467,48 @@ function handle_generate_qa_request(WP_REST_Request $request) {
     // Path to the virtual environment's Python interpreter
     $venv_python = escapeshellarg(plugin_dir_path(__FILE__) . 'qa-generator/scripts/fine_tune_env/bin/python3');
 
-    // Set the OpenAI API key in the environment variable
-    $api_key = '';
-    putenv("OPENAI_API_KEY=$api_key");
+    fine_tune_set_openai_api_key();
+
+    // Run the Python script and stream the content through stdin, so large posts are not limited by ARG_MAX
+    // stdout carries only the JSON result; the generator's log lines go to stderr
+    $command = $venv_python . " " . $python_script . " --input - --post-id " . escapeshellarg($post_id);
+    $process = proc_open($command, array(0 => array('pipe', 'r'), 1 => array('pipe', 'w'), 2 => array('pipe', 'w')), $pipes);
+    $output = '';
+    $errors = '';
+
+    if (is_resource($process)) {
+        fwrite($pipes[0], $post->post_content);
+        fclose($pipes[0]);
+
+        // Drain both pipes together, so a chatty stderr can't fill its buffer and stall the script
+        $open = array(1 => $pipes[1], 2 => $pipes[2]);
+        foreach ($open as $pipe) {
+            stream_set_blocking($pipe, false);
+        }
+        while ($open) {
+            $read = array_values($open);
+            $write = null;
+            $except = null;
+            if (stream_select($read, $write, $except, 5) === false) {
+                break;
+            }
+            foreach ($open as $fd => $pipe) {
+                $chunk = fread($pipe, 8192);
+                if ($chunk !== false && $chunk !== '') {
+                    if ($fd === 1) {
+                        $output .= $chunk;
+                    } else {
+                        $errors .= $chunk;
+                    }
+                } elseif (feof($pipe)) {
+                    fclose($pipe);
+                    unset($open[$fd]);
+                }
+            }
+        }
+        proc_close($process);
+    }
 
-    // Run the Python script with the content as an argument
-    $command = $venv_python . " " . $python_script . " --content " . $post_content . " 2>&1"; // Redirect errors to output
-    $output = shell_exec($command);
     $response = json_decode($output, true);
 
     if ($response) {
@@ -466,10 +518,214 @@ function handle_generate_qa_request(WP_REST_Request $request) {
         return new WP_REST_Response($response, 200);
     } else {
         error_log('Python script output: ' . $output); // Log the output for debugging
+        error_log('Python script errors: ' . $errors);
         return new WP_REST_Response(array('message' => 'Failed to generate Q/A', 'details' => $output), 500);
     }
 }
 
+// The generator reads its OpenAI API key from the environment, which every spawned script inherits
+function fine_tune_set_openai_api_key() {
+    // Set the OpenAI API key in the environment variable
+    $api_key = '';
+    putenv("OPENAI_API_KEY=$api_key");
+}
+
+function fine_tune_qa_server_url() {
+    return defined('FINE_TUNE_QA_SERVER_URL') ? FINE_TUNE_QA_SERVER_URL : 'http://127.0.0.1:8765';
+}
+
+// Generate Q/A through the Q/A server and wait up to $timeout seconds for the result. Returns null only when the
+// server can't be reached; otherwise the response to send: the Q/A (also saved to the post), the server's error,
+// or, for a job still running, its ID to poll at /generate_qa_status
+function fine_tune_generate_qa_via_server($post_id, $content, $timeout = 600) {
+    $result = wp_remote_post(fine_tune_qa_server_url() . '/generate-qa', array(
+        'headers' => array('Content-Type' => 'application/json'),
+        'body' => json_encode(array('post_id' => (string) $post_id, 'content' => $content, 'wait' => false)),
+        'timeout' => 15,
+    ));
+
+    if (is_wp_error($result)) {
+        return null;
+    }
+
+    $code = wp_remote_retrieve_response_code($result);
+    $response = json_decode(wp_remote_retrieve_body($result), true);
+    if ($code !== 202 || empty($response['job_id'])) {
+        return new WP_REST_Response(is_array($response) ? $response : array('message' => 'Q/A server rejected the request'), $code >= 400 ? $code : 502);
+    }
+
+    $job_id = $response['job_id'];
+    $deadline = time() + $timeout;
+    while (time() < $deadline) {
+        sleep(1);
+        $result = wp_remote_get(fine_tune_qa_server_url() . '/jobs/' . rawurlencode($job_id), array('timeout' => 15));
+        if (is_wp_error($result) || wp_remote_retrieve_response_code($result) !== 200) {
+            continue;
+        }
+
+        $status = json_decode(wp_remote_retrieve_body($result), true);
+        if ($status['status'] === 'done') {
+            update_post_meta($post_id, 'generated_qa', json_encode($status['result']));
+
+            return new WP_REST_Response($status['result'], 200);
+        }
+        if ($status['status'] === 'failed') {
+            return new WP_REST_Response(array('message' => 'Failed to generate Q/A', 'details' => $status['error']), 500);
+        }
+    }
+
+    // The job carries on in the server, so hand back its ID rather than generating the post again
+    set_transient('fine_tune_qa_job_' . $job_id, array('job_id' => $job_id, 'source' => 'server', 'post_id' => $post_id), DAY_IN_SECONDS);
+
+    return new WP_REST_Response(array('job_id' => $job_id, 'status' => 'running'), 202);
+}
+
+// Directory holding the content, progress and log files of jobs run without the server
+function fine_tune_qa_jobs_dir() {
+    $upload_dir = wp_upload_dir();
+    return trailingslashit($upload_dir['basedir']) . 'fine-tune-qa-jobs';
+}
+
+// Start Q/A generation in the background and remember which post the job belongs to
+function fine_tune_start_qa_job($post_id, $content) {
+    $job = null;
+
+    $result = wp_remote_post(fine_tune_qa_server_url() . '/generate-qa', array(
+        'headers' => array('Content-Type' => 'application/json'),
+        'body' => json_encode(array('post_id' => (string) $post_id, 'content' => $content, 'wait' => false)),
+        'timeout' => 15,
+    ));
+
+    if (!is_wp_error($result) && wp_remote_retrieve_response_code($result) === 202) {
+        $response = json_decode(wp_remote_retrieve_body($result), true);
+        if (!empty($response['job_id'])) {
+            $job = array('job_id' => $response['job_id'], 'source' => 'server');
+        }
+    }
+
+    if (!$job) {
+        // No server: run the script detached, writing progress events as JSON lines to a file
+        $job_id = wp_generate_uuid4();
+        $jobs_dir = fine_tune_qa_jobs_dir();
+        wp_mkdir_p($jobs_dir);
+        $content_file = $jobs_dir . '/' . $job_id . '.md';
+        $events_file = $jobs_dir . '/' . $job_id . '.jsonl';
+
+        if (file_put_contents($content_file, $content) === false) {
+            return null;
+        }
+
+        $log_file = $jobs_dir . '/' . $job_id . '.log';
+        fine_tune_set_openai_api_key();
+
+        // The shell prints the detached script's PID, so a script that dies early is reported as failed
+        $python_script = escapeshellarg(plugin_dir_path(__FILE__) . 'qa-generator/scripts/generate_qa.py');
+        $venv_python = escapeshellarg(plugin_dir_path(__FILE__) . 'qa-generator/scripts/fine_tune_env/bin/python3');
+        $command = $venv_python . " " . $python_script . " --input " . escapeshellarg($content_file)
+            . " --post-id " . escapeshellarg($post_id) . " --progress"
+            . " > " . escapeshellarg($events_file) . " 2> " . escapeshellarg($log_file) . " & echo $!";
+        $pid = intval(exec($command));
+
+        $job = array('job_id' => $job_id, 'source' => 'file', 'events_file' => $events_file, 'log_file' => $log_file, 'pid' => $pid);
+    }
+
+    $job['post_id'] = $post_id;
+    set_transient('fine_tune_qa_job_' . $job['job_id'], $job, DAY_IN_SECONDS);
+
+    return $job;
+}
+
+// Whether the script of a job run without the server is still running; unknown PIDs count as running
+function fine_tune_qa_job_running($job) {
+    if (empty($job['pid'])) {
+        return true;
+    }
+    return function_exists('posix_kill') ? posix_kill($job['pid'], 0) : file_exists('/proc/' . $job['pid']);
+}
+
+// Progress of a job run without the server, read from its JSON lines file from event number $since on
+function fine_tune_read_qa_job_file($events_file, $since) {
+    $status = array('status' => 'queued', 'progress' => array('done' => 0, 'total' => null), 'events' => array(), 'next' => 0);
+    $lines = file_exists($events_file) ? file($events_file) : array();
+
+    foreach ($lines as $seq => $line) {
+        // The script may still be writing the last line
+        $event = substr($line, -1) === "\n" ? json_decode($line, true) : null;
+        if (!is_array($event)) {
+            break;
+        }
+
+        $event['seq'] = $seq;
+        $status['status'] = 'running';
+        if ($event['type'] === 'started') {
+            $status['progress'] = array('done' => 0, 'total' => $event['items']);
+        } elseif ($event['type'] === 'progress') {
+            $status['progress'] = array('done' => $event['done'], 'total' => $event['total']);
+        } elseif ($event['type'] === 'result') {
+            $status['status'] = 'done';
+            $status['result'] = $event['qa_pairs'];
+        } elseif ($event['type'] === 'failed') {
+            $status['status'] = 'failed';
+            $status['error'] = $event['error'];
+        }
+
+        if ($seq >= $since) {
+            $status['events'][] = $event;
+        }
+        $status['next'] = $seq + 1;
+    }
+
+    return $status;
+}
+
+add_action('rest_api_init', function () {
+    register_rest_route('custom/v1', '/generate_qa_status', array(
+        'methods' => 'GET',
+        'callback' => 'handle_generate_qa_status',
+        'permission_callback' => function () {
+            return current_user_can('edit_posts');
+        }
+    ));
+});
+
+// Poll a Q/A job: status, progress, events since ?since= and, once done, the result (also saved to the post)
+function handle_generate_qa_status(WP_REST_Request $request) {
+    $job_id = sanitize_text_field($request->get_param('job_id'));
+    $since = max(0, intval($request->get_param('since')));
+    $job = $job_id ? get_transient('fine_tune_qa_job_' . $job_id) : false;
+
+    if (!$job) {
+        return new WP_REST_Response(array('message' => 'Unknown job'), 404);
+    }
+
+    if ($job['source'] === 'server') {
+        $result = wp_remote_get(fine_tune_qa_server_url() . '/jobs/' . rawurlencode($job_id) . '?since=' . $since, array('timeout' => 15));
+        if (is_wp_error($result) || wp_remote_retrieve_response_code($result) !== 200) {
+            return new WP_REST_Response(array('message' => 'Q/A server did not return the job status'), 502);
+        }
+        $status = json_decode(wp_remote_retrieve_body($result), true);
+    } else {
+        // Checked before the events are read, so a script that writes its result and exits in between isn't misreported
+        $running = fine_tune_qa_job_running($job);
+        $status = fine_tune_read_qa_job_file($job['events_file'], $since);
+        if (!$running && !in_array($status['status'], array('done', 'failed'), true)) {
+            // It died before writing a result or a failed event, e.g. on a startup error; its log says why
+            $log = !empty($job['log_file']) && file_exists($job['log_file']) ? file_get_contents($job['log_file'], false, null, max(0, filesize($job['log_file']) - 2000)) : '';
+            $status['status'] = 'failed';
+            $status['error'] = 'Q/A generation exited without a result' . ($log !== '' ? ': ' . trim($log) : '');
+        }
+    }
+
+    if ($status['status'] === 'done' && isset($status['result'])) {
+        update_post_meta($job['post_id'], 'generated_qa', json_encode($status['result']));
+    }
+
+    $status['job_id'] = $job_id;
+    $status['post_id'] = $job['post_id'];
+
+    return new WP_REST_Response($status, 200);
+}
+
 // Handle file uploads
 function fine_tune_dashboard_handle_file_upload(WP_REST_Request $request) {
     // Make sure the file handling functions are available
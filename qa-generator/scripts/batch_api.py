@@ -0,0 +1,122 @@
+import os
+import json
+import asyncio
+import typing
+from pathlib import Path
+
+import aiohttp
+
+TERMINAL_BATCH_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+class BatchBackend:
+    """Where batch request files are sent. Subclass to target another provider or a test stand-in."""
+
+    async def submit(self, request_file: Path) -> str:
+        raise NotImplementedError
+
+    async def status(self, batch_id: str) -> typing.Dict[str, typing.Any]:
+        raise NotImplementedError
+
+    async def results(self, batch: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Optional[str]]:
+        """Map each custom_id to its completion text (None if that request failed)."""
+        raise NotImplementedError
+
+class OpenAIBatchBackend(BatchBackend):
+    """OpenAI Batch API (or any server exposing the same /files and /batches endpoints)."""
+
+    def __init__(self, session: aiohttp.ClientSession, api_base: str, api_key: str, completion_window: str = "24h"):
+        self.session = session
+        self.api_base = api_base.rstrip('/')
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.completion_window = completion_window
+
+    async def request_json(self, method: str, path: str, **kwargs) -> typing.Dict[str, typing.Any]:
+        async with self.session.request(method, self.api_base + path, headers=self.headers, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def submit(self, request_file: Path) -> str:
+        form = aiohttp.FormData()
+        form.add_field("purpose", "batch")
+        with open(request_file, 'rb') as f:
+            form.add_field("file", f, filename=request_file.name, content_type="application/jsonl")
+            uploaded = await self.request_json("POST", "/files", data=form)
+        batch = await self.request_json("POST", "/batches", json={
+            "input_file_id": uploaded['id'],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": self.completion_window,
+        })
+        return batch['id']
+
+    async def status(self, batch_id: str) -> typing.Dict[str, typing.Any]:
+        return await self.request_json("GET", f"/batches/{batch_id}")
+
+    async def results(self, batch: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Optional[str]]:
+        completions: typing.Dict[str, typing.Optional[str]] = {}
+        for file_key in ("output_file_id", "error_file_id"):
+            file_id = batch.get(file_key)
+            if not file_id:
+                continue
+            async with self.session.get(f"{self.api_base}/files/{file_id}/content", headers=self.headers) as response:
+                response.raise_for_status()
+                async for line in response.content:
+                    if line.strip():
+                        record = json.loads(line)
+                        completions[record['custom_id']] = completion_text(record)
+        return completions
+
+def completion_text(record: typing.Dict[str, typing.Any]) -> typing.Optional[str]:
+    response = record.get('response') or {}
+    if record.get('error') or response.get('status_code') != 200:
+        return None
+    try:
+        return response['body']['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+def write_request_files(
+    requests: typing.Iterable[typing.Tuple[str, str]],
+    output_dir: Path,
+    prefix: str,
+    body: typing.Callable[[str], typing.Dict[str, typing.Any]],
+    max_requests_per_file: int,
+) -> typing.List[Path]:
+    """Write (custom_id, prompt) pairs as Batch API request files of at most max_requests_per_file lines."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths: typing.List[Path] = []
+    out = None
+    count = 0
+    try:
+        for custom_id, prompt in requests:
+            if out is None or count >= max_requests_per_file:
+                if out is not None:
+                    out.close()
+                paths.append(output_dir / f"{prefix}_{len(paths):04d}.jsonl")
+                out = open(paths[-1], 'w')
+                count = 0
+            out.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body(prompt),
+            }) + '\n')
+            count += 1
+    finally:
+        if out is not None:
+            out.close()
+    return paths
+
+async def run_batches(backend: BatchBackend, request_files: typing.List[Path], poll_seconds: float) -> typing.Dict[str, typing.Optional[str]]:
+    """Submit every request file, wait for all batches to finish and merge their completions."""
+    batch_ids = [await backend.submit(path) for path in request_files]
+    completions: typing.Dict[str, typing.Optional[str]] = {}
+    pending = set(batch_ids)
+    while pending:
+        for batch_id in sorted(pending):
+            batch = await backend.status(batch_id)
+            if batch['status'] in TERMINAL_BATCH_STATUSES:
+                pending.discard(batch_id)
+                completions.update(await backend.results(batch))
+        if pending:
+            await asyncio.sleep(poll_seconds)
+    return completions
@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import typing
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# generate_qa refuses to import without a key; the mock server accepts any
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import aiohttp
+
+import generate_qa
+from custom_config import OPENAI_PRICING, BATCH_MAX_POSTS_IN_FLIGHT, LLM_STAGE_ROUTES, MAX_CONCURRENT_CALLS
+from metrics import Metrics
+from retry_queue import RetryQueue
+from qa_store import QAStore
+from dedup import NearDuplicateIndex
+from tracing import Tracer
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+WORDS = (
+    "the server reads its configuration from environment variables before it opens any connection and "
+    "each worker keeps a pool of sessions that are reused across requests so a slow upstream only delays "
+    "the calls waiting on it while retries back off exponentially and give up after a few attempts"
+).split()
+LANGUAGES = ["python", "bash", "json", "php", "yaml", ""]
+
+# (share of posts, sections per post, paragraphs per section)
+POST_SIZES = [(0.5, (2, 5), (1, 3)), (0.35, (6, 15), (2, 5)), (0.15, (20, 40), (3, 8))]
+
+def synthetic_paragraph(rng: random.Random) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))).capitalize() + '.'
+
+def synthetic_code(rng: random.Random) -> str:
+    lines = [f"{rng.choice(WORDS)}_{i} = {rng.choice(WORDS)}({rng.randint(0, 99)})" for i in range(rng.randint(2, 25))]
+    return f"```{rng.choice(LANGUAGES)}\n" + '\n'.join(lines) + "\n```"
+
+def synthetic_post(rng: random.Random, post_id: int) -> typing.Dict[str, typing.Any]:
+    """A markdown post whose size and share of code-fenced paragraphs vary from post to post."""
+    _, (min_sections, max_sections), (min_paragraphs, max_paragraphs) = rng.choices(POST_SIZES, weights=[s[0] for s in POST_SIZES])[0]
+    fence_density = rng.choice([0.0, 0.1, 0.3, 0.6])
+    parts = [f"# Post {post_id}", synthetic_paragraph(rng)]
+    for s in range(rng.randint(min_sections, max_sections)):
+        parts.append(f"{'#' * rng.choice([2, 2, 3])} Section {s} {rng.choice(WORDS).title()}")
+        for _ in range(rng.randint(min_paragraphs, max_paragraphs)):
+            parts.append(synthetic_code(rng) if rng.random() < fence_density else synthetic_paragraph(rng))
+    return {"post_id": post_id, "content": '\n\n'.join(parts) + '\n'}
+
+def synthetic_corpus(num_posts: int, seed: int = 0) -> typing.List[typing.Dict[str, typing.Any]]:
+    rng = random.Random(seed)
+    return [synthetic_post(rng, post_id) for post_id in range(num_posts)]
+
+def percentile(values: typing.List[float], q: float) -> typing.Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+def peak_rss_mb() -> typing.Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_mock_server(port: int, mock_args: typing.List[str]) -> subprocess.Popen:
+    # A separate process, so the fake API's work does not share the event loop being measured
+    return subprocess.Popen(
+        [sys.executable, str(SCRIPT_DIR / "mock_openai_server.py"), "--port", str(port), *mock_args],
+        cwd=SCRIPT_DIR,
+    )
+
+async def wait_until_ready(stats_url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(stats_url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Mock server at {stats_url} did not start")
+            await asyncio.sleep(0.1)
+
+async def fetch_json(url: str) -> typing.Dict[str, typing.Any]:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.json()
+
+def isolate_pipeline(work_dir: Path, api_base: str, requests_per_minute: float, tokens_per_minute: float):
+    """Point generate_qa's module state at a scratch directory with no cache or checkpoints,
+    and every stage at one backend for the server under test (keeping each stage's model)."""
+    generate_qa.response_cache = None
+    generate_qa.CHECKPOINT_ENABLED = False
+    generate_qa.REJECTION_LOG_ENABLED = False
+    generate_qa.retry_queue = RetryQueue(work_dir / "retry_queue.sqlite3", generate_qa.RETRY_MAX_ATTEMPTS)
+    generate_qa.qa_store = QAStore(work_dir / "qa_store.sqlite3")
+    generate_qa.metrics = Metrics(OPENAI_PRICING, work_dir / "call_metrics.jsonl")
+    generate_qa.configure_backends(
+        {"benchmark": {
+            "type": "openai", "base_url": api_base, "api_key_env": "OPENAI_API_KEY", "max_concurrency": MAX_CONCURRENT_CALLS,
+            "requests_per_minute": requests_per_minute, "tokens_per_minute": tokens_per_minute,
+        }},
+        {stage: ("benchmark", model) for stage, (_, model) in LLM_STAGE_ROUTES.items()},
+    )
+    if generate_qa.dedup_index is not None:
+        generate_qa.dedup_index = NearDuplicateIndex(generate_qa.DEDUP_THRESHOLD)
+
+async def run_corpus(posts: typing.List[typing.Dict[str, typing.Any]], max_in_flight: int) -> typing.Tuple[float, typing.List[float], int]:
+    limit = asyncio.Semaphore(max_in_flight)
+    post_seconds: typing.List[float] = []
+    pair_count = 0
+
+    async def run_post(post: typing.Dict[str, typing.Any]):
+        nonlocal pair_count
+        async with limit:
+            started = time.monotonic()
+            qa_pairs = await generate_qa.generate_questions_answers(post['content'], post_id=str(post['post_id']))
+            post_seconds.append(time.monotonic() - started)
+            pair_count += len(qa_pairs)
+
+    started = time.monotonic()
+    async with generate_qa.shared_session():
+        await asyncio.gather(*(run_post(post) for post in posts))
+    return time.monotonic() - started, post_seconds, pair_count
+
+def time_parser(posts: typing.List[typing.Dict[str, typing.Any]]) -> float:
+    started = time.perf_counter()
+    for post in posts:
+        generate_qa.extract_sections_and_code(
+            post['content'], context_window=2, max_context_lines=generate_qa.MAX_CONTEXT_LINES,
+            max_section_tokens=generate_qa.SECTION_MAX_TOKENS, overlap_tokens=generate_qa.SECTION_OVERLAP_TOKENS,
+        )
+    return time.perf_counter() - started
+
+async def benchmark(posts: typing.List[typing.Dict[str, typing.Any]], args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    work_dir = Path(tempfile.mkdtemp(prefix="qa-benchmark-"))
+    server = None
+    api_base = args.api_base
+    if api_base is None:
+        port = free_port()
+        mock_args = ["--latency", args.latency, "--latency-per-token", str(args.latency_per_token),
+                     "--rate-limit-rate", str(args.rate_limit_rate), "--error-rate", str(args.error_rate), "--seed", str(args.seed)]
+        if args.server_rpm:
+            mock_args += ["--rpm", str(args.server_rpm)]
+        if args.server_tpm:
+            mock_args += ["--tpm", str(args.server_tpm)]
+        server = start_mock_server(port, mock_args)
+        api_base = f"http://127.0.0.1:{port}/v1"
+    isolate_pipeline(work_dir, api_base, args.client_rpm, args.client_tpm)
+    stats_url = api_base.rsplit('/v1', 1)[0] + "/stats"
+
+    try:
+        await wait_until_ready(stats_url)
+        parse_seconds = time_parser(posts)
+        if args.profile:
+            generate_qa.tracer = Tracer()
+        duration, post_seconds, pair_count = await run_corpus(posts, args.max_in_flight)
+        server_stats = await fetch_json(stats_url)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    with open(work_dir / "call_metrics.jsonl") as f:
+        calls = [json.loads(line) for line in f if line.strip()]
+    latencies = [call['latency'] for call in calls if not call['cached']]
+    waits = [call['queue_wait'] for call in calls if not call['cached']]
+    run = generate_qa.metrics.summary()['run']
+    corpus_bytes = sum(len(post['content'].encode('utf-8')) for post in posts)
+    if generate_qa.tracer is not None:
+        generate_qa.tracer.write(args.profile)
+        print(generate_qa.tracer.summary_table(), file=sys.stderr)
+    report = {
+        "posts": len(posts),
+        "qa_pairs": pair_count,
+        "calls": len(calls),
+        "duration_seconds": round(duration, 3),
+        "posts_per_min": round(len(posts) / duration * 60, 1),
+        "calls_per_min": round(len(calls) / duration * 60, 1),
+        "call_latency_p50": percentile(latencies, 0.5),
+        "call_latency_p99": percentile(latencies, 0.99),
+        "queue_wait_p50": percentile(waits, 0.5),
+        "queue_wait_p99": percentile(waits, 0.99),
+        "post_seconds_p50": percentile(post_seconds, 0.5),
+        "post_seconds_p99": percentile(post_seconds, 0.99),
+        "errors": run['errors'],
+        "retries": run['retries'],
+        "hedges": run['hedges'],
+        "prompt_tokens": run['prompt_tokens'],
+        "completion_tokens": run['completion_tokens'],
+        "parse_mb_per_second": round(corpus_bytes / 1e6 / parse_seconds, 2) if parse_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "server": server_stats,
+    }
+    if generate_qa.tracer is not None:
+        report["profile"] = generate_qa.tracer.summary()["stages"]
+    return report
+
+# Metrics compared against a baseline report, and whether higher values are better
+REGRESSION_CHECKS = {
+    "posts_per_min": True,
+    "calls_per_min": True,
+    "parse_mb_per_second": True,
+    "call_latency_p99": False,
+    "post_seconds_p99": False,
+    "peak_rss_mb": False,
+}
+
+def regressions(report: typing.Dict[str, typing.Any], baseline: typing.Dict[str, typing.Any], tolerance: float) -> typing.List[str]:
+    found = []
+    for name, higher_is_better in REGRESSION_CHECKS.items():
+        current, previous = report.get(name), baseline.get(name)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            found.append(f"{name}: {previous} -> {current} ({change:+.0%})")
+    return found
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Q/A generation against a local mock OpenAI server.")
+    parser.add_argument('--posts', type=int, default=50, help='Number of synthetic posts to generate')
+    parser.add_argument('--corpus', type=str, default=None, help='Use this {post_id, content} JSONL instead of a synthetic corpus')
+    parser.add_argument('--write-corpus', type=str, default=None, metavar='PATH', help='Write the synthetic corpus as JSONL and exit')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-in-flight', type=int, default=BATCH_MAX_POSTS_IN_FLIGHT, help='Posts processed concurrently')
+    parser.add_argument('--api-base', type=str, default=None, help='Use an already running server instead of starting the mock')
+    parser.add_argument('--latency', type=str, default="lognormal:0.2,0.5", help='Mock latency distribution (see mock_openai_server.py)')
+    parser.add_argument('--latency-per-token', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of mock requests answered with a 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of mock requests answered with a 500')
+    parser.add_argument('--server-rpm', type=int, default=None, help='Requests per minute the mock allows')
+    parser.add_argument('--server-tpm', type=int, default=None, help='Tokens per minute the mock allows')
+    parser.add_argument('--client-rpm', type=float, default=10000, help='Requests per minute the client limiter allows')
+    parser.add_argument('--client-tpm', type=float, default=10_000_000, help='Tokens per minute the client limiter allows')
+    parser.add_argument('--hedge', action='store_true', help='Hedge requests slower than the observed p95 (LLM_HEDGE_ENABLED)')
+    parser.add_argument('--profile', type=str, default=None, metavar='TRACE_FILE', help='Trace the run (as generate_qa.py --profile) and add time by stage to the report')
+    parser.add_argument('--baseline', type=str, default=None, help='Earlier report to compare against; exits 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative change before a metric counts as regressed')
+    parser.add_argument('--output', type=str, default=None, help='Also write the report to this file')
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.hedge:
+        generate_qa.LLM_HEDGE_ENABLED = True
+    if args.corpus:
+        with open(args.corpus) as f:
+            posts = [json.loads(line) for line in f if line.strip()]
+    else:
+        posts = synthetic_corpus(args.posts, args.seed)
+    if args.write_corpus:
+        with open(args.write_corpus, 'w') as f:
+            for post in posts:
+                f.write(json.dumps(post) + '\n')
+        sys.exit(0)
+
+    report = asyncio.run(benchmark(posts, args))
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"Regression: {line}", file=sys.stderr)
+        sys.exit(1 if found else 0)
@@ -0,0 +1,148 @@
+import os
+import json
+import sqlite3
+import hashlib
+import typing
+from pathlib import Path
+
+def item_hash(*parts: typing.Optional[str]) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class Checkpoint:
+    """Durable record of generated Q/A pairs, keyed by post ID and section/snippet content hash.
+
+    Every pair is appended to ``output_file`` as soon as it is produced, between a "start" and a
+    "done" record for its item ({"post_id", "item_hash", "checkpoint"}); the done record is
+    fsynced along with the item's pairs, so an item counts as finished only once all of it is
+    on disk. A SQLite index beside it maps (post_id, item_hash) to completion state and the byte
+    offsets of that item's lines, so resuming never re-parses the whole JSONL.
+    """
+
+    def __init__(self, output_file: typing.Union[str, Path], index_file: typing.Optional[typing.Union[str, Path]] = None):
+        self.output_file = Path(output_file)
+        self.index_file = Path(index_file) if index_file else self.output_file.with_suffix('.index.sqlite3')
+        os.makedirs(self.output_file.parent, exist_ok=True)
+
+        rebuild = not self.index_file.exists()
+        self.conn = sqlite3.connect(self.index_file, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "post_id TEXT NOT NULL, item_hash TEXT NOT NULL, done INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (post_id, item_hash))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pairs ("
+            "post_id TEXT NOT NULL, item_hash TEXT NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pairs_item ON pairs(post_id, item_hash)")
+        self.fd = os.open(self.output_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if rebuild:
+            self.rebuild_index()
+
+    def rebuild_index(self):
+        # Replays the start/done records the way start_item and mark_done applied them, so an item
+        # whose attempt was interrupted stays unfinished and its orphaned pairs are dropped
+        offset = 0
+        has_markers = False
+        with self.conn, open(self.output_file, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    post_id, key = record['post_id'], record['item_hash']
+                except (ValueError, KeyError, TypeError):
+                    offset += len(line)
+                    continue
+                marker = record.get('checkpoint')
+                if marker == "start":
+                    has_markers = True
+                    self.conn.execute("DELETE FROM pairs WHERE post_id = ? AND item_hash = ?", (post_id, key))
+                    self.conn.execute("INSERT OR REPLACE INTO items (post_id, item_hash, done) VALUES (?, ?, 0)", (post_id, key))
+                elif marker == "done":
+                    has_markers = True
+                    self.conn.execute("INSERT OR REPLACE INTO items (post_id, item_hash, done) VALUES (?, ?, 1)", (post_id, key))
+                else:
+                    self.conn.execute("INSERT OR IGNORE INTO items (post_id, item_hash, done) VALUES (?, ?, 0)", (post_id, key))
+                    self.conn.execute(
+                        "INSERT INTO pairs (post_id, item_hash, offset, length) VALUES (?, ?, ?, ?)",
+                        (post_id, key, offset, len(line)),
+                    )
+                offset += len(line)
+            if not has_markers:
+                # Written before start/done records existed: every item found counts as complete, as it used to
+                self.conn.execute("UPDATE items SET done = 1")
+
+    def is_done(self, post_id: str, key: str) -> bool:
+        row = self.conn.execute("SELECT done FROM items WHERE post_id = ? AND item_hash = ?", (post_id, key)).fetchone()
+        return bool(row and row[0])
+
+    def load_pairs(self, post_id: str, key: str) -> typing.List[typing.Dict[str, str]]:
+        rows = self.conn.execute(
+            "SELECT offset, length FROM pairs WHERE post_id = ? AND item_hash = ? ORDER BY offset", (post_id, key)
+        ).fetchall()
+        qa_pairs = []
+        with open(self.output_file, 'rb') as f:
+            for offset, length in rows:
+                f.seek(offset)
+                record = json.loads(f.read(length))
+                record.pop('post_id', None)
+                record.pop('item_hash', None)
+                qa_pairs.append(record)
+        return qa_pairs
+
+    def start_item(self, post_id: str, key: str):
+        # Pairs left over from an interrupted attempt are orphaned; the item is regenerated in full
+        self.write_record({"post_id": post_id, "item_hash": key, "checkpoint": "start"})
+        with self.conn:
+            self.conn.execute("DELETE FROM pairs WHERE post_id = ? AND item_hash = ?", (post_id, key))
+            self.conn.execute("INSERT OR REPLACE INTO items (post_id, item_hash, done) VALUES (?, ?, 0)", (post_id, key))
+
+    def write_record(self, record: typing.Dict[str, typing.Any]) -> typing.Tuple[int, int]:
+        data = (json.dumps(record) + '\n').encode('utf-8')
+        os.write(self.fd, data)
+        # O_APPEND leaves the file position at the end of our own write, even with other writers
+        return os.lseek(self.fd, 0, os.SEEK_CUR) - len(data), len(data)
+
+    def append_pair(self, post_id: str, key: str, qa_pair: typing.Dict[str, str]):
+        # Not fsynced on its own: until the item's done record is on disk, a lost pair only means the item is redone
+        offset, length = self.write_record({"post_id": post_id, "item_hash": key, **qa_pair})
+        self.conn.execute(
+            "INSERT INTO pairs (post_id, item_hash, offset, length) VALUES (?, ?, ?, ?)",
+            (post_id, key, offset, length),
+        )
+
+    def sync(self):
+        os.fsync(self.fd)
+
+    def iter_done_pairs(self, batch_size: int = 1000) -> typing.Iterator[typing.Dict[str, str]]:
+        """Yield the pairs of finished items in the order they were written, skipping those orphaned
+        by an unfinished attempt, reading ``batch_size`` index rows at a time."""
+        last_rowid = 0
+        with open(self.output_file, 'rb') as f:
+            while True:
+                # Paging by rowid keeps memory flat however large the checkpoint is
+                rows = self.conn.execute(
+                    "SELECT pairs.rowid, pairs.offset, pairs.length FROM pairs JOIN items USING (post_id, item_hash)"
+                    " WHERE items.done = 1 AND pairs.rowid > ? ORDER BY pairs.rowid LIMIT ?",
+                    (last_rowid, batch_size),
+                ).fetchall()
+                if not rows:
+                    return
+                for _, offset, length in rows:
+                    f.seek(offset)
+                    yield json.loads(f.read(length))
+                last_rowid = rows[-1][0]
+
+    def mark_done(self, post_id: str, key: str):
+        # One fsync per item covers its pairs and the done record
+        self.write_record({"post_id": post_id, "item_hash": key, "checkpoint": "done"})
+        self.sync()
+        self.conn.execute("UPDATE items SET done = 1 WHERE post_id = ? AND item_hash = ?", (post_id, key))
+
+    def close(self):
+        os.close(self.fd)
+        self.conn.close()
@@ -0,0 +1,141 @@
+import re
+import functools
+import typing
+
+# Word-ish runs and single punctuation marks, roughly how BPE tokenizers pre-split text
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+FENCE_PATTERN = re.compile(r'^[ \t]*(`{3,}|~{3,})(.*)$')
+
+@functools.lru_cache(maxsize=None)
+def load_encoding(model: str):
+    # tiktoken is optional and fetches its vocabulary on first use; without it (or offline)
+    # token counts fall back to a local estimate that needs no downloads
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            return None
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    encoding = load_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Long words split into several BPE tokens; about four characters per token
+    return sum((len(token) + 3) // 4 for token in TOKEN_PATTERN.findall(text))
+
+def split_blocks(text: str) -> typing.List[str]:
+    """Split text into paragraphs and whole fenced code blocks, separated by blank lines."""
+    blocks: typing.List[str] = []
+    current: typing.List[str] = []
+    fence: typing.Optional[typing.Tuple[str, int]] = None
+    for line in text.splitlines():
+        match = FENCE_PATTERN.match(line)
+        if fence is None:
+            if match:
+                if current:
+                    blocks.append('\n'.join(current))
+                current = [line]
+                fence = (match.group(1)[0], len(match.group(1)))
+            elif line.strip():
+                current.append(line)
+            elif current:
+                blocks.append('\n'.join(current))
+                current = []
+        else:
+            current.append(line)
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= fence[1] and not match.group(2).strip():
+                blocks.append('\n'.join(current))
+                current = []
+                fence = None
+    if current:
+        blocks.append('\n'.join(current))
+    return blocks
+
+def split_long_line(line: str, max_tokens: int, model: str) -> typing.List[str]:
+    # Text extracted from PDFs and spreadsheets often has no line breaks at all; pack whole words
+    pieces: typing.List[str] = []
+    current: typing.List[str] = []
+    current_tokens = 0
+    for word in line.split():
+        word_tokens = count_tokens(word, model)
+        if word_tokens > max_tokens:
+            step = max(1, len(word) * max_tokens // word_tokens)
+            parts = [word[i:i + step] for i in range(0, len(word), step)]
+        else:
+            parts = [word]
+        for part in parts:
+            part_tokens = word_tokens if len(parts) == 1 else count_tokens(part, model)
+            if current and current_tokens + part_tokens > max_tokens:
+                pieces.append(' '.join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        pieces.append(' '.join(current))
+    return pieces
+
+def split_oversized(block: str, max_tokens: int, model: str) -> typing.List[str]:
+    """Break a block larger than max_tokens at line boundaries, or between words within a huge line."""
+    pieces: typing.List[str] = []
+    current: typing.List[str] = []
+    current_tokens = 0
+    for line in block.splitlines():
+        line_tokens = count_tokens(line, model)
+        if line_tokens > max_tokens:
+            if current:
+                pieces.append('\n'.join(current))
+                current, current_tokens = [], 0
+            pieces.extend(split_long_line(line, max_tokens, model))
+            continue
+        if current and current_tokens + line_tokens > max_tokens:
+            pieces.append('\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append('\n'.join(current))
+    return pieces
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int = 0, model: str = "gpt-4o-mini") -> typing.List[str]:
+    """Split text into windows of at most max_tokens, never cutting a paragraph or code fence that fits.
+
+    Consecutive windows repeat up to overlap_tokens of trailing blocks so questions that span
+    a window boundary still see their context.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+
+    blocks: typing.List[typing.Tuple[str, int]] = []
+    for block in split_blocks(text):
+        block_tokens = count_tokens(block, model)
+        if block_tokens > max_tokens:
+            blocks.extend((piece, count_tokens(piece, model)) for piece in split_oversized(block, max_tokens, model))
+        else:
+            blocks.append((block, block_tokens))
+
+    chunks: typing.List[str] = []
+    current: typing.List[typing.Tuple[str, int]] = []
+    current_tokens = 0
+    for block, block_tokens in blocks:
+        if current and current_tokens + block_tokens > max_tokens:
+            chunks.append('\n\n'.join(b for b, _ in current))
+            # Carry trailing blocks into the next window, as long as the new block still fits
+            overlap: typing.List[typing.Tuple[str, int]] = []
+            overlap_total = 0
+            for prev in reversed(current[1:]):
+                if overlap_total + prev[1] > overlap_tokens or overlap_total + prev[1] + block_tokens > max_tokens:
+                    break
+                overlap.insert(0, prev)
+                overlap_total += prev[1]
+            current, current_tokens = overlap, overlap_total
+        current.append((block, block_tokens))
+        current_tokens += block_tokens
+    if current:
+        chunks.append('\n\n'.join(b for b, _ in current))
+    return chunks
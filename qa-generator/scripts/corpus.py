@@ -0,0 +1,99 @@
+import re
+import sys
+import html
+import json
+import typing
+from pathlib import Path
+import xml.etree.ElementTree as ET
+
+from custom_config import CORPUS_FILE_SUFFIXES, CORPUS_WORDPRESS_POST_TYPES, CORPUS_WORDPRESS_SKIP_STATUSES
+
+Post = typing.Dict[str, typing.Any]
+
+BLOCK_COMMENT_PATTERN = re.compile(r'<!--\s*/?wp:.*?-->', re.DOTALL)
+HEADING_PATTERN = re.compile(r'<h([1-6])[^>]*>(.*?)</h\1\s*>', re.IGNORECASE | re.DOTALL)
+PRE_PATTERN = re.compile(r'<pre[^>]*>\s*(?:<code[^>]*>)?(.*?)(?:</code>\s*)?</pre\s*>', re.IGNORECASE | re.DOTALL)
+BREAK_PATTERN = re.compile(r'<br\s*/?>|</(?:p|div|li|blockquote|tr)\s*>', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+BLANK_LINES_PATTERN = re.compile(r'\n{3,}')
+
+def strip_tags(text: str) -> str:
+    return html.unescape(TAG_PATTERN.sub('', text))
+
+def wordpress_to_markdown(content: str) -> str:
+    """Turn post HTML into the markdown the parser expects: headings become #-headings and
+    <pre> blocks become code fences, so sections and snippets are found as in a README."""
+    code_blocks: typing.List[str] = []
+
+    def fence(match: re.Match) -> str:
+        code_blocks.append(html.unescape(TAG_PATTERN.sub('', match.group(1))).strip('\n'))
+        # A placeholder keeps the code out of the tag stripping below
+        return f"\n\n\0{len(code_blocks) - 1}\0\n\n"
+
+    text = BLOCK_COMMENT_PATTERN.sub('', content)
+    text = PRE_PATTERN.sub(fence, text)
+    text = HEADING_PATTERN.sub(lambda m: f"\n\n{'#' * int(m.group(1))} {strip_tags(m.group(2)).strip()}\n\n", text)
+    text = strip_tags(BREAK_PATTERN.sub('\n', text))
+    text = re.sub(r'\0(\d+)\0', lambda m: f"```\n{code_blocks[int(m.group(1))]}\n```", text)
+    return BLANK_LINES_PATTERN.sub('\n\n', text).strip() + '\n'
+
+def local_name(tag: str) -> str:
+    # WXR namespaces vary by export version (wp/1.0 .. 1.2), so elements are matched by local name
+    return tag.rsplit('}', 1)[-1]
+
+def read_wordpress_export(path: typing.Union[str, Path]) -> typing.Iterator[Post]:
+    """Stream posts out of a WordPress WXR export without loading the whole file."""
+    for _, element in ET.iterparse(str(path), events=("end",)):
+        if local_name(element.tag) != "item":
+            continue
+        fields = {local_name(child.tag): child for child in element}
+
+        def text_of(name: str) -> str:
+            child = fields.get(name)
+            return (child.text or "") if child is not None else ""
+
+        if text_of("post_type") in CORPUS_WORDPRESS_POST_TYPES and text_of("status") not in CORPUS_WORDPRESS_SKIP_STATUSES:
+            # "encoded" is content:encoded; excerpt:encoded comes after it and shares the local name
+            content = next((child.text or "" for child in element if child.tag.endswith("content/}encoded")), "")
+            title = text_of("title").strip()
+            body = wordpress_to_markdown(content)
+            yield {"post_id": text_of("post_id"), "content": f"# {title}\n\n{body}" if title else body}
+        element.clear()
+
+def read_directory(path: Path) -> typing.Iterator[Post]:
+    # The post ID is the file's path relative to the directory, without its suffix
+    for file_path in sorted(p for p in path.rglob('*') if p.is_file() and p.suffix.lower() in CORPUS_FILE_SUFFIXES):
+        yield {"post_id": file_path.relative_to(path).with_suffix('').as_posix(), "content": file_path.read_text(encoding='utf-8')}
+
+def read_jsonl(stream: typing.TextIO) -> typing.Iterator[Post]:
+    # A line that isn't a JSON object yields an {"error", "line"} record in its place, so one bad line doesn't end the run
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            post = json.loads(line)
+        except ValueError as e:
+            yield {"error": f"Invalid JSON: {e}", "line": line_number}
+            continue
+        if isinstance(post, dict):
+            yield post
+        else:
+            yield {"error": f"Expected a JSON object, got {type(post).__name__}", "line": line_number}
+
+def is_read_error(post: Post) -> bool:
+    return "error" in post and "content" not in post
+
+def read_corpus(path: str) -> typing.Iterator[Post]:
+    """Yield {post_id, content} posts from a directory of markdown files, a JSONL file
+    (or '-' for stdin), or a WordPress export (.xml), reading lazily in every case."""
+    if path == '-':
+        yield from read_jsonl(sys.stdin)
+        return
+    corpus_path = Path(path)
+    if corpus_path.is_dir():
+        yield from read_directory(corpus_path)
+    elif corpus_path.suffix.lower() in ('.xml', '.wxr'):
+        yield from read_wordpress_export(corpus_path)
+    else:
+        with open(corpus_path, 'r') as f:
+            yield from read_jsonl(f)
@@ -19,4 +19,181 @@ FINETUNE_OUTPUT_FILE = Path('./training_data/training_data.jsonl')
 N_RETRIES = 3  # Example constant for the number of retries
 
 MAX_CONTEXT_LINES = 20
+# Code blocks in one section whose context windows touch are asked about together: their shared
+# excerpt is sent once, as the prompt prefix, with a single call for all of their questions
+SNIPPET_GROUP_MAX_SNIPPETS = 4
 
+# Q/A generation server (generate_qa.py --serve)
+QA_SERVER_HOST = '127.0.0.1'
+QA_SERVER_PORT = 8765
+QA_SERVER_MAX_FINISHED_JOBS = 1000  # Finished jobs kept in memory for polling by job ID
+QA_SERVER_KEEPALIVE_SECONDS = 15  # Comment line sent on idle /jobs/<id>/events streams so proxies keep them open
+
+# Batch mode (generate_qa.py --batch)
+BATCH_MAX_POSTS_IN_FLIGHT = 8  # Posts read ahead and processed concurrently
+
+# Corpus mode (generate_qa.py --corpus): every post's calls share one fair queue
+CORPUS_MAX_POSTS_IN_FLIGHT = 32  # Posts read ahead; enough to keep the rate budget busy with small posts
+CORPUS_FILE_SUFFIXES = ('.md', '.markdown', '.txt')  # Files picked up from a corpus directory
+CORPUS_WORDPRESS_POST_TYPES = ('post', 'page')  # Items taken from a WordPress export
+CORPUS_WORDPRESS_SKIP_STATUSES = ('trash', 'auto-draft', 'inherit')
+
+# Sharded runs (--workers N with --corpus/--batch): posts are split across N processes by post-ID hash,
+# each with its own event loop and an even share of every backend's rate budget (or of its connections,
+# for a backend without a budget, such as a local server).
+# A backend with "api_key_envs": ["OPENAI_API_KEY", "OPENAI_API_KEY_2"] spreads the workers over
+# those keys instead, each key's budget split only between the workers using it
+SHARD_WORKERS = 1
+
+# OpenAI request budget. Set these to your account's limits; they are adjusted at runtime
+# from the x-ratelimit-* response headers.
+RATE_LIMIT_REQUESTS_PER_MINUTE = 500
+RATE_LIMIT_TOKENS_PER_MINUTE = 200000
+MAX_CONCURRENT_CALLS = 50  # Upper bound on simultaneous open requests
+OPENAI_MODEL = "gpt-4o-mini"
+OPENAI_MAX_TOKENS = 2048  # max_tokens per completion; counted against the token budget
+OPENAI_TEMPERATURE = 0.7
+
+# LLM backends by name. Type "openai" speaks the OpenAI chat completions API, so base_url can also
+# point at a local or self-hosted server (vLLM, llama.cpp, Ollama); set api_key_env to None if it needs no key
+LLM_BACKENDS = {
+    "openai": {
+        "type": "openai",
+        "base_url": None,  # None: $OPENAI_API_BASE, else https://api.openai.com/v1
+        "api_key_env": "OPENAI_API_KEY",
+        "max_concurrency": MAX_CONCURRENT_CALLS,
+        "requests_per_minute": RATE_LIMIT_REQUESTS_PER_MINUTE,
+        "tokens_per_minute": RATE_LIMIT_TOKENS_PER_MINUTE,
+        "timeout_seconds": 60,  # Per request, including reading the whole completion
+    },
+    # "local": {
+    #     "type": "openai",
+    #     "base_url": "http://127.0.0.1:8000/v1",
+    #     "api_key_env": None,
+    #     "max_concurrency": 8,
+    #     "json_mode": False,  # Many local servers reject response_format
+    # },
+}
+# (backend, model) per stage: question, answer, qa_pairs, snippet_question(s), snippet_answer(s).
+# Stages without an entry use "default"; override at run time with --route STAGE=BACKEND:MODEL
+LLM_STAGE_ROUTES = {
+    "default": ("openai", OPENAI_MODEL),
+    # "question": ("local", "llama-3.1-8b-instruct"),
+    # "answer": ("openai", "gpt-4o"),
+}
+
+# Rate limits, timeouts, dropped connections and 5xx responses are retried after a random wait of
+# up to min(LLM_RETRY_MAX_BACKOFF_SECONDS, 2^attempt) seconds, so failed calls don't retry in lockstep
+LLM_RETRY_ATTEMPTS = 5
+LLM_RETRY_MAX_BACKOFF_SECONDS = 30
+# Hedging: a request still running after the LLM_HEDGE_QUANTILE latency observed for its model gets a
+# duplicate, and whichever answers first wins. Costs an extra request per straggler, within the rate budget
+LLM_HEDGE_ENABLED = False
+LLM_HEDGE_QUANTILE = 0.95
+LLM_HEDGE_MIN_SAMPLES = 50  # Responses seen for a model before its requests are hedged
+# Once a post has run this long its remaining calls are cancelled and the pairs finished so far returned;
+# unfinished items are redone on the next run. Time during which any of its calls is queued behind other posts
+# (for its turn, the rate limiter or a connection) doesn't count. None for no deadline
+POST_DEADLINE_SECONDS = 300
+
+# On-disk cache of LLM responses, so re-processing an edited post only pays for changed sections
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_FILE = TEMP_DATA_DIR / 'response_cache.sqlite3'
+RESPONSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+RESPONSE_CACHE_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+# Append each Q/A pair to TEMP_DATA_DIR/qa_output.jsonl as it is generated and skip finished
+# sections/snippets (by post ID and content hash) when a post is processed again
+CHECKPOINT_ENABLED = True
+
+# Request all of a section's Q/A pairs in one JSON-structured call instead of separate
+# question and answer calls; falls back to the per-question path if the reply can't be parsed
+BATCHED_QA_ENABLED = False
+
+# Offline Batch API mode (generate_qa.py --batch-api)
+BATCH_API_DIR = TEMP_DATA_DIR / 'batch_api'  # Request files are written here before upload
+BATCH_API_BASE = None  # Defaults to the question backend's base_url; point at a local stand-in server for testing
+BATCH_API_MAX_REQUESTS_PER_FILE = 50000
+BATCH_API_POLL_SECONDS = 60
+
+# Sections longer than this are split into overlapping chunks at paragraph/code-fence boundaries;
+# each chunk gets its own questions. Token counts use tiktoken when available, else a local estimate.
+SECTION_MAX_TOKENS = 3000
+SECTION_OVERLAP_TOKENS = 200
+HEADLESS_SECTION_TITLE = 'Document'  # Section title used for content with no headings
+
+# Question planning, done locally before any call: each section and code block is scored by its
+# length, term density (inline code, identifiers, flags, numbers), novelty against the rest of the
+# post and heading depth, and the post's question budget goes to the highest scores first
+PLANNER_WORDS_PER_QUESTION = 30  # Post budget: one question per this many score-weighted words, and at least one per item worth asking about
+PLANNER_MAX_QUESTIONS_PER_POST = 60
+PLANNER_MAX_QUESTIONS_PER_SECTION = 8
+PLANNER_MIN_SECTION_WORDS = 12  # Shorter sections get no call at all
+PLANNER_MIN_SNIPPET_WORDS = 2   # Shorter code blocks stay as context only
+PLANNER_SNIPPET_SHARE = 0.4     # Share of a post's budget reserved for its code blocks
+PLANNER_TERM_WEIGHT = 1.0       # How much a fully term-dense item outweighs plain prose (1.0: double)
+PLANNER_TOP_LEVEL_WEIGHT = 0.8  # Title-level and headless sections are usually overviews
+PLANNER_RUN_QUESTION_BUDGET = None  # Questions for the whole run (e.g. a corpus); None for no limit
+
+# Drop generated questions that near-duplicate an earlier one (MinHash estimate of word-bigram
+# Jaccard similarity) before paying for their answers
+DEDUP_ENABLED = True
+DEDUP_THRESHOLD = 0.8
+DEDUP_ACROSS_POSTS = True  # Also compare against other posts handled by the same process
+
+# Validation rules for generated questions and answers (see validation.TextRules). Phrases match
+# case-insensitively; min_latin_ratio rejects text mostly outside the Latin script, and
+# max_question_overlap rejects answers whose words are nearly all taken from the question.
+QUESTION_VALIDATION_RULES = {
+    "invalid_phrases": [
+        "generate a question",
+        "what is the title",
+        "what is the section",
+        "Please provide me",
+    ],
+    "min_chars": 10,
+    "max_chars": 500,
+    "min_latin_ratio": 0.5,
+}
+ANSWER_VALIDATION_RULES = {
+    "invalid_phrases": [
+        "not included in the text",
+        "I couldn't find the answer",
+        "The answer is not present",
+        "Please provide the section",
+        "I need the content",
+        "Please provide me",
+        "As an AI language model",
+    ],
+    "min_chars": 20,
+    "min_latin_ratio": 0.5,
+    "max_question_overlap": 0.9,
+}
+# Every rejected question/answer is logged here with its reason
+REJECTION_LOG_ENABLED = True
+REJECTION_LOG_FILE = TEMP_DATA_DIR / 'rejected_qa.jsonl'
+
+# Failed question/answer calls are queued per post and retried on the post's next run
+RETRY_QUEUE_FILE = TEMP_DATA_DIR / 'retry_queue.sqlite3'
+RETRY_MAX_ATTEMPTS = 3  # Entries still failing after this many retries are dead-lettered
+
+# Every generated pair is also appended to this indexed store, for lookup by post/section/status and
+# streaming export (python qa_store.py --export, or export_training_data.py --input <store>)
+QA_STORE_ENABLED = True
+QA_STORE_FILE = TEMP_DATA_DIR / 'qa_store.sqlite3'
+
+# Metrics: every LLM call's queue wait, latency, tokens and retries, aggregated per stage, post and run
+CALL_METRICS_LOG_ENABLED = True
+CALL_METRICS_LOG_FILE = TEMP_DATA_DIR / 'call_metrics.jsonl'  # One line per call
+RUN_STATS_FILE = TEMP_DATA_DIR / 'run_stats.json'  # Aggregates, rewritten at the end of each command-line run
+OPENAI_PRICING = {  # USD per million prompt and completion tokens, for cost estimates
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+# Span trace written by --profile (Chrome trace format: open in ui.perfetto.dev or chrome://tracing)
+PROFILE_TRACE_FILE = TEMP_DATA_DIR / 'profile_trace.json'
+
+# Fine-tuning export (export_training_data.py)
+EXPORT_VALIDATION_FRACTION = 0.1  # Share of examples routed to the validation split, by hash
+EXPORT_SHARD_MAX_BYTES = 100 * 1024 * 1024  # Start a new shard file past this size
+EXPORT_MAX_EXAMPLE_TOKENS = 16000  # Longer examples are skipped
@@ -0,0 +1,93 @@
+import re
+import sys
+import json
+import array
+import hashlib
+import typing
+from collections import defaultdict
+
+WORD_PATTERN = re.compile(r'\w+')
+
+def shingles(text: str, size: int) -> typing.Set[str]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+class NearDuplicateIndex:
+    """MinHash/LSH index of texts that finds near-duplicates in roughly constant time per lookup.
+
+    Each text's MinHash signature is split into bands; only texts sharing a band bucket are
+    compared, and a candidate counts as a duplicate when the estimated Jaccard similarity of
+    their word shingles reaches ``threshold``.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 32, bands: int = 8, shingle_size: int = 2, seed: int = 1):
+        # A 64-byte blake2b digest holds 32 independent 16-bit hashes, one per permutation
+        if not 0 < num_perm <= 32:
+            raise ValueError("num_perm must be between 1 and 32")
+        self.num_perm = num_perm
+        self.key = seed.to_bytes(8, 'little')
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.buckets: typing.Dict[int, typing.List[int]] = defaultdict(list)
+        self.signatures: typing.List[bytes] = []
+        self.owners: typing.List[typing.Tuple[str, int]] = []
+
+    def signature(self, text: str) -> array.array:
+        # One digest per shingle gives its value under every permutation; the column-wise min runs in C
+        rows = [
+            array.array('H', hashlib.blake2b(shingle.encode('utf-8'), digest_size=2 * self.num_perm, key=self.key).digest())
+            for shingle in shingles(text, self.shingle_size)
+        ]
+        return array.array('H', map(min, zip(*rows)))
+
+    def band_keys(self, signature: array.array) -> typing.List[int]:
+        return [hash((band, signature[band * self.rows:(band + 1) * self.rows].tobytes())) for band in range(self.bands)]
+
+    def similar(self, signature: array.array, band_keys: typing.List[int]) -> typing.Iterator[int]:
+        seen = set()
+        for key in band_keys:
+            for entry in self.buckets.get(key, ()):
+                if entry in seen:
+                    continue
+                seen.add(entry)
+                other = array.array('H', self.signatures[entry])
+                matches = sum(1 for x, y in zip(signature, other) if x == y)
+                if matches >= self.threshold * len(signature):
+                    yield entry
+
+    def add(self, text: str, post_id: str = "", run: int = 0) -> bool:
+        """Index ``text`` unless it near-duplicates an earlier entry; returns True if it was new.
+
+        Matches from another post, or from the same run of this post, are duplicates. Matches
+        left by an earlier run of the same post are not, so regenerating a post is unaffected.
+        """
+        signature = self.signature(text)
+        band_keys = self.band_keys(signature)
+        for entry in self.similar(signature, band_keys):
+            other_post, other_run = self.owners[entry]
+            if other_post != post_id or other_run == run:
+                return False
+
+        entry = len(self.signatures)
+        self.signatures.append(signature.tobytes())
+        self.owners.append((post_id, run))
+        for key in band_keys:
+            self.buckets[key].append(entry)
+        return True
+
+def dedup_records(records: typing.Iterable[typing.Dict[str, typing.Any]], index: NearDuplicateIndex) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Yield Q/A records whose question is not a near-duplicate of one already yielded."""
+    for record in records:
+        if index.add(record['question'], str(record.get('post_id', "")), run=0):
+            yield record
+
+if __name__ == "__main__":
+    # Stream a Q/A JSONL file (e.g. from qa_store.py --export) from stdin to stdout without near-duplicates
+    from custom_config import DEDUP_THRESHOLD
+    index = NearDuplicateIndex(DEDUP_THRESHOLD)
+    for record in dedup_records((json.loads(line) for line in sys.stdin if line.strip()), index):
+        sys.stdout.write(json.dumps(record) + '\n')
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import hashlib
+import typing
+import argparse
+from pathlib import Path
+
+from custom_config import (
+    SYSTEM_PROMPT, FINETUNE_INPUT_FILE, FINETUNE_OUTPUT_FILE, OPENAI_MODEL,
+    EXPORT_VALIDATION_FRACTION, EXPORT_SHARD_MAX_BYTES, EXPORT_MAX_EXAMPLE_TOKENS,
+)
+from chunking import count_tokens
+from qa_store import QAStore
+from checkpoint import Checkpoint
+
+# Fixed per-message and per-conversation overhead of the chat format, in tokens
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_CONVERSATION = 3
+READ_BLOCK_SIZE = 1 << 16
+
+def iter_json_array(f: typing.TextIO) -> typing.Iterator[typing.Any]:
+    """Yield the elements of a top-level JSON array one at a time without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(READ_BLOCK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Expected a JSON array")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            more = f.read(READ_BLOCK_SIZE)
+            if not more:
+                raise
+            buffer += more
+            continue
+        yield item
+        buffer = buffer[end:]
+        if len(buffer) < READ_BLOCK_SIZE:
+            buffer += f.read(READ_BLOCK_SIZE)
+
+def read_records(path: typing.Union[str, Path]) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Stream Q/A records from a JSON array, a JSONL file or a Q/A store (.sqlite3).
+
+    Lines in the --batch output shape ({post_id, qa_pairs}) are flattened into their pairs.
+    From a store, only new and approved pairs are read. A checkpoint file (qa_output.jsonl) is
+    read through its index, so pairs left by interrupted attempts are skipped.
+    """
+    if Path(path).suffix in ('.sqlite3', '.db'):
+        yield from QAStore(path).iter_pairs()
+        return
+    if Path(path).with_suffix('.index.sqlite3').exists():
+        checkpoint = Checkpoint(path)
+        try:
+            yield from checkpoint.iter_done_pairs()
+        finally:
+            checkpoint.close()
+        return
+    with open(path, 'r') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        records = iter_json_array(f) if first == '[' else (json.loads(line) for line in f if line.strip())
+        for record in records:
+            if 'qa_pairs' in record:
+                for qa_pair in record['qa_pairs']:
+                    yield {"post_id": record.get('post_id'), **qa_pair}
+            else:
+                yield record
+
+def to_chat_example(record: typing.Dict[str, typing.Any], system_prompt: str = SYSTEM_PROMPT) -> typing.Dict[str, typing.Any]:
+    user_content = record['question']
+    if record.get('code_snippet'):
+        # Snippet questions refer to "the code", so the user turn carries it
+        user_content += f"\n\n```\n{record['code_snippet']}\n```"
+    return {"messages": [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+        {"role": "assistant", "content": record['answer']},
+    ]}
+
+def count_example_tokens(example: typing.Dict[str, typing.Any], model: str = OPENAI_MODEL) -> int:
+    return TOKENS_PER_CONVERSATION + sum(
+        TOKENS_PER_MESSAGE + count_tokens(message['content'], model) for message in example['messages']
+    )
+
+def split_for(record: typing.Dict[str, typing.Any], validation_fraction: float) -> str:
+    # Hashing the question keeps a record in the same split across re-exports
+    key = f"{record.get('post_id', '')}\0{record['question']}".encode('utf-8')
+    bucket = int.from_bytes(hashlib.sha256(key).digest()[:8], 'big') / 2 ** 64
+    return "validation" if bucket < validation_fraction else "train"
+
+class ShardedWriter:
+    """Write JSONL lines to <stem>.<split>-NNNNN.jsonl files of at most max_bytes each."""
+
+    def __init__(self, output_file: Path, split: str, max_bytes: int):
+        self.output_file = Path(output_file)
+        self.split = split
+        self.max_bytes = max_bytes
+        self.shards: typing.List[Path] = []
+        self.out: typing.Optional[typing.BinaryIO] = None
+        self.written = 0
+
+    def write(self, line: bytes):
+        if self.out is None or (self.written and self.written + len(line) > self.max_bytes):
+            self.close()
+            os.makedirs(self.output_file.parent, exist_ok=True)
+            self.shards.append(self.output_file.with_name(f"{self.output_file.stem}.{self.split}-{len(self.shards):05d}.jsonl"))
+            self.out = open(self.shards[-1], 'wb')
+            self.written = 0
+        self.out.write(line)
+        self.written += len(line)
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+def export_training_data(
+    input_file: typing.Union[str, Path] = FINETUNE_INPUT_FILE,
+    output_file: typing.Union[str, Path] = FINETUNE_OUTPUT_FILE,
+    validation_fraction: float = EXPORT_VALIDATION_FRACTION,
+    shard_max_bytes: int = EXPORT_SHARD_MAX_BYTES,
+    max_example_tokens: int = EXPORT_MAX_EXAMPLE_TOKENS,
+) -> typing.Dict[str, typing.Any]:
+    writers = {split: ShardedWriter(Path(output_file), split, shard_max_bytes) for split in ("train", "validation")}
+    stats = {split: {"examples": 0, "tokens": 0, "max_tokens": 0} for split in writers}
+    stats["skipped_too_long"] = 0
+    stats["skipped_invalid"] = 0
+    try:
+        for record in read_records(input_file):
+            if not record.get('question') or not record.get('answer'):
+                stats["skipped_invalid"] += 1
+                continue
+            example = to_chat_example(record)
+            tokens = count_example_tokens(example)
+            if tokens > max_example_tokens:
+                stats["skipped_too_long"] += 1
+                continue
+            split = split_for(record, validation_fraction)
+            writers[split].write((json.dumps(example) + '\n').encode('utf-8'))
+            stats[split]["examples"] += 1
+            stats[split]["tokens"] += tokens
+            stats[split]["max_tokens"] = max(stats[split]["max_tokens"], tokens)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    for split, writer in writers.items():
+        stats[split]["shards"] = [str(path) for path in writer.shards]
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export generated Q/A as chat-format fine-tuning JSONL.")
+    parser.add_argument('--input', type=str, default=str(FINETUNE_INPUT_FILE), help='Q/A records as a JSON array (the finalized output), JSONL (e.g. --batch results) or a Q/A store (temp_data/qa_store.sqlite3)')
+    parser.add_argument('--output', type=str, default=str(FINETUNE_OUTPUT_FILE), help='Base path for the train/validation shards')
+    parser.add_argument('--validation-fraction', type=float, default=EXPORT_VALIDATION_FRACTION)
+    parser.add_argument('--shard-max-bytes', type=int, default=EXPORT_SHARD_MAX_BYTES)
+    parser.add_argument('--max-example-tokens', type=int, default=EXPORT_MAX_EXAMPLE_TOKENS)
+    args = parser.parse_args()
+
+    stats = export_training_data(args.input, args.output, args.validation_fraction, args.shard_max_bytes, args.max_example_tokens)
+    json.dump(stats, sys.stdout, indent=2)
+    print()
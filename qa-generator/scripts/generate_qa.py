@@ -1,296 +1,1507 @@
 import os
 import json
+import sys
+import time
+import uuid
+import urllib.parse
+import logging
+import queue
 import asyncio
-from collections import defaultdict
+import itertools
+import threading
+import multiprocessing
+import contextlib
+import contextvars
+import functools
+from collections import defaultdict, OrderedDict
 from tqdm.asyncio import tqdm
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, RetryError
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type, RetryError
 import typing
-import openai
+import aiohttp
 import argparse
+from pathlib import Path
 
-from custom_config import TEMP_DATA_DIR, MAX_CONTEXT_LINES
-
-# Fetch the OpenAI API key from the environment
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from custom_config import (
+    TEMP_DATA_DIR, MAX_CONTEXT_LINES, SNIPPET_GROUP_MAX_SNIPPETS,
+    QA_SERVER_HOST, QA_SERVER_PORT, QA_SERVER_MAX_FINISHED_JOBS, QA_SERVER_KEEPALIVE_SECONDS,
+    BATCH_MAX_POSTS_IN_FLIGHT, CORPUS_MAX_POSTS_IN_FLIGHT, SHARD_WORKERS,
+    LLM_BACKENDS, LLM_STAGE_ROUTES, LLM_RETRY_ATTEMPTS, LLM_RETRY_MAX_BACKOFF_SECONDS,
+    LLM_HEDGE_ENABLED, LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_SAMPLES, POST_DEADLINE_SECONDS,
+    OPENAI_MAX_TOKENS, OPENAI_TEMPERATURE,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_FILE, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_AGE_SECONDS,
+    CHECKPOINT_ENABLED, BATCHED_QA_ENABLED, OPENAI_MODEL,
+    BATCH_API_DIR, BATCH_API_BASE, BATCH_API_MAX_REQUESTS_PER_FILE, BATCH_API_POLL_SECONDS,
+    SECTION_MAX_TOKENS, SECTION_OVERLAP_TOKENS, HEADLESS_SECTION_TITLE, PLANNER_RUN_QUESTION_BUDGET,
+    DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_ACROSS_POSTS,
+    QUESTION_VALIDATION_RULES, ANSWER_VALIDATION_RULES, REJECTION_LOG_ENABLED, REJECTION_LOG_FILE,
+    RETRY_QUEUE_FILE, RETRY_MAX_ATTEMPTS, QA_STORE_ENABLED, QA_STORE_FILE,
+    CALL_METRICS_LOG_ENABLED, CALL_METRICS_LOG_FILE, RUN_STATS_FILE, PROFILE_TRACE_FILE, OPENAI_PRICING,
+)
+from rate_limiter import estimate_prompt_tokens
+from response_cache import ResponseCache
+from checkpoint import Checkpoint, item_hash
+from markdown_parser import parse_markdown, CodeBlock
+from chunking import chunk_text
+from dedup import NearDuplicateIndex
+from validation import TextRules
+from retry_queue import RetryQueue
+from qa_store import QAStore
+from planner import QuestionBudget, QuestionPlan, plan_questions
+from scheduler import PostClock, run_with_deadline
+from metrics import Metrics, CallRecord, LatencyWindow
+from tracing import Tracer
+from llm_backends import (
+    LLMBackend, OpenAICompatibleBackend, Completion, BackendError, BackendTransientError, BackendRateLimited, build_backend,
+)
+from corpus import Post, is_read_error, read_corpus, read_jsonl
+from sharding import shard_of, shard_backend_configs
+from batch_api import BatchBackend, OpenAIBatchBackend, write_request_files, run_batches
 
-if openai.api_key is None:
-    raise ValueError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+# Logs go to stderr; stdout carries only the JSON results
+logger = logging.getLogger("generate_qa")
 
 class RateLimitError(Exception):
     pass
 
-# Create a semaphore to limit the number of concurrent API calls
-MAX_CALLS_PER_SECOND = 5  # Set your desired maximum calls per second
-semaphore = asyncio.Semaphore(MAX_CALLS_PER_SECOND)
+class TransientError(Exception):
+    pass
+
+class StageRoute(typing.NamedTuple):
+    backend: LLMBackend
+    model: str
+
+# Backends in use and the route of each stage; every backend has its own connection cap and rate limiter
+backends: typing.Dict[str, LLMBackend] = {}
+stage_routes: typing.Dict[str, StageRoute] = {}
+
+def configure_backends(backend_configs: typing.Dict[str, typing.Dict[str, typing.Any]], routes: typing.Dict[str, typing.Tuple[str, str]]):
+    # Only backends some stage routes to are built, so unused ones need no API key
+    built: typing.Dict[str, LLMBackend] = {}
+    for backend_name, _ in routes.values():
+        if backend_name not in built:
+            if backend_name not in backend_configs:
+                raise ValueError(f"Stage route uses unknown backend {backend_name!r}")
+            built[backend_name] = build_backend(backend_name, backend_configs[backend_name])
+    backends.clear()
+    backends.update(built)
+    stage_routes.clear()
+    stage_routes.update({stage: StageRoute(built[backend_name], model) for stage, (backend_name, model) in routes.items()})
+
+def route_for(stage: str) -> StageRoute:
+    return stage_routes.get(stage) or stage_routes["default"]
+
+configure_backends(LLM_BACKENDS, LLM_STAGE_ROUTES)
+
+# Ask for all of a section's Q/A pairs in one JSON call (--batched-qa)
+batched_qa = BATCHED_QA_ENABLED
+
+# Near-duplicate questions are dropped before they are answered, within a post and across posts
+dedup_index: typing.Optional[NearDuplicateIndex] = NearDuplicateIndex(DEDUP_THRESHOLD) if DEDUP_ENABLED else None
+dedup_runs = itertools.count()
+
+# Set to None (--no-cache) to always call the API
+response_cache: typing.Optional[ResponseCache] = (
+    ResponseCache(RESPONSE_CACHE_FILE, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_AGE_SECONDS)
+    if RESPONSE_CACHE_ENABLED else None
+)
+
+# Calls that failed outright are kept here, with their text, until a retry succeeds
+retry_queue = RetryQueue(RETRY_QUEUE_FILE, RETRY_MAX_ATTEMPTS)
+
+# Set to None to keep generated pairs out of the indexed Q/A store
+qa_store: typing.Optional[QAStore] = QAStore(QA_STORE_FILE) if QA_STORE_ENABLED else None
+
+# Questions left for this run, shared by every post it processes (None: no run-wide limit)
+question_budget: typing.Optional[QuestionBudget] = QuestionBudget(PLANNER_RUN_QUESTION_BUDGET) if PLANNER_RUN_QUESTION_BUDGET is not None else None
+
+metrics = Metrics(OPENAI_PRICING, CALL_METRICS_LOG_FILE if CALL_METRICS_LOG_ENABLED else None)
+
+def format_seconds(value: typing.Optional[float]) -> str:
+    # Means are None when every call was served from the cache
+    return f"{value}s" if value is not None else "n/a"
+
+# Set by --profile to time every post, item, call and wait; spans cost nothing while it is None
+tracer: typing.Optional[Tracer] = None
+NO_SPAN = contextlib.nullcontext()
+
+def trace_span(name: str, category: str, **args: typing.Any) -> typing.ContextManager:
+    return tracer.span(name, category, **args) if tracer is not None else NO_SPAN
+
+# Recent response times by (backend, model), which set the point where a slow request gets hedged
+response_latencies: typing.DefaultDict[typing.Tuple[str, str], LatencyWindow] = defaultdict(LatencyWindow)
+
+# The pooled HTTP session that LLM calls on this event loop share
+http_session: contextvars.ContextVar[typing.Optional[aiohttp.ClientSession]] = contextvars.ContextVar('http_session', default=None)
+
+@contextlib.asynccontextmanager
+async def shared_session():
+    # One connection pool for every backend; each backend's admission slots cap its own share of it
+    connector = aiohttp.TCPConnector(limit=sum(backend.max_concurrency for backend in backends.values()))
+    async with aiohttp.ClientSession(connector=connector) as session:
+        token = http_session.set(session)
+        try:
+            yield session
+        finally:
+            http_session.reset(token)
+
+# Losing requests of hedged pairs, still running so their tokens can be counted
+hedge_stragglers: typing.Set[asyncio.Future] = set()
+
+def record_straggler(backend: LLMBackend, post_id: str, stage: str, model: str, task: asyncio.Future):
+    hedge_stragglers.discard(task)
+    backend.admission.release(post_id)
+    if task.cancelled() or task.exception() is not None:
+        return
+    completion = task.result()
+    straggler = CallRecord(stage, model)
+    straggler.prompt_tokens = completion.prompt_tokens
+    straggler.completion_tokens = completion.completion_tokens
+    metrics.record_usage(post_id, straggler)
+
+async def send_request(route: StageRoute, prompt: str, json_mode: bool, record: CallRecord) -> Completion:
+    """Send one request, plus a hedge if it outlasts the usual latency and there is capacity to spare.
+
+    The first successful response wins; an error only counts once neither request can succeed.
+    The losing request is billed all the same, so it is left to finish (within the backend's
+    timeout, holding the hedge's connection slot) and its tokens are added to the metrics.
+    """
+    backend = route.backend
+    latencies = response_latencies[(backend.name, route.model)]
+    started: typing.Dict[asyncio.Future, float] = {}
+
+    def send() -> asyncio.Future:
+        task = asyncio.ensure_future(backend.complete(http_session.get(), route.model, prompt, OPENAI_MAX_TOKENS, OPENAI_TEMPERATURE, json_mode))
+        started[task] = time.monotonic()
+        return task
+
+    hedge_after = latencies.quantile(LLM_HEDGE_QUANTILE) if LLM_HEDGE_ENABLED and len(latencies) >= LLM_HEDGE_MIN_SAMPLES else None
+    primary = send()
+    hedge_slot = False
+    winner: typing.Optional[asyncio.Future] = None
+    try:
+        if hedge_after is not None:
+            await asyncio.wait([primary], timeout=hedge_after)
+            # A hedge never waits: it needs a free connection and room in the rate budget right now
+            if not primary.done() and backend.admission.try_acquire(current_post_id.get()):
+                if backend.rate_limiter is None or backend.rate_limiter.try_acquire(estimate_prompt_tokens(prompt) + OPENAI_MAX_TOKENS):
+                    hedge_slot = True
+                else:
+                    backend.admission.release(current_post_id.get())
+            if hedge_slot:
+                record.hedged = True
+                send()
+        pending = set(started)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    latencies.observe(time.monotonic() - started[task])
+                    winner = task
+                    return task.result()
+        return primary.result()  # Every request failed; raise the first one's error
+    finally:
+        losers = [task for task in started if task is not winner]
+        if winner is not None and hedge_slot:
+            for task in losers:
+                hedge_stragglers.add(task)
+                task.add_done_callback(functools.partial(record_straggler, backend, current_post_id.get(), record.stage, record.model))
+        else:
+            for task in losers:
+                task.cancel()
+            if hedge_slot:
+                backend.admission.release(current_post_id.get())
+
+async def backoff_sleep(seconds: float):
+    with trace_span("backoff", "backoff", seconds=round(seconds, 3)):
+        await asyncio.sleep(seconds)
 
 @retry(
-    stop=stop_after_attempt(5),
-    wait=wait_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type(RateLimitError)
+    stop=stop_after_attempt(LLM_RETRY_ATTEMPTS),
+    wait=wait_random_exponential(multiplier=1, max=LLM_RETRY_MAX_BACKOFF_SECONDS),
+    retry=retry_if_exception_type((RateLimitError, TransientError)),
+    sleep=backoff_sleep,
 )
-async def make_openai_call(prompt: str, model: str = "gpt-4o-mini") -> typing.Optional[str]:
-    async with semaphore:  # Acquire the semaphore to ensure rate limiting
+async def request_completion(prompt: str, route: StageRoute, json_mode: bool = False, record: typing.Optional[CallRecord] = None) -> typing.Optional[str]:
+    backend, limiter = route.backend, route.backend.rate_limiter
+    record = record or CallRecord("completion", route.model)
+    record.attempts += 1
+    clock = current_post_clock.get()
+    post_id = current_post_id.get()
+    queued = time.monotonic()
+    with clock.waiting() if clock is not None else contextlib.nullcontext():
+        # Calls get their connection slots in fair order across posts, and keep them through the rate limiter
+        with trace_span(backend.name, "admission"):
+            await backend.admission.acquire(post_id)
+        if limiter is not None:
+            try:
+                with trace_span(backend.name, "rate_limit"):
+                    await limiter.acquire(estimate_prompt_tokens(prompt) + OPENAI_MAX_TOKENS)
+            except BaseException:
+                backend.admission.release(post_id)
+                raise
+    sent = time.monotonic()
+    record.queue_wait += sent - queued
+    try:
+        with trace_span(route.model, "network", attempt=record.attempts):
+            completion = await send_request(route, prompt, json_mode, record)
+    except BackendRateLimited as e:
+        if limiter is not None:
+            limiter.pause(limiter.backoff_seconds(e.headers))
+        logger.warning("Rate limit error from %s: %s. Retrying...", backend.name, e)
+        raise RateLimitError()
+    except BackendTransientError as e:
+        logger.warning("%s. Retrying...", e)
+        raise TransientError()
+    except BackendError as e:
+        logger.error("LLM API error: %s", e)
+        record.error = type(e).__name__
+        return None
+    finally:
+        record.latency = time.monotonic() - sent
+        backend.admission.release(post_id)
+    if limiter is not None:
+        limiter.update_from_headers(completion.headers)
+    record.prompt_tokens += completion.prompt_tokens
+    record.completion_tokens += completion.completion_tokens
+    return completion.text
+
+async def make_openai_call(prompt: str, model: typing.Optional[str] = None, variant: int = 0, json_mode: bool = False, stage: str = "completion") -> typing.Optional[str]:
+    route = route_for(stage)
+    if model is not None:
+        route = route._replace(model=model)
+    record = CallRecord(stage, route.model)
+    with trace_span(stage, "call", model=route.model):
         try:
-            response = await openai.ChatCompletion.acreate(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2048,
-                n=1,
-                temperature=0.7,
-            )
-            return response.choices[0].message['content']
-        except openai.error.RateLimitError as e:
-            print(f"Rate limit error: {e}. Retrying...")
-            raise RateLimitError()
-        except openai.error.OpenAIError as e:
-            print(f"OpenAI API error: {e}")
-            return None
+            key = None
+            if response_cache is not None:
+                with trace_span("get", "cache"):
+                    key = ResponseCache.make_key(
+                        route.model, prompt, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS, variant,
+                        route.backend.endpoint, json_mode,
+                    )
+                    cached = response_cache.get(key)
+                if cached is not None:
+                    record.cached = True
+                    return cached
 
-def extract_code_and_context(content: str, context_window: int = 2, max_context_lines: int = 10) -> typing.List[typing.Tuple[str, str, int, int, typing.Optional[str]]]:
-    lines = content.splitlines()
-    code_snippets = []
-    current_section = None
+            try:
+                response = await request_completion(prompt, route, json_mode, record)
+            except RetryError as e:
+                # Still failing after every attempt; the caller queues the item for a later retry
+                record.error = type(e.last_attempt.exception()).__name__
+                logger.error("Retries exhausted (%s)", record.error)
+                return None
+            except asyncio.CancelledError:
+                record.error = "Cancelled"
+                raise
+            if response is not None and key is not None:
+                with trace_span("put", "cache"):
+                    response_cache.put(key, response)
+            return response
+        finally:
+            metrics.record_call(current_post_id.get(), record)
 
-    for i, line in enumerate(lines):
-        if line.startswith('#'):
-            current_section = line.strip('#').strip()
+Snippet = typing.Tuple[str, str, int, int, typing.Optional[str]]
 
-        if line.strip().startswith('```'):
-            snippet_lines = []
-            j = i + 1
-            while j < len(lines) and not lines[j].strip().startswith('```'):
-                snippet_lines.append(lines[j])
-                j += 1
-            snippet = '\n'.join(snippet_lines)
+class SnippetGroup(typing.NamedTuple):
+    section: typing.Optional[str]
+    # The context shared by the group's code blocks, each labelled "[Snippet N]" where it starts
+    excerpt: str
+    # (code, context) of each block, in label order
+    snippets: typing.List[typing.Tuple[str, str]]
 
-            context_start = max(0, i - max_context_lines)
-            context_end = min(len(lines), j + context_window + 1)
-            context = '\n'.join(lines[context_start:context_end])
-            code_snippets.append((snippet, context, i, j, current_section))
+def parse_post(
+    content: str,
+    context_window: int = 2,
+    max_context_lines: int = 10,
+    max_section_tokens: typing.Optional[int] = None,
+    overlap_tokens: int = 0,
+) -> typing.Tuple[typing.List[typing.Tuple[str, str]], typing.List[CodeBlock], typing.Dict[str, int]]:
+    # One pass over the content; repeated headings share one section, as before
+    section_spans = defaultdict(list)
+    heading_levels: typing.Dict[str, int] = {}
+    code_blocks = []
+    for item in parse_markdown(content, context_before=max_context_lines, context_after=context_window):
+        if isinstance(item, CodeBlock):
+            code_blocks.append(item)
+        elif item.title:
+            section_spans[item.title].append(content[item.start:item.end])
+            heading_levels.setdefault(item.title, item.level)
 
-    return code_snippets
+    if not section_spans and content.strip():
+        # Text extracted from PDFs, DOCX and spreadsheets has no headings at all
+        section_spans[HEADLESS_SECTION_TITLE].append(content)
+
+    # Oversized sections become several overlapping chunks that share the section title
+    sections = []
+    for section_title, spans in section_spans.items():
+        raw_text = ''.join(spans)
+        chunks = chunk_text(raw_text, max_section_tokens, overlap_tokens, OPENAI_MODEL) if max_section_tokens else [raw_text]
+        for chunk in chunks:
+            text = ' '.join(line.strip() for line in chunk.splitlines()).strip()
+            if text:
+                sections.append((section_title, text))
+    return sections, code_blocks, heading_levels
+
+def extract_sections_and_code(
+    content: str,
+    context_window: int = 2,
+    max_context_lines: int = 10,
+    max_section_tokens: typing.Optional[int] = None,
+    overlap_tokens: int = 0,
+) -> typing.Tuple[typing.List[typing.Tuple[str, str]], typing.List[Snippet]]:
+    sections, code_blocks, _ = parse_post(content, context_window, max_context_lines, max_section_tokens, overlap_tokens)
+    code_snippets = [
+        (content[block.start:block.end], content[block.context_start:block.context_end], block.start_line, block.end_line, block.section)
+        for block in code_blocks
+    ]
+    return sections, code_snippets
+
+def group_snippets(content: str, code_blocks: typing.List[CodeBlock], max_snippets: int = SNIPPET_GROUP_MAX_SNIPPETS) -> typing.List[SnippetGroup]:
+    """Merge code blocks of one section whose context windows overlap or touch into groups.
+
+    A group's excerpt spans all of its blocks' context once, so neither the code nor the prose
+    around it is repeated, and each block is referred to by the label inserted above its fence.
+    """
+    runs: typing.List[typing.List[CodeBlock]] = []
+    for block in code_blocks:
+        run = runs[-1] if runs else None
+        if run and len(run) < max_snippets and block.section == run[-1].section and block.context_start <= run[-1].context_end:
+            run.append(block)
+        else:
+            runs.append([block])
+
+    groups = []
+    for run in runs:
+        start, end = run[0].context_start, max(block.context_end for block in run)
+        parts, position = [], start
+        for label, block in enumerate(run, 1):
+            # The opening fence line ends just before the code starts
+            fence_start = content.rfind('\n', 0, max(block.start - 1, 0)) + 1
+            fence_start = max(fence_start, position)
+            parts.append(content[position:fence_start])
+            parts.append(f"[Snippet {label}]\n")
+            position = fence_start
+        parts.append(content[position:end])
+        groups.append(SnippetGroup(
+            run[0].section, ''.join(parts),
+            [(content[block.start:block.end], content[block.context_start:block.context_end]) for block in run],
+        ))
+    return groups
+
+def extract_code_and_context(content: str, context_window: int = 2, max_context_lines: int = 10) -> typing.List[Snippet]:
+    return extract_sections_and_code(content, context_window, max_context_lines)[1]
 
 def extract_sections(content: str) -> typing.Dict[str, str]:
-    sections = defaultdict(str)
-    lines = content.splitlines()
-    current_section = None
+    return dict(extract_sections_and_code(content, context_window=0, max_context_lines=0)[0])
+
+# Where the current post's work runs, so rejections and other records can be attributed to it
+current_post_id: contextvars.ContextVar[str] = contextvars.ContextVar('current_post_id', default="")
+# The checkpoint key of the section or snippet being processed, so failed calls can be retried against it
+current_item_key: contextvars.ContextVar[str] = contextvars.ContextVar('current_item_key', default="")
+# The current post's deadline clock, paused while any of the post's calls waits for its turn
+current_post_clock: contextvars.ContextVar[typing.Optional[PostClock]] = contextvars.ContextVar('current_post_clock', default=None)
 
-    for line in lines:
-        if line.startswith('#'):
-            current_section = line.strip('#').strip()
-        elif current_section:
-            sections[current_section] += line.strip() + ' '
+question_rules = TextRules(**QUESTION_VALIDATION_RULES)
+answer_rules = TextRules(**ANSWER_VALIDATION_RULES)
+rejection_log: typing.Optional[typing.TextIO] = None
 
-    sections = {k: v.strip() for k, v in sections.items() if v.strip()}
-    return sections
+def record_rejection(kind: str, reason: str, text: typing.Optional[str]):
+    global rejection_log
+    metrics.record_rejection(current_post_id.get(), kind, reason)
+    if not REJECTION_LOG_ENABLED:
+        return
+    if rejection_log is None:
+        os.makedirs(REJECTION_LOG_FILE.parent, exist_ok=True)
+        rejection_log = open(REJECTION_LOG_FILE, 'a', buffering=1)
+    rejection_log.write(json.dumps({"post_id": current_post_id.get(), "type": kind, "reason": reason, "text": text}) + '\n')
 
 def is_question_valid(question: typing.Optional[str]) -> bool:
-    if question is None:
-        return False
-    invalid_indicators = [
-        "generate a question",
-        "what is the title",
-        "what is the section",
-        "Please provide me",
-    ]
-    return not any(indicator in question.lower() for indicator in invalid_indicators)
+    with trace_span("question", "validate"):
+        reason = question_rules.rejection(question)
+    if reason:
+        record_rejection("question", reason, question)
+    return reason is None
 
-def is_answer_valid(answer: typing.Optional[str]) -> bool:
-    if answer is None:
-        return False
-    missing_indicators = [
-        "not included in the text", 
-        "I couldn't find the answer", 
-        "The answer is not present",
-        "Please provide the section",
-        "I need the content",
-        "Please provide me",
-    ]
-    return not any(indicator in answer.lower() for indicator in missing_indicators)
+def is_answer_valid(answer: typing.Optional[str], question: typing.Optional[str] = None) -> bool:
+    with trace_span("answer", "validate"):
+        reason = answer_rules.rejection(answer, question)
+    if reason:
+        record_rejection("answer", reason, answer)
+    return reason is None
 
-async def generate_question(section_title: str, text: str) -> typing.Optional[str]:
-    question_prompt = (
+def question_prompt(section_title: str, text: str) -> str:
+    return (
         f"Create a single question based solely on the content of the following README section titled '{section_title}':\n\n"
         f"{text}\n\n"
         f"Output only the question."
     )
-    return await make_openai_call(question_prompt)
-
-async def generate_snippet_question(section_title: str, snippet: str, text: str) -> typing.Optional[str]:
-    question_prompt = (
-        "Given the following code snippet and its context, generate a question that would help someone "
-        "understand the purpose, functionality, or structure of the code. The question should be something "
-        "that a developer might ask when trying to learn or understand how to implement this code. "
-        "Consider what the snippet is doing and how it might be used in a real-world scenario.\n\n"
-        "Context:\n"
-        f"{text}\n\n"
-        "Code Snippet:\n"
-        f"{snippet}\n\n"
-        "Question:"
+
+# Snippet prompts all open with the same excerpt, so calls about one group share a prompt prefix
+# that providers with prompt caching (and local servers with prefix caching) only process once
+def snippet_excerpt_prefix(excerpt: str) -> str:
+    return (
+        "The following excerpt from a README contains code snippets, each marked by a [Snippet N] label "
+        "on the line before it.\n\n"
+        "Excerpt:\n"
+        f"{excerpt}\n\n"
     )
-    return await make_openai_call(question_prompt)
 
-async def generate_answer(question: str, section_title: str, text: str) -> typing.Optional[str]:
-    answer_prompt = (
+SNIPPET_QUESTION_GUIDANCE = (
+    "that would help someone understand the purpose, functionality, or structure of the code. The question should be "
+    "something that a developer might ask when trying to learn or understand how to implement this code. "
+    "Consider what the snippet is doing and how it might be used in a real-world scenario."
+)
+
+def snippet_question_prompt(excerpt: str, label: int) -> str:
+    return (
+        snippet_excerpt_prefix(excerpt)
+        + f"Generate a question about [Snippet {label}] {SNIPPET_QUESTION_GUIDANCE} Output only the question."
+    )
+
+def snippet_questions_prompt(excerpt: str, count: int) -> str:
+    return (
+        snippet_excerpt_prefix(excerpt)
+        + f"For each of the {count} snippets, generate a question {SNIPPET_QUESTION_GUIDANCE}\n\n"
+        f'Respond with JSON only, in the form {{"questions": ["...", "..."]}}, with exactly {count} questions in snippet order.'
+    )
+
+def answer_prompt(question: str, section_title: str, text: str) -> str:
+    return (
         f"Based on the following section from a README file titled '{section_title}', provide a detailed answer to the question:\n\n"
         f"{text}\n\n"
         f"Question: {question}\n"
         f"Just output the answer directly."
     )
-    return await make_openai_call(answer_prompt)
-
-async def generate_snippet_answer(section_title: str, snippet: str, context: str, question: str) -> typing.Optional[str]:
-    answer_prompt = (
-        "Given the following context, code snippet, and question, generate an answer that directly addresses "
-        "the question. The answer should explain the code snippet's role, its output, or how it works "
-        "within the context provided. Focus on clarity and detail, as if explaining to a peer who is new to this concept.\n\n"
-        "Context:\n"
-        f"{context}\n\n"
-        "Code Snippet:\n"
-        f"{snippet}\n\n"
-        "Question:\n"
+
+def snippet_answer_prompt(excerpt: str, label: int, question: str) -> str:
+    return (
+        snippet_excerpt_prefix(excerpt)
+        + f"Question about [Snippet {label}]:\n"
         f"{question}\n\n"
+        "Generate an answer that directly addresses the question. The answer should explain the snippet's role, "
+        "its output, or how it works within the excerpt. Focus on clarity and detail, as if explaining to a peer "
+        "who is new to this concept.\n\n"
         "Answer:"
     )
-    return await make_openai_call(answer_prompt)
-
-def estimate_question_count(text: str) -> int:
-    word_count = len(text.split())
-    if word_count < 50:
-        return 1
-    elif word_count < 150:
-        return 2
-    else:
-        return 3
 
-async def process_section(section_title: str, text: str, num_questions: int) -> typing.List[typing.Dict[str, str]]:
-    qa_pairs = []
+async def generate_question(section_title: str, text: str, variant: int = 0) -> typing.Optional[str]:
+    return await make_openai_call(question_prompt(section_title, text), variant=variant, stage="question")
+
+async def generate_snippet_question(excerpt: str, label: int) -> typing.Optional[str]:
+    return await make_openai_call(snippet_question_prompt(excerpt, label), stage="snippet_question")
+
+async def generate_snippet_questions(excerpt: str, count: int) -> typing.Optional[str]:
+    return await make_openai_call(snippet_questions_prompt(excerpt, count), json_mode=True, stage="snippet_questions")
+
+async def generate_answer(question: str, section_title: str, text: str) -> typing.Optional[str]:
+    return await make_openai_call(answer_prompt(question, section_title, text), stage="answer")
 
-    for _ in range(num_questions):
-        question = await generate_question(section_title, text)
-        if question and is_question_valid(question):
-            answer = await generate_answer(question, section_title, text)
-            if answer and is_answer_valid(answer):
-                qa_pairs.append({
-                    "section_title": section_title,
-                    "question": question,
-                    "answer": answer
-                })
-    
+def snippet_answers_prompt(excerpt: str, questions: typing.List[typing.Tuple[int, str]]) -> str:
+    listed = '\n'.join(f"{number}. About [Snippet {label}]: {question}" for number, (label, question) in enumerate(questions, 1))
+    return (
+        snippet_excerpt_prefix(excerpt)
+        + f"Questions:\n{listed}\n\n"
+        "Generate an answer to each question that directly addresses it. Each answer should explain the snippet's role, "
+        "its output, or how it works within the excerpt. Focus on clarity and detail, as if explaining to a peer "
+        "who is new to this concept.\n\n"
+        f'Respond with JSON only, in the form {{"answers": ["...", "..."]}}, with exactly {len(questions)} answers in question order.'
+    )
+
+async def generate_snippet_answer(excerpt: str, label: int, question: str) -> typing.Optional[str]:
+    return await make_openai_call(snippet_answer_prompt(excerpt, label, question), stage="snippet_answer")
+
+async def generate_snippet_answers(excerpt: str, questions: typing.List[typing.Tuple[int, str]]) -> typing.Optional[str]:
+    return await make_openai_call(snippet_answers_prompt(excerpt, questions), json_mode=True, stage="snippet_answers")
+
+async def generate_question_answer_pairs(section_title: str, text: str, num_pairs: int) -> typing.Optional[typing.List[typing.Dict[str, str]]]:
+    pairs_prompt = (
+        f"Based solely on the content of the following README section titled '{section_title}', "
+        f"write {num_pairs} distinct questions, each with a detailed answer taken from the section:\n\n"
+        f"{text}\n\n"
+        'Respond with JSON only, in the form {"pairs": [{"question": "...", "answer": "..."}]}.'
+    )
+    response = await make_openai_call(pairs_prompt, json_mode=True, stage="qa_pairs")
+    return parse_question_answer_pairs(response)
+
+def parse_json_field(response: typing.Optional[str], field: str) -> typing.Any:
+    if response is None:
+        return None
+    response = response.strip()
+    if response.startswith('```'):
+        # Tolerate a fenced reply such as ```json ... ```
+        response = response.strip('`')
+        response = response[response.find('{'):]
+    try:
+        return json.loads(response)[field]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def parse_question_answer_pairs(response: typing.Optional[str]) -> typing.Optional[typing.List[typing.Dict[str, str]]]:
+    pairs = parse_json_field(response, 'pairs')
+    if not isinstance(pairs, list):
+        return None
+    return [
+        {"question": pair['question'].strip(), "answer": pair['answer'].strip()}
+        for pair in pairs
+        if isinstance(pair, dict) and isinstance(pair.get('question'), str) and isinstance(pair.get('answer'), str)
+    ]
+
+def parse_json_strings(response: typing.Optional[str], field: str, count: int) -> typing.Optional[typing.List[str]]:
+    # Replies are matched to snippets or questions by position, so one with the wrong count is unusable
+    values = parse_json_field(response, field)
+    if not isinstance(values, list) or len(values) != count or not all(isinstance(value, str) for value in values):
+        return None
+    return [value.strip() for value in values]
+
+def plan_summary(content: str) -> typing.Dict[str, typing.Any]:
+    sections, code_blocks, heading_levels = parse_post(
+        content, context_window=2, max_context_lines=MAX_CONTEXT_LINES,
+        max_section_tokens=SECTION_MAX_TOKENS, overlap_tokens=SECTION_OVERLAP_TOKENS,
+    )
+    plan = plan_questions(sections, heading_levels, [content[block.start:block.end] for block in code_blocks], question_budget)
+    return {
+        "questions": plan.total,
+        "sections": [
+            {"section_title": section_title, "questions": count, **score._asdict()}
+            for (section_title, _), count, score in zip(sections, plan.section_questions, plan.scores)
+        ],
+        "code_blocks": [
+            {"section_title": block.section, "line": block.start_line + 1, "questions": int(kept), **score._asdict()}
+            for block, kept, score in zip(code_blocks, plan.snippet_kept, plan.scores[len(sections):])
+        ],
+    }
+
+def plan_post(content: str) -> typing.Tuple[typing.List[typing.Tuple[str, str, int]], typing.List[SnippetGroup], QuestionPlan]:
+    """Parse a post and plan its questions: the sections worth asking about with their question
+    counts, and the snippet groups formed from the code blocks that get a question."""
+    with trace_span("parse_post", "parse"):
+        sections, code_blocks, heading_levels = parse_post(
+            content, context_window=2, max_context_lines=MAX_CONTEXT_LINES,
+            max_section_tokens=SECTION_MAX_TOKENS, overlap_tokens=SECTION_OVERLAP_TOKENS,
+        )
+    with trace_span("plan_questions", "plan"):
+        plan = plan_questions(sections, heading_levels, [content[block.start:block.end] for block in code_blocks], question_budget)
+    planned_sections = [(section_title, text, count) for (section_title, text), count in zip(sections, plan.section_questions) if count]
+    # Skipped code blocks stay in the excerpts as context, without a label of their own
+    with trace_span("group_snippets", "parse"):
+        snippet_groups = group_snippets(content, [block for block, kept in zip(code_blocks, plan.snippet_kept) if kept])
+    return planned_sections, snippet_groups, plan
+
+QAPairCallback = typing.Optional[typing.Callable[[typing.Dict[str, str]], None]]
+# Receives progress events ({"type": "started" | "pair" | "progress" | "deadline", ...}) while a post is generated
+EventCallback = typing.Optional[typing.Callable[[typing.Dict[str, typing.Any]], None]]
+# Returns False for a question that near-duplicates one already asked, so its answer is never paid for
+QuestionFilter = typing.Optional[typing.Callable[[str], bool]]
+
+def question_filter(post_id: str, content: str = "") -> QuestionFilter:
+    if dedup_index is None:
+        return None
+    index = dedup_index if DEDUP_ACROSS_POSTS else NearDuplicateIndex(DEDUP_THRESHOLD)
+    run = next(dedup_runs)
+    # Posts without an ID are told apart by their content, so they are still deduplicated against each other
+    dedup_key = post_id or item_hash("post", content)
+    return lambda question: index.add(question, dedup_key, run)
+
+# Called with the question (None if it was never generated) when an API call fails outright
+FailureCallback = typing.Optional[typing.Callable[[typing.Optional[str]], None]]
+
+def is_new_question(question: str, is_new: QuestionFilter) -> bool:
+    if is_new is None:
+        return True
+    with trace_span("near_duplicate", "validate"):
+        if is_new(question):
+            return True
+    record_rejection("question", "near_duplicate", question)
+    return False
+
+async def generate_section_pair(
+    section_title: str, text: str, variant: int, is_new: QuestionFilter = None,
+    question: typing.Optional[str] = None, on_failure: FailureCallback = None,
+) -> typing.Optional[typing.Dict[str, str]]:
+    # A question carried over from a failed attempt was already validated; only its answer is missing
+    if question is None:
+        question = await generate_question(section_title, text, variant=variant)
+        if question is None:
+            if on_failure:
+                on_failure(None)
+            return None
+        if not (is_question_valid(question) and is_new_question(question, is_new)):
+            return None
+    answer = await generate_answer(question, section_title, text)
+    if answer is None:
+        if on_failure:
+            on_failure(question)
+        return None
+    if is_answer_valid(answer, question):
+        return {
+            "section_title": section_title,
+            "question": question,
+            "answer": answer
+        }
+    return None
+
+async def generate_snippet_pair(
+    group: SnippetGroup, index: int, is_new: QuestionFilter = None,
+    question: typing.Optional[str] = None, on_failure: FailureCallback = None,
+) -> typing.Optional[typing.Dict[str, str]]:
+    snippet, context = group.snippets[index]
+    if question is None:
+        question = await generate_snippet_question(group.excerpt, index + 1)
+        if question is None:
+            if on_failure:
+                on_failure(None)
+            return None
+        if not (is_question_valid(question) and is_new_question(question, is_new)):
+            return None
+    answer = await generate_snippet_answer(group.excerpt, index + 1, question)
+    if answer is None:
+        if on_failure:
+            on_failure(question)
+        return None
+    if is_answer_valid(answer, question):
+        return {
+            "context": context,
+            "section_title": group.section,
+            "code_snippet": snippet,
+            "question": question,
+            "answer": answer
+        }
+    return None
+
+async def generate_snippet_group_pairs(
+    group: SnippetGroup, questions: typing.List[typing.Tuple[int, str]],
+    on_failure: typing.Callable[[int], FailureCallback], on_pair: QAPairCallback = None,
+) -> typing.List[typing.Dict[str, str]]:
+    """Answer questions about several snippets of a group (by index) in one call."""
+    response = await generate_snippet_answers(group.excerpt, [(index + 1, question) for index, question in questions])
+    if response is None:
+        # The call failed outright; each question is retried on its own later
+        for index, question in questions:
+            on_failure(index)(question)
+        return []
+    answers = parse_json_strings(response, 'answers', len(questions))
+    if answers is None:
+        # The reply could not be parsed; fall back to one answer call per question
+        return await collect_pairs([generate_snippet_pair(group, index, question=question, on_failure=on_failure(index)) for index, question in questions], on_pair)
+
+    qa_pairs = []
+    for (index, question), answer in zip(questions, answers):
+        if is_answer_valid(answer, question):
+            snippet, context = group.snippets[index]
+            qa_pair = {"context": context, "section_title": group.section, "code_snippet": snippet, "question": question, "answer": answer}
+            qa_pairs.append(qa_pair)
+            if on_pair:
+                on_pair(qa_pair)
     return qa_pairs
 
-async def process_snippet(snippet: str, context: str, current_section: str) -> typing.List[typing.Dict[str, str]]:
+async def collect_pairs(pair_tasks: typing.List[typing.Awaitable], on_pair: QAPairCallback = None) -> typing.List[typing.Dict[str, str]]:
+    # Every question is in flight at once and its answer is requested the moment it lands, so an
+    # item costs two rounds of latency however many questions it asks; the limiter paces the calls
     qa_pairs = []
-    question = await generate_snippet_question("Code Snippet", snippet, context)
-    
-    if question and is_question_valid(question):
-        answer = await generate_snippet_answer("Code Snippet", snippet, context, question)
-        if answer and is_answer_valid(answer):
-            qa_pairs.append({
-                "context": context,
-                "section_title": current_section,
-                "code_snippet": snippet,
-                "question": question,
-                "answer": answer
-            })
-    
+    tasks = [asyncio.ensure_future(pair_task) for pair_task in pair_tasks]
+    try:
+        for next_pair in asyncio.as_completed(tasks):
+            qa_pair = await next_pair
+            if qa_pair:
+                qa_pairs.append(qa_pair)
+                if on_pair:
+                    on_pair(qa_pair)
+    finally:
+        # Cancelled (e.g. at the post deadline): stop the calls still in flight too
+        for task in tasks:
+            task.cancel()
     return qa_pairs
 
-async def generate_questions_answers(content: str, output_dir: str = TEMP_DATA_DIR) -> typing.List[typing.Dict[str, str]]:
+async def process_section(section_title: str, text: str, num_questions: int, is_new: QuestionFilter = None, on_pair: QAPairCallback = None) -> typing.List[typing.Dict[str, str]]:
+    with trace_span(section_title, "section", questions=num_questions):
+        if batched_qa:
+            pairs = await generate_question_answer_pairs(section_title, text, num_questions)
+            if pairs:
+                qa_pairs = []
+                # Models sometimes write more pairs than asked for; the plan sets the count
+                for pair in pairs[:num_questions]:
+                    if is_question_valid(pair['question']) and is_answer_valid(pair['answer'], pair['question']) and is_new_question(pair['question'], is_new):
+                        qa_pair = {"section_title": section_title, **pair}
+                        qa_pairs.append(qa_pair)
+                        if on_pair:
+                            on_pair(qa_pair)
+                return qa_pairs
+            # The reply could not be parsed; fall back to one call per question and answer
+
+        return await collect_pairs(
+            [
+                generate_section_pair(
+                    section_title, text, i, is_new,
+                    on_failure=functools.partial(log_failed_question, "section", {"section_title": section_title, "text": text, "variant": i}),
+                )
+                for i in range(num_questions)
+            ],
+            on_pair,
+        )
+
+async def process_snippet_group(group: SnippetGroup, is_new: QuestionFilter = None, on_pair: QAPairCallback = None) -> typing.List[typing.Dict[str, str]]:
+    def on_failure(index: int) -> FailureCallback:
+        return functools.partial(log_failed_question, "snippet", {"group": group._asdict(), "index": index})
+
+    with trace_span(group.section or HEADLESS_SECTION_TITLE, "snippet", snippets=len(group.snippets)):
+        count = len(group.snippets)
+        if count == 1:
+            return await collect_pairs([generate_snippet_pair(group, 0, is_new, on_failure=on_failure(0))], on_pair)
+
+        # One call asks every question and one answers the ones that pass validation, so the excerpt
+        # is sent twice per group rather than twice per snippet
+        response = await generate_snippet_questions(group.excerpt, count)
+        if response is None:
+            # The call failed outright; every snippet's question is retried on its own later
+            for index in range(count):
+                on_failure(index)(None)
+            return []
+        questions = parse_json_strings(response, 'questions', count)
+        if questions is None:
+            # The reply could not be parsed; fall back to one question call per snippet
+            return await collect_pairs([generate_snippet_pair(group, index, is_new, on_failure=on_failure(index)) for index in range(count)], on_pair)
+
+        valid = [(index, question) for index, question in enumerate(questions) if is_question_valid(question) and is_new_question(question, is_new)]
+        if len(valid) == 1:
+            index, question = valid[0]
+            return await collect_pairs([generate_snippet_pair(group, index, question=question, on_failure=on_failure(index))], on_pair)
+        if not valid:
+            return []
+        return await generate_snippet_group_pairs(group, valid, on_failure, on_pair)
+
+async def process_checkpointed(checkpoint: typing.Optional[Checkpoint], post_id: str, key: str, on_pair: QAPairCallback, process, *args) -> typing.List[typing.Dict[str, str]]:
+    current_item_key.set(key)
+    if checkpoint is not None and checkpoint.is_done(post_id, key):
+        qa_pairs = checkpoint.load_pairs(post_id, key)
+        if on_pair:
+            for qa_pair in qa_pairs:
+                on_pair(qa_pair)
+        return qa_pairs
+
+    def record_pair(qa_pair: typing.Dict[str, str]):
+        if checkpoint is not None:
+            checkpoint.append_pair(post_id, key, qa_pair)
+        if qa_store is not None:
+            qa_store.append(post_id, key, qa_pair)
+        if on_pair:
+            on_pair(qa_pair)
+
+    if checkpoint is not None:
+        checkpoint.start_item(post_id, key)
+    if qa_store is not None:
+        # Pairs from an earlier attempt at this item are replaced by the ones generated now
+        qa_store.supersede(post_id, key)
+    qa_pairs = await process(*args, on_pair=record_pair)
+    if checkpoint is not None:
+        checkpoint.mark_done(post_id, key)
+    return qa_pairs
+
+async def generate_questions_answers(
+    content: str, output_dir: str = TEMP_DATA_DIR, post_id: str = "", on_event: EventCallback = None,
+    deadline_seconds: typing.Optional[float] = POST_DEADLINE_SECONDS,
+) -> typing.List[typing.Dict[str, str]]:
     questions_answers = []
+    checkpoint = load_checkpoint(os.path.join(output_dir, "qa_output.jsonl")) if CHECKPOINT_ENABLED else None
+    is_new = question_filter(post_id, content)
+    current_post_id.set(post_id)
+    clock = PostClock()
+    current_post_clock.set(clock)
 
-    snippets_with_context = extract_code_and_context(content, context_window=2, max_context_lines=MAX_CONTEXT_LINES)
-    sections = extract_sections(content)
+    with trace_span(post_id or "post", "post"):
+        sections, snippet_groups, plan = plan_post(content)
 
-    # Retry failed questions first
-    reattempted_qa_pairs = await retry_failed_questions()
-    questions_answers.extend(reattempted_qa_pairs)
+        section_keys = [item_hash("section", section_title, text) for section_title, text, _ in sections]
+        group_keys = [item_hash("snippet_group", group.section, group.excerpt) for group in snippet_groups]
+        discard_superseded_failures(checkpoint, post_id, section_keys + group_keys)
+        if qa_store is not None and post_id:
+            # Sections edited out of the post no longer contribute pairs
+            qa_store.supersede(post_id, keep=section_keys + group_keys)
 
-    # Process sections in parallel using asyncio.gather
-    section_tasks = [
-        process_section(section_title, text, estimate_question_count(text))
-        for section_title, text in sections.items()
-    ]
-    for section_qa_pairs in asyncio.as_completed(section_tasks):
-        questions_answers.extend(await section_qa_pairs)
+        total = len(sections) + len(snippet_groups)
+        if on_event:
+            on_event({"type": "started", "post_id": post_id, "items": total, "questions": plan.total})
 
-    # Process snippets in parallel using asyncio.gather
-    snippet_tasks = [
-        process_snippet(snippet, context, current_section)
-        for snippet, context, _, _ , current_section in snippets_with_context
-    ]
-    for snippet_qa_pairs in asyncio.as_completed(snippet_tasks):
-        questions_answers.extend(await snippet_qa_pairs)
+        # Pairs are collected as they land, so a post cut off by its deadline keeps every finished pair
+        def on_pair(qa_pair: typing.Dict[str, str]):
+            questions_answers.append(qa_pair)
+            if on_event:
+                on_event({"type": "pair", "qa_pair": qa_pair})
+
+        # Sections and snippets are all scheduled together rather than one group after another,
+        # so the slowest item bounds the post instead of the sum of the groups
+        item_tasks = [
+            process_checkpointed(
+                checkpoint, post_id, key, on_pair,
+                process_section, section_title, text, num_questions, is_new,
+            )
+            for key, (section_title, text, num_questions) in zip(section_keys, sections)
+        ]
+        item_tasks += [
+            process_checkpointed(checkpoint, post_id, key, on_pair, process_snippet_group, group, is_new)
+            for key, group in zip(group_keys, snippet_groups)
+        ]
+        done = 0
 
+        async def run_items():
+            nonlocal done
+            tasks = [asyncio.ensure_future(item_task) for item_task in item_tasks]
+            try:
+                for item in asyncio.as_completed(tasks):
+                    await item
+                    done += 1
+                    if on_event:
+                        on_event({"type": "progress", "done": done, "total": total, "pairs": len(questions_answers)})
+            finally:
+                for task in tasks:
+                    task.cancel()
+            await retry_failed_questions(checkpoint, post_id, is_new, on_pair)
+
+        try:
+            await run_with_deadline(run_items(), clock, deadline_seconds)
+        except asyncio.TimeoutError:
+            # Unfinished items stay undone in the checkpoint, so the next run picks them up
+            logger.warning("Post %r hit its %ss deadline with %d of %d items done", post_id, deadline_seconds, done, total)
+            if on_event:
+                on_event({"type": "deadline", "done": done, "total": total, "pairs": len(questions_answers)})
+    stats = metrics.post_summary(post_id)
+    logger.info(
+        "Post %r: %d pairs for %d planned questions from %d calls (%d cached, %d errors, %d retries), %d+%d tokens, mean wait %s, mean latency %s",
+        post_id, len(questions_answers), plan.total, stats['calls'], stats['cache_hits'], stats['errors'], stats['retries'],
+        stats['prompt_tokens'], stats['completion_tokens'], format_seconds(stats['mean_queue_wait']), format_seconds(stats['mean_latency']),
+    )
     return questions_answers
 
-def load_checkpoint(output_file: str) -> typing.Tuple[typing.Set[str], typing.Set[typing.Tuple[str, str]]]:
-    if os.path.exists(output_file):
-        with open(output_file, 'r') as f:
-            processed_data = [json.loads(line) for line in f]
-        processed_titles = {entry['section_title'] for entry in processed_data if 'section_title' in entry}
-        processed_snippets = {(entry['context'], entry['code_snippet']) for entry in processed_data if 'code_snippet' in entry}
-        return processed_titles, processed_snippets
-    return set(), set()
-
-def log_failed_question(identifier: str, question: str, q_type: str):
-    log_file = "failed_questions.jsonl"
-    with open(log_file, 'a') as log:
-        log.write(json.dumps({"type": q_type, "identifier": identifier, "question": question}) + '\n')
-
-async def retry_failed_questions() -> typing.List[typing.Dict[str, str]]:
-    log_file = "failed_questions.jsonl"
-    if not os.path.exists(log_file):
-        return []
+# Open checkpoints by output file, so a long-running process reuses the same index connection
+checkpoints: typing.Dict[str, Checkpoint] = {}
 
-    reattempted_qa_pairs = []
-    with open(log_file, 'r') as log:
-        failed_questions = [json.loads(line) for line in log]
-
-    with open(log_file, 'w') as log:  # Clear the log file after processing
-        pass
-
-    for entry in failed_questions:
-        if entry['type'] == "section":
-            question = entry['question']
-            if question != "No question generated":
-                answer = await generate_answer(question, entry['identifier'], "")
-                if answer:
-                    reattempted_qa_pairs.append({
-                        "section_title": entry['identifier'],
-                        "question": question,
-                        "answer": answer
-                    })
-                else:
-                    log_failed_question(entry['identifier'], question, "section")  # Re-log if still failing
+def load_checkpoint(output_file: str) -> Checkpoint:
+    output_file = os.path.abspath(output_file)
+    if output_file not in checkpoints:
+        checkpoints[output_file] = Checkpoint(output_file)
+    return checkpoints[output_file]
+
+def log_failed_question(kind: str, payload: typing.Dict[str, typing.Any], question: typing.Optional[str]):
+    retry_queue.enqueue(current_post_id.get(), current_item_key.get(), kind, payload, question)
+
+def discard_superseded_failures(checkpoint: typing.Optional[Checkpoint], post_id: str, item_keys: typing.List[str]):
+    # Failures are only worth retrying for items this run will not redo from scratch: ones the
+    # checkpoint has finished and whose text is still in the post
+    keep = {key for key in item_keys if checkpoint is not None and checkpoint.is_done(post_id, key)}
+    for entry in retry_queue.pending(post_id):
+        if entry['item_hash'] not in keep:
+            retry_queue.complete(entry['id'])
+
+async def retry_failed_question(checkpoint: typing.Optional[Checkpoint], post_id: str, entry: typing.Dict[str, typing.Any], is_new: QuestionFilter = None) -> typing.Optional[typing.Dict[str, str]]:
+    # The attempt is counted (and the last one dead-letters the entry) before the call, so an entry that crashes the process isn't retried forever
+    retry_queue.start_attempt(entry['id'])
+    failures: typing.List[typing.Optional[str]] = []
+    payload = entry['payload']
+    if entry['kind'] == "section":
+        qa_pair = await generate_section_pair(
+            payload['section_title'], payload['text'], payload['variant'], is_new, entry['question'], failures.append,
+        )
+    else:
+        group = SnippetGroup(**payload['group'])
+        qa_pair = await generate_snippet_pair(group, payload['index'], is_new, entry['question'], failures.append)
+    if failures:
+        retry_queue.fail(entry['id'], failures[-1])
+        return None
+
+    # The pair is written before the entry is removed, so a crash in between repeats the retry instead of losing it
+    if qa_pair and checkpoint is not None:
+        checkpoint.append_pair(post_id, entry['item_hash'], qa_pair)
+        checkpoint.sync()
+    if qa_pair and qa_store is not None:
+        qa_store.append(post_id, entry['item_hash'], qa_pair)
+    retry_queue.complete(entry['id'])
+    return qa_pair
+
+async def retry_failed_questions(checkpoint: typing.Optional[Checkpoint], post_id: str, is_new: QuestionFilter = None, on_pair: QAPairCallback = None) -> typing.List[typing.Dict[str, str]]:
+    with trace_span("retry_failed_questions", "retry"):
+        # Every queued failure of the post, from this run or an earlier one, retried at once under the shared limiter
+        entries = retry_queue.pending(post_id)
+        return await collect_pairs([retry_failed_question(checkpoint, post_id, entry, is_new) for entry in entries], on_pair)
+
+async def generate_with_session(post_content: str, post_id: str = "", on_event: EventCallback = None) -> typing.List[typing.Dict[str, str]]:
+    async with shared_session():
+        return await generate_questions_answers(post_content, post_id=post_id, on_event=on_event)
+
+def generate_qa_from_content(post_content: str, post_id: str = "") -> str:
+    questions_answers = asyncio.run(generate_with_session(post_content, post_id))
+    return json.dumps(questions_answers)
+
+def print_event(event: typing.Dict[str, typing.Any]):
+    print(json.dumps(event), flush=True)
+
+def generate_qa_with_progress(post_content: str, post_id: str = ""):
+    """Print progress events as JSON lines, ending with a "result" line that holds every Q/A pair."""
+    try:
+        questions_answers = asyncio.run(generate_with_session(post_content, post_id, on_event=print_event))
+    except Exception as e:
+        logger.exception("Generation failed")
+        print_event({"type": "failed", "error": str(e)})
+        raise
+    print_event({"type": "result", "qa_pairs": questions_answers})
+
+def read_input(path: str) -> str:
+    if path == '-':
+        return sys.stdin.read()
+    with open(path, 'r') as f:
+        return f.read()
+
+async def process_post(post: Post) -> typing.Dict[str, typing.Any]:
+    try:
+        qa_pairs = await generate_questions_answers(post['content'], post_id=str(post.get('post_id', "")))
+        return {"post_id": post.get('post_id'), "qa_pairs": qa_pairs, "stats": metrics.post_summary(str(post.get('post_id', "")))}
+    except Exception as e:
+        logger.exception("Post %r failed", post.get('post_id'))
+        return {"post_id": post.get('post_id'), "error": str(e)}
+
+async def generate_corpus(
+    posts: typing.Iterator[Post], max_in_flight: int = CORPUS_MAX_POSTS_IN_FLIGHT,
+    emit: typing.Callable[[typing.Dict[str, typing.Any]], None] = print_event,
+):
+    """Process posts concurrently and emit (print) one result per post as soon as it finishes.
+
+    All in-flight posts' calls share the fair scheduler, so small posts finish (and stream out)
+    while a large one is still running, and the rate budget stays busy between posts.
+    """
+    loop = asyncio.get_running_loop()
+    pending = set()
+    exhausted = False
+    while pending or not exhausted:
+        # Only read ahead while there is room, so memory stays bounded by max_in_flight posts
+        if not exhausted and len(pending) < max_in_flight:
+            post = await loop.run_in_executor(None, next, posts, None)
+            if post is None:
+                exhausted = True
+            elif is_read_error(post):
+                logger.error("Skipped input line %s: %s", post['line'], post['error'])
+                emit(post)
             else:
-                log_failed_question(entry['identifier'], question, "section")  # Log if question couldn't be generated
-        elif entry['type'] == "snippet":
-            question = entry['question']
-            if question != "No question generated":
-                answer = await generate_answer(question, "Code Snippet", "")
-                if answer:
-                    reattempted_qa_pairs.append({
-                        "code_snippet": entry['identifier'],
-                        "question": question,
-                        "answer": answer
-                    })
-                else:
-                    log_failed_question(entry['identifier'], question, "snippet")  # Re-log if still failing
+                pending.add(asyncio.create_task(process_post(post)))
+            continue
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            emit(task.result())
+
+async def run_batch(path: str):
+    stream = sys.stdin if path == '-' else open(path, 'r')
+    try:
+        async with shared_session():
+            await generate_corpus(read_jsonl(stream), BATCH_MAX_POSTS_IN_FLIGHT)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+async def run_corpus(path: str):
+    async with shared_session():
+        await generate_corpus(read_corpus(path))
+
+class ShardSettings(typing.NamedTuple):
+    """What a shard worker needs from the coordinator's command line; the rest comes from custom_config."""
+    routes: typing.Dict[str, typing.Tuple[str, str]]
+    use_cache: bool
+    batched_qa: bool
+    question_budget: typing.Optional[int]  # For the whole run, split evenly between the workers
+    profile: bool
+    max_in_flight: int
+
+def shard_worker(worker: int, workers: int, settings: ShardSettings, posts: multiprocessing.Queue, results: multiprocessing.Queue):
+    """Run one shard in its own process and event loop, with its share of every backend's budget.
+
+    Posts arrive on ``posts`` until a None; each result goes back on ``results`` as a JSON line,
+    followed by ("done", worker, metrics, tracer) once the shard is finished.
+    """
+    global response_cache, batched_qa, question_budget, tracer
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format=f"%(asctime)s %(levelname)s [shard {worker + 1}/{workers}] %(message)s")
+    configure_backends(shard_backend_configs(LLM_BACKENDS, worker, workers), settings.routes)
+    if not settings.use_cache:
+        response_cache = None
+    batched_qa = settings.batched_qa
+    question_budget = None
+    if settings.question_budget is not None:
+        question_budget = QuestionBudget(settings.question_budget // workers + (worker < settings.question_budget % workers))
+    if settings.profile:
+        tracer = Tracer()
+
+    async def run():
+        async with shared_session():
+            # Encoding the result here keeps that work off the coordinator
+            await generate_corpus(iter(posts.get, None), settings.max_in_flight, lambda result: results.put(("result", json.dumps(result))))
+
+    try:
+        asyncio.run(run())
+    finally:
+        results.put(("done", worker, metrics, tracer))
+
+def run_sharded(posts: typing.Iterator[Post], workers: int, settings: ShardSettings):
+    """Split posts across ``workers`` processes by post-ID hash and print their results as they arrive.
+
+    A post always lands on the same shard for a given worker count. The workers share the
+    checkpoint, retry queue, response cache and Q/A store on disk, all of which take appends
+    from several processes; the coordinator builds the checkpoint index before they start and
+    merges their metrics (and --profile traces) as they finish. Near-duplicate questions are
+    only caught within a shard.
+    """
+    if CHECKPOINT_ENABLED:
+        # Built once here rather than by every worker at the same time
+        load_checkpoint(os.path.join(TEMP_DATA_DIR, "qa_output.jsonl"))
+    # Spawned rather than forked, so no worker inherits the coordinator's SQLite connections
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    post_queues = [context.Queue(settings.max_in_flight) for _ in range(workers)]
+    processes = [
+        context.Process(target=shard_worker, args=(worker, workers, settings, post_queues[worker], results), name=f"shard-{worker + 1}", daemon=True)
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def feed():
+        for post in posts:
+            if is_read_error(post):
+                logger.error("Skipped input line %s: %s", post['line'], post['error'])
+                results.put(("result", json.dumps(post)))
+                continue
+            worker = shard_of(str(post.get('post_id', "")), workers)
+            while True:
+                try:
+                    post_queues[worker].put(post, timeout=1)
+                    break
+                except queue.Full:
+                    if not processes[worker].is_alive():
+                        logger.error("Shard %d is gone; post %r skipped", worker + 1, post.get('post_id'))
+                        break
+        for post_queue in post_queues:
+            post_queue.put(None)
+
+    # Reading ahead happens on a thread, so results keep streaming out while a full shard queue blocks it
+    threading.Thread(target=feed, daemon=True).start()
+    finished: typing.Set[int] = set()
+    while len(finished) < workers:
+        try:
+            message = results.get(timeout=1)
+        except queue.Empty:
+            for worker, process in enumerate(processes):
+                if worker not in finished and process.exitcode not in (None, 0):
+                    logger.error("Shard %d of %d exited with code %s; its unfinished posts resume on the next run", worker + 1, workers, process.exitcode)
+                    finished.add(worker)
+            continue
+        if message[0] == "result":
+            print(message[1], flush=True)
+            continue
+        _, worker, worker_metrics, worker_tracer = message
+        finished.add(worker)
+        metrics.merge(worker_metrics)
+        if tracer is not None and worker_tracer is not None:
+            tracer.merge(worker_tracer)
+    for post_queue in post_queues:
+        # Posts still queued for a shard that died are dropped rather than waited on at exit
+        post_queue.cancel_join_thread()
+    for process in processes:
+        process.join()
+
+def batch_request_body(prompt: str, model: str = OPENAI_MODEL) -> typing.Dict[str, typing.Any]:
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": OPENAI_MAX_TOKENS,
+        "temperature": OPENAI_TEMPERATURE,
+    }
+
+async def generate_corpus_via_batch_api(path: str, backend: BatchBackend, work_dir: Path = BATCH_API_DIR, poll_seconds: float = BATCH_API_POLL_SECONDS):
+    """Generate Q/A for a {post_id, content} JSONL corpus with two rounds of Batch API jobs.
+
+    All question prompts go out first; the valid questions then become one round of answer
+    prompts, using the models routed for the "question" and "answer" stages. Results are joined
+    back to their sections/snippets and printed as one JSONL line per post.
+    """
+    posts = []
+    post_filters = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                post = json.loads(line)
+                sections, groups, _ = plan_post(post['content'])
+                posts.append((post.get('post_id'), sections, groups))
+                post_filters.append(question_filter("" if post.get('post_id') is None else str(post['post_id']), post['content']))
+
+    # custom_id is "<post index>-s<section index>-<variant>" or "<post index>-c<group index>-<snippet index>";
+    # batch requests are independent, so every snippet gets its own question request
+    def question_requests():
+        for p, (_, sections, groups) in enumerate(posts):
+            for s, (section_title, text, num_questions) in enumerate(sections):
+                for variant in range(num_questions):
+                    yield f"{p}-s{s}-{variant}", question_prompt(section_title, text)
+            for g, group in enumerate(groups):
+                for index in range(len(group.snippets)):
+                    yield f"{p}-c{g}-{index}", snippet_question_prompt(group.excerpt, index + 1)
+
+    questions = await run_batches(
+        backend,
+        write_request_files(question_requests(), Path(work_dir), "questions", functools.partial(batch_request_body, model=route_for("question").model), BATCH_API_MAX_REQUESTS_PER_FILE),
+        poll_seconds,
+    )
+    post_keys = ["" if post_id is None else str(post_id) for post_id, _, _ in posts]
+    valid_questions = {}
+    for custom_id, question in sorted(questions.items()):
+        p = int(custom_id.split('-', 1)[0])
+        current_post_id.set(post_keys[p])
+        if is_question_valid(question) and is_new_question(question, post_filters[p]):
+            valid_questions[custom_id] = question
+    questions = valid_questions
+
+    def answer_requests():
+        for custom_id, question in questions.items():
+            p, item = custom_id.split('-', 1)
+            _, sections, groups = posts[int(p)]
+            if item.startswith('s'):
+                section_title, text, _ = sections[int(item[1:].split('-')[0])]
+                yield custom_id, answer_prompt(question, section_title, text)
             else:
-                log_failed_question(entry['identifier'], question, "snippet")  # Log if question couldn't be generated
+                g, index = item[1:].split('-')
+                yield custom_id, snippet_answer_prompt(groups[int(g)].excerpt, int(index) + 1, question)
 
-    return reattempted_qa_pairs
+    answers = await run_batches(
+        backend,
+        write_request_files(answer_requests(), Path(work_dir), "answers", functools.partial(batch_request_body, model=route_for("answer").model), BATCH_API_MAX_REQUESTS_PER_FILE),
+        poll_seconds,
+    )
 
-def generate_qa_from_content(post_content: str) -> str:
-    questions_answers = asyncio.run(generate_questions_answers(post_content))
-    return json.dumps(questions_answers)
+    if qa_store is not None:
+        # As in generate_questions_answers: every item of these posts was regenerated, so its earlier
+        # rows are replaced, and sections edited out of a post no longer contribute pairs
+        for post_key, (_, sections, groups) in zip(post_keys, posts):
+            item_keys = [item_hash("section", section_title, text) for section_title, text, _ in sections]
+            item_keys += [item_hash("snippet_group", group.section, group.excerpt) for group in groups]
+            if post_key:
+                qa_store.supersede(post_key, keep=item_keys)
+            for key in item_keys:
+                qa_store.supersede(post_key, key)
+
+    qa_by_post = defaultdict(list)
+    for custom_id, question in questions.items():
+        answer = answers.get(custom_id)
+        current_post_id.set(post_keys[int(custom_id.split('-', 1)[0])])
+        if not is_answer_valid(answer, question):
+            continue
+        p, item = custom_id.split('-', 1)
+        _, sections, groups = posts[int(p)]
+        if item.startswith('s'):
+            section_title, text, _ = sections[int(item[1:].split('-')[0])]
+            key = item_hash("section", section_title, text)
+            qa_pair = {"section_title": section_title, "question": question, "answer": answer}
+        else:
+            g, index = item[1:].split('-')
+            group = groups[int(g)]
+            snippet, context = group.snippets[int(index)]
+            key = item_hash("snippet_group", group.section, group.excerpt)
+            qa_pair = {
+                "context": context,
+                "section_title": group.section,
+                "code_snippet": snippet,
+                "question": question,
+                "answer": answer
+            }
+        qa_by_post[int(p)].append(qa_pair)
+        if qa_store is not None:
+            qa_store.append(post_keys[int(p)], key, qa_pair)
+
+    for p, (post_id, _, _) in enumerate(posts):
+        print(json.dumps({"post_id": post_id, "qa_pairs": qa_by_post[p]}), flush=True)
+
+async def run_batch_api(path: str):
+    # Batch jobs go to the backend that generates questions, which has to speak the OpenAI API
+    llm_backend = route_for("question").backend
+    if not isinstance(llm_backend, OpenAICompatibleBackend):
+        raise ValueError(f"--batch-api needs an OpenAI-compatible backend, not {llm_backend.name!r}")
+    async with aiohttp.ClientSession() as session:
+        backend = OpenAIBatchBackend(session, BATCH_API_BASE or llm_backend.base_url, llm_backend.api_key)
+        await generate_corpus_via_batch_api(path, backend)
+
+# Jobs submitted to the long-running server, keyed by job ID (oldest first)
+jobs: "OrderedDict[str, typing.Dict[str, typing.Any]]" = OrderedDict()
+
+HTTP_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+def prune_finished_jobs(max_finished: int = QA_SERVER_MAX_FINISHED_JOBS):
+    finished = [job_id for job_id, job in jobs.items() if job['status'] in ("done", "failed")]
+    for job_id in finished[:max(0, len(finished) - max_finished)]:
+        del jobs[job_id]
+
+def new_job(post_id: str) -> typing.Dict[str, typing.Any]:
+    return {
+        "status": "queued", "post_id": post_id, "progress": {"done": 0, "total": None},
+        # Numbered events for pollers (?since=) and subscribers (/events); pairs so far for partial results
+        "events": [], "pairs": [], "changed": asyncio.Event(),
+    }
+
+def publish_event(job: typing.Dict[str, typing.Any], event: typing.Dict[str, typing.Any]):
+    event = {"seq": len(job['events']), **event}
+    job['events'].append(event)
+    if event['type'] == "started":
+        job['progress'] = {"done": 0, "total": event['items']}
+    elif event['type'] == "progress":
+        job['progress'] = {"done": event['done'], "total": event['total']}
+    elif event['type'] == "deadline":
+        job['progress'] = {"done": event['done'], "total": event['total'], "deadline_exceeded": True}
+    elif event['type'] == "pair":
+        job['pairs'].append(event['qa_pair'])
+    # Wake every subscriber waiting on the old event, then give the next wait a fresh one
+    changed, job['changed'] = job['changed'], asyncio.Event()
+    changed.set()
+
+async def run_job(job_id: str, content: str, post_id: str = ""):
+    job = jobs[job_id]
+    job['status'] = "running"
+    try:
+        job['result'] = await generate_questions_answers(content, post_id=post_id, on_event=functools.partial(publish_event, job))
+        job['stats'] = metrics.post_summary(post_id)
+        job['status'] = "done"
+        publish_event(job, {"type": "done", "pairs": len(job['result'])})
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        job['error'] = str(e)
+        job['status'] = "failed"
+        publish_event(job, {"type": "failed", "error": job['error']})
+    finally:
+        # Finished jobs keep their own stats, so the server's per-post metrics only cover posts still running
+        if not any(other['post_id'] == post_id and other['status'] in ("queued", "running") for other in jobs.values()):
+            metrics.drop_post(post_id)
+        prune_finished_jobs()
+
+def job_summary(job_id: str, since: typing.Optional[int] = None) -> typing.Dict[str, typing.Any]:
+    job = jobs[job_id]
+    summary = {"job_id": job_id, "status": job['status'], "progress": job['progress']}
+    if job['status'] == "done":
+        summary['result'] = job['result']
+        summary['stats'] = job['stats']
+    elif job['status'] == "failed":
+        summary['error'] = job['error']
+    else:
+        summary['partial_result'] = list(job['pairs'])
+    if since is not None:
+        summary['events'] = job['events'][since:]
+        summary['next'] = len(job['events'])
+    return summary
+
+async def job_event_stream(job: typing.Dict[str, typing.Any], since: int) -> typing.AsyncIterator[str]:
+    """Server-sent events for a job from event number ``since`` on, ending after its done/failed event."""
+    while True:
+        while since < len(job['events']):
+            event = job['events'][since]
+            since += 1
+            yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        if job['status'] in ("done", "failed"):
+            return
+        try:
+            await asyncio.wait_for(job['changed'].wait(), QA_SERVER_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            yield ": keepalive\n\n"
+
+async def route_request(
+    method: str, path: str, body: bytes,
+    query: typing.Optional[typing.Dict[str, str]] = None, headers: typing.Optional[typing.Dict[str, str]] = None,
+) -> typing.Tuple[int, typing.Any]:
+    query = query or {}
+    headers = headers or {}
+
+    if path == "/health":
+        return 200, {"status": "ok", "jobs": len(jobs), "queued_calls": sum(backend.admission.queued for backend in backends.values())}
+
+    if path == "/metrics":
+        return 200, metrics.prometheus_text()
+
+    if path == "/stats":
+        return 200, metrics.summary()
+
+    if path == "/qa":
+        # Stored pairs of one post (optionally one section), read through the store's index
+        if qa_store is None or 'post_id' not in query:
+            return 400, {"message": "'post_id' is required and the Q/A store must be enabled"}
+        statuses = query['status'].split(',') if 'status' in query else ("new", "approved")
+        return 200, qa_store.pairs(query['post_id'], query.get('section_hash'), statuses)
+
+    if path == "/generate-qa":
+        if method != "POST":
+            return 405, {"message": "Use POST to submit content"}
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"message": "The body must be JSON"}
+        if not isinstance(request, dict):
+            return 400, {"message": "The body must be a JSON object"}
+        content = request.get('content')
+        if not isinstance(content, str):
+            return 400, {"message": "'content' is required"}
+
+        job_id = uuid.uuid4().hex
+        jobs[job_id] = new_job(str(request.get('post_id', "")))
+        jobs[job_id]['task'] = asyncio.create_task(run_job(job_id, content, jobs[job_id]['post_id']))
+        if not request.get('wait', True):
+            return 202, {"job_id": job_id, "status": jobs[job_id]['status']}
+
+        await asyncio.shield(jobs[job_id]['task'])
+        summary = job_summary(job_id)
+        # Blocking callers get the same payload as the command line: the bare Q/A list
+        return (200, summary['result']) if summary['status'] == "done" else (500, summary)
+
+    if path.startswith("/jobs/"):
+        job_id, _, resource = path[len("/jobs/"):].partition('/')
+        if job_id not in jobs:
+            return 404, {"message": f"Unknown job {job_id}"}
+        if resource == "events":
+            # EventSource reconnects send the last event they saw
+            since = int(headers['last-event-id']) + 1 if 'last-event-id' in headers else int(query.get('since', 0))
+            return 200, job_event_stream(jobs[job_id], since)
+        return 200, job_summary(job_id, int(query['since']) if 'since' in query else None)
+
+    return 404, {"message": f"Unknown path {path}"}
+
+async def handle_http_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+        path, _, query_string = path.partition('?')
+        query = {name: values[-1] for name, values in urllib.parse.parse_qs(query_string).items()}
+        status, payload = await route_request(method, path, body, query, headers)
+    except (ValueError, asyncio.IncompleteReadError) as e:
+        status, payload = 400, {"message": f"Malformed request: {e}"}
+    except Exception as e:
+        status, payload = 500, {"message": str(e)}
+
+    if hasattr(payload, '__aiter__'):
+        await write_event_stream(writer, payload)
+        return
+
+    # Text payloads are Prometheus metrics; everything else is JSON
+    if isinstance(payload, str):
+        data, content_type = payload.encode(), "text/plain; version=0.0.4"
+    else:
+        data, content_type = json.dumps(payload).encode(), "application/json"
+    writer.write(
+        f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"Connection: close\r\n\r\n".encode() + data
+    )
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def write_event_stream(writer: asyncio.StreamWriter, events: typing.AsyncIterator[str]):
+    # No Content-Length: the stream ends when the job does and the connection closes
+    writer.write(
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: text/event-stream\r\n"
+        b"Cache-Control: no-cache\r\n"
+        b"Connection: close\r\n\r\n"
+    )
+    try:
+        async for chunk in events:
+            writer.write(chunk.encode())
+            await writer.drain()
+    except ConnectionError:
+        pass  # The subscriber went away; the job carries on
+    finally:
+        writer.close()
+
+async def serve(host: str = QA_SERVER_HOST, port: int = QA_SERVER_PORT):
+    async with shared_session():
+        server = await asyncio.start_server(handle_http_connection, host, port)
+        logger.info("Serving Q/A generation on http://%s:%s", host, port)
+        async with server:
+            await server.serve_forever()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate Q/A from post content.")
-    parser.add_argument('--content', type=str, required=True, help='The content of the post to generate Q/A from')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--content', type=str, help='The content of the post to generate Q/A from')
+    mode.add_argument('--input', type=str, metavar='PATH', help="Read the post content from a file, or '-' for stdin")
+    mode.add_argument('--batch', type=str, metavar='PATH', help="Read {post_id, content} JSONL from a file or '-' and stream JSONL results")
+    mode.add_argument('--corpus', type=str, metavar='PATH', help="Generate Q/A for a directory of markdown files, a {post_id, content} JSONL file or '-', or a WordPress export (.xml), streaming JSONL results")
+    mode.add_argument('--batch-api', type=str, metavar='PATH', help='Generate Q/A for a {post_id, content} JSONL corpus through offline Batch API jobs')
+    mode.add_argument('--serve', action='store_true', help='Run as a long-lived HTTP server that accepts Q/A jobs')
+    parser.add_argument('--post-id', type=str, default="", help='Post ID used to key checkpointed results for --content/--input')
+    parser.add_argument('--batched-qa', action='store_true', help="Generate each section's Q/A pairs in a single structured call")
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the on-disk LLM response cache')
+    parser.add_argument('--host', type=str, default=QA_SERVER_HOST, help='Address to bind when serving')
+    parser.add_argument('--port', type=int, default=QA_SERVER_PORT, help='Port to bind when serving')
+    parser.add_argument('--progress', action='store_true', help='For --content/--input, print progress events as JSON lines, ending with a "result" line')
+    parser.add_argument('--route', action='append', default=[], metavar='STAGE=BACKEND:MODEL',
+                        help='Send a stage (question, snippet_question, snippet_questions, answer, snippet_answer, snippet_answers, qa_pairs or default) to a backend and model; repeatable')
+    parser.add_argument('--workers', type=int, default=SHARD_WORKERS,
+                        help='For --corpus/--batch, processes to shard posts across by post-ID hash, each with its own event loop and rate budget share')
+    parser.add_argument('--question-budget', type=int, default=None, help='Questions for the whole run, spent on the highest-scoring content first')
+    parser.add_argument('--plan', action='store_true', help='For --content/--input, print the question plan as JSON and exit without calling the API')
+    parser.add_argument('--profile', nargs='?', const=str(PROFILE_TRACE_FILE), default=None, metavar='TRACE_FILE',
+                        help='Record a span per post, item, call and wait; write them as a Chrome/Perfetto trace and print time by stage and critical path')
+    parser.add_argument('--stats-file', type=str, default=str(RUN_STATS_FILE), help='Where to write per-run and per-post call metrics')
     args = parser.parse_args()
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-    # Generate Q/A from the provided content
-    qa_result = generate_qa_from_content(args.content)
-    print(qa_result)
+    routes = dict(LLM_STAGE_ROUTES)
+    if args.route:
+        for route in args.route:
+            stage, _, target = route.partition('=')
+            backend_name, _, model = target.partition(':')
+            if not (stage and backend_name and model):
+                parser.error(f"--route expects STAGE=BACKEND:MODEL, got {route!r}")
+            routes[stage] = (backend_name, model)
+        configure_backends(LLM_BACKENDS, routes)
+
+    if args.no_cache:
+        response_cache = None
+    if args.question_budget is not None:
+        question_budget = QuestionBudget(args.question_budget)
+    if args.batched_qa:
+        batched_qa = True
+    if args.profile:
+        tracer = Tracer()
+
+    if args.serve:
+        # The server exposes its metrics at /metrics and /stats instead of a stats file
+        asyncio.run(serve(args.host, args.port))
+    else:
+        try:
+            if args.batch_api:
+                asyncio.run(run_batch_api(args.batch_api))
+            elif (args.batch or args.corpus) and args.workers > 1:
+                question_budget_total = args.question_budget if args.question_budget is not None else PLANNER_RUN_QUESTION_BUDGET
+                settings = ShardSettings(
+                    routes, response_cache is not None, batched_qa, question_budget_total, tracer is not None,
+                    BATCH_MAX_POSTS_IN_FLIGHT if args.batch else CORPUS_MAX_POSTS_IN_FLIGHT,
+                )
+                # A --batch file or stdin is JSONL, which read_corpus reads as well
+                run_sharded(read_corpus(args.batch or args.corpus), args.workers, settings)
+            elif args.batch:
+                asyncio.run(run_batch(args.batch))
+            elif args.corpus:
+                asyncio.run(run_corpus(args.corpus))
+            else:
+                # Generate Q/A from the provided content
+                content = args.content if args.content is not None else read_input(args.input)
+                if args.plan:
+                    print(json.dumps(plan_summary(content), indent=2))
+                elif args.progress:
+                    generate_qa_with_progress(content, args.post_id)
+                else:
+                    qa_result = generate_qa_from_content(content, args.post_id)
+                    print(qa_result)
+        finally:
+            metrics.write(args.stats_file)
+            if tracer is not None:
+                tracer.write(args.profile)
+                print(tracer.summary_table(), file=sys.stderr)
+                print(f"Trace written to {args.profile}", file=sys.stderr)
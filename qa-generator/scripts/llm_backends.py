@@ -0,0 +1,136 @@
+import os
+import typing
+import asyncio
+
+import aiohttp
+
+from rate_limiter import RateLimiter
+from scheduler import FairScheduler
+
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+# Budget used for whichever of requests/tokens per minute a backend leaves unset
+UNLIMITED_PER_MINUTE = 1e12
+
+class BackendError(Exception):
+    """A completion request failed; the call is given up (and queued for a later retry)."""
+
+class BackendTransientError(BackendError):
+    """A failure worth retrying: a timeout, a dropped connection or a 5xx."""
+
+class BackendRateLimited(BackendError):
+    def __init__(self, message: str, headers: typing.Mapping[str, str]):
+        super().__init__(message)
+        self.headers = headers
+
+class Completion(typing.NamedTuple):
+    text: str
+    prompt_tokens: int
+    completion_tokens: int
+    headers: typing.Mapping[str, str]
+
+class LLMBackend:
+    """Somewhere chat completions can be sent, with its own capacity.
+
+    Each backend bounds its open requests with ``max_concurrency`` slots, handed out by a fair
+    scheduler so one post cannot starve others on the same backend, and, when it has request or
+    token budgets, paces calls with its own rate limiter, which they reach holding their slot.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rate_limiter: typing.Optional[RateLimiter] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter
+        # A call holds its slot from its fair turn through the rate limiter to the end of its request
+        self.admission = FairScheduler(max_concurrency)
+
+    @property
+    def endpoint(self) -> str:
+        # Identifies where completions come from in cache keys, since two servers' replies aren't interchangeable
+        return self.name
+
+    async def complete(
+        self, session: aiohttp.ClientSession, model: str, prompt: str,
+        max_tokens: int, temperature: float, json_mode: bool = False,
+    ) -> Completion:
+        raise NotImplementedError
+
+class OpenAICompatibleBackend(LLMBackend):
+    """The OpenAI chat completions API, or any server speaking it (vLLM, llama.cpp, Ollama, LiteLLM...)."""
+
+    def __init__(
+        self, name: str, base_url: str, api_key: typing.Optional[str] = None, max_concurrency: int = 50,
+        rate_limiter: typing.Optional[RateLimiter] = None, timeout_seconds: float = 120, json_mode: bool = True,
+    ):
+        super().__init__(name, max_concurrency, rate_limiter)
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+        # Many local servers reject response_format; without it the prompt alone asks for JSON
+        self.json_mode = json_mode
+
+    @property
+    def endpoint(self) -> str:
+        return self.base_url
+
+    async def complete(
+        self, session: aiohttp.ClientSession, model: str, prompt: str,
+        max_tokens: int, temperature: float, json_mode: bool = False,
+    ) -> Completion:
+        body: typing.Dict[str, typing.Any] = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "n": 1,
+            "temperature": temperature,
+        }
+        if json_mode and self.json_mode:
+            body["response_format"] = {"type": "json_object"}
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+        try:
+            async with session.post(f"{self.base_url}/chat/completions", json=body, headers=headers, timeout=self.timeout) as response:
+                if response.status == 429:
+                    raise BackendRateLimited(await response.text(), response.headers)
+                if response.status == 408 or response.status >= 500:
+                    raise BackendTransientError(f"{self.name} returned HTTP {response.status}: {(await response.text())[:500]}")
+                if response.status >= 400:
+                    raise BackendError(f"{self.name} returned HTTP {response.status}: {(await response.text())[:500]}")
+                payload = await response.json(content_type=None)
+                response_headers = response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise BackendTransientError(f"{self.name} request failed: {e!r}") from e
+
+        try:
+            text = payload['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError) as e:
+            raise BackendError(f"{self.name} returned an unexpected response: {str(payload)[:500]}") from e
+        usage = payload.get('usage') or {}
+        return Completion(text, usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), response_headers)
+
+BACKEND_TYPES: typing.Dict[str, typing.Type[LLMBackend]] = {
+    "openai": OpenAICompatibleBackend,
+}
+
+def build_backend(name: str, config: typing.Dict[str, typing.Any]) -> LLMBackend:
+    """Create a backend from its LLM_BACKENDS entry; the API key is read from the named environment variable."""
+    config = dict(config)
+    backend_type = config.pop("type", "openai")
+    if backend_type not in BACKEND_TYPES:
+        raise ValueError(f"Unknown backend type {backend_type!r} for backend {name!r}")
+
+    # Several keys (api_key_envs) are spread over shard workers; a single process uses the first
+    api_key_envs = config.pop("api_key_envs", None)
+    api_key_env = config.pop("api_key_env", None) or (api_key_envs[0] if api_key_envs else None)
+    api_key = os.getenv(api_key_env) if api_key_env else None
+    if api_key_env and api_key is None:
+        raise ValueError(f"API key for backend {name!r} not found. Please set the {api_key_env} environment variable.")
+
+    requests_per_minute = config.pop("requests_per_minute", None)
+    tokens_per_minute = config.pop("tokens_per_minute", None)
+    rate_limit_share = config.pop("rate_limit_share", 1.0)
+    rate_limiter = None
+    if requests_per_minute or tokens_per_minute:
+        rate_limiter = RateLimiter(requests_per_minute or UNLIMITED_PER_MINUTE, tokens_per_minute or UNLIMITED_PER_MINUTE, rate_limit_share)
+
+    base_url = config.pop("base_url", None) or os.getenv("OPENAI_API_BASE", DEFAULT_OPENAI_BASE_URL)
+    return BACKEND_TYPES[backend_type](name, base_url, api_key, rate_limiter=rate_limiter, **config)
@@ -0,0 +1,97 @@
+import re
+import typing
+
+class Section(typing.NamedTuple):
+    title: str
+    level: int
+    start: int  # Offset of the first character after the heading line
+    end: int    # Offset of the next heading line (or the end of the buffer)
+
+class CodeBlock(typing.NamedTuple):
+    language: typing.Optional[str]
+    start_line: int  # Line index of the opening fence
+    end_line: int    # Line index of the closing fence (the line count if the fence is never closed)
+    start: int       # Code span, excluding both fence lines
+    end: int
+    context_start: int  # Up to context_before lines before the opening fence
+    context_end: int    # Up to context_after lines after the closing fence
+    section: typing.Optional[str]
+
+# Only headings and fence lines matter to the parser, so the regex engine skips everything else
+MARKER_PATTERN = re.compile(r'^(?:[ \t]*(?P<fence>`{3,}|~{3,})(?P<info>[^\n]*)|(?P<heading>#[^\n]*))', re.M)
+
+def trim_line_end(content: str, start: int, end: int) -> int:
+    # Drop exactly one line terminator, so a trailing blank line inside a block is kept
+    if end > start and content[end - 1] == '\n':
+        end -= 1
+    if end > start and content[end - 1] == '\r':
+        end -= 1
+    return end
+
+def lines_back(content: str, pos: int, count: int) -> int:
+    """Offset of the start of the line ``count`` lines above the line starting at ``pos``."""
+    for _ in range(count):
+        if pos == 0:
+            break
+        pos = content.rfind('\n', 0, pos - 1) + 1
+    return pos
+
+def lines_forward(content: str, pos: int, count: int) -> int:
+    """Offset of the end (excluding the newline) of the line ``count`` lines below the one at ``pos``."""
+    end = content.find('\n', pos)
+    for _ in range(count):
+        if end == -1:
+            break
+        end = content.find('\n', end + 1)
+    return trim_line_end(content, pos, len(content) if end == -1 else end + 1)
+
+def parse_markdown(content: str, context_before: int = 10, context_after: int = 2) -> typing.Iterator[typing.Union[Section, CodeBlock]]:
+    """Single pass over ``content`` yielding sections and fenced code blocks as offsets into it.
+
+    A fence opens on a line starting with three or more backticks or tildes and only closes on
+    a bare fence of the same character that is at least as long, so shorter fences inside a
+    longer one are code. Headings inside fences are ignored. Sections are yielded when the next
+    heading starts, code blocks when their closing fence is found.
+    """
+    section: typing.Optional[typing.Tuple[str, int, int]] = None
+    fence: typing.Optional[typing.Tuple[str, int, typing.Optional[str], int, int, int]] = None
+    line_no = 0
+    counted_to = 0
+
+    for match in MARKER_PATTERN.finditer(content):
+        pos = match.start()
+        line_no += content.count('\n', counted_to, pos)
+        counted_to = pos
+        next_pos = content.find('\n', pos)
+        next_pos = len(content) if next_pos == -1 else next_pos + 1
+        run = match.group('fence')
+        info = match.group('info').strip() if run else ""
+
+        if fence is not None:
+            char, opening_run, language, open_line, code_start, open_pos = fence
+            if run and run[0] == char and len(run) >= opening_run and not info:
+                yield CodeBlock(
+                    language, open_line, line_no, code_start, trim_line_end(content, code_start, pos),
+                    lines_back(content, open_pos, context_before), lines_forward(content, pos, context_after),
+                    section[0] if section else None,
+                )
+                fence = None
+        elif run and not (run[0] == '`' and '`' in info):
+            fence = (run[0], len(run), info.split()[0] if info else None, line_no, next_pos, pos)
+        elif match.group('heading'):
+            if section is not None:
+                yield Section(section[0], section[1], section[2], pos)
+            heading = match.group('heading').rstrip('\r')
+            section = (heading.strip('#').strip(), len(heading) - len(heading.lstrip('#')), next_pos)
+
+    if fence is not None:
+        # An unclosed fence runs to the end of the buffer
+        char, opening_run, language, open_line, code_start, open_pos = fence
+        end = trim_line_end(content, code_start, len(content))
+        yield CodeBlock(
+            language, open_line, line_no + content.count('\n', counted_to, end) + 1, code_start, end,
+            lines_back(content, open_pos, context_before), end,
+            section[0] if section else None,
+        )
+    if section is not None:
+        yield Section(section[0], section[1], section[2], len(content))
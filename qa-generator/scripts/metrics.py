@@ -0,0 +1,249 @@
+import os
+import json
+import math
+import typing
+from collections import Counter, deque
+from pathlib import Path
+
+# Upper bounds, in seconds, of the histogram buckets for queue wait and request latency
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+class CallRecord:
+    """Measurements for one logical LLM call, filled in as it waits, retries and completes."""
+
+    def __init__(self, stage: str, model: str):
+        self.stage = stage
+        self.model = model
+        self.attempts = 0
+        self.queue_wait = 0.0
+        self.latency = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached = False
+        self.hedged = False
+        self.error: typing.Optional[str] = None
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "stage": self.stage, "model": self.model, "cached": self.cached, "hedged": self.hedged, "error": self.error,
+            "retries": max(0, self.attempts - 1), "queue_wait": round(self.queue_wait, 4), "latency": round(self.latency, 4),
+            "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+        }
+
+class Histogram:
+    def __init__(self, buckets: typing.Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> typing.Optional[float]:
+        """Upper bound of the bucket holding the q-th observation; None if nothing was observed."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+class LatencyWindow:
+    """Exact quantiles over the most recent latencies, for decisions that follow the current load."""
+
+    def __init__(self, size: int = 1000):
+        self.values: typing.Deque[float] = deque(maxlen=size)
+
+    def observe(self, value: float):
+        self.values.append(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def quantile(self, q: float) -> typing.Optional[float]:
+        if not self.values:
+            return None
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class CallStats:
+    """Running totals for a set of calls: a stage, a post or the whole run."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.queue_wait = Histogram()
+        self.latency = Histogram()
+        self.rejections: typing.Counter[str] = Counter()
+
+    def add_call(self, record: CallRecord, cost: float):
+        self.calls += 1
+        if record.cached:
+            self.cache_hits += 1
+            return
+        self.errors += record.error is not None
+        self.retries += max(0, record.attempts - 1)
+        self.hedges += record.hedged
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.cost += cost
+        self.queue_wait.observe(record.queue_wait)
+        self.latency.observe(record.latency)
+
+    def merge(self, other: "CallStats"):
+        for name in ("calls", "cache_hits", "errors", "retries", "hedges", "prompt_tokens", "completion_tokens", "cost"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.queue_wait.merge(other.queue_wait)
+        self.latency.merge(other.latency)
+        self.rejections.update(other.rejections)
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        requests = self.latency.count
+        return {
+            "calls": self.calls, "cache_hits": self.cache_hits, "errors": self.errors, "retries": self.retries, "hedges": self.hedges,
+            "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens, "cost_usd": round(self.cost, 6),
+            "mean_queue_wait": round(self.queue_wait.sum / requests, 4) if requests else None,
+            "mean_latency": round(self.latency.sum / requests, 4) if requests else None,
+            "p50_latency": self.latency.quantile(0.5), "p99_latency": self.latency.quantile(0.99),
+            "rejections": dict(self.rejections),
+        }
+
+class Metrics:
+    """Per-call metrics aggregated by stage, by post and for the whole run.
+
+    Every call can also be appended to a JSONL log. ``summary`` gives the aggregates as JSON
+    for a stats file, ``prometheus_text`` as the Prometheus text exposition format.
+    """
+
+    def __init__(self, pricing: typing.Dict[str, typing.Tuple[float, float]], call_log_file: typing.Optional[Path] = None):
+        self.pricing = pricing
+        self.call_log_file = call_log_file
+        self.call_log: typing.Optional[typing.TextIO] = None
+        self.run = CallStats()
+        self.stages: typing.Dict[str, CallStats] = {}
+        self.posts: typing.Dict[str, CallStats] = {}
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        # Sent between processes without the open call log; each process appends its own lines
+        state = dict(self.__dict__)
+        state["call_log"] = None
+        return state
+
+    def merge(self, other: "Metrics"):
+        """Add another process's totals (e.g. a shard worker's) to these."""
+        self.run.merge(other.run)
+        for mine, theirs in ((self.stages, other.stages), (self.posts, other.posts)):
+            for key, stats in theirs.items():
+                mine.setdefault(key, CallStats()).merge(stats)
+
+    def cost(self, record: CallRecord) -> float:
+        # Prices are USD per million prompt and completion tokens
+        prompt_price, completion_price = self.pricing.get(record.model, (0.0, 0.0))
+        return (record.prompt_tokens * prompt_price + record.completion_tokens * completion_price) / 1e6
+
+    def record_call(self, post_id: str, record: CallRecord):
+        cost = self.cost(record)
+        for stats in (self.run, self.stages.setdefault(record.stage, CallStats()), self.posts.setdefault(post_id, CallStats())):
+            stats.add_call(record, cost)
+        if self.call_log_file is not None:
+            if self.call_log is None:
+                os.makedirs(self.call_log_file.parent, exist_ok=True)
+                self.call_log = open(self.call_log_file, 'a', buffering=1)
+            self.call_log.write(json.dumps({"post_id": post_id, **record.as_dict()}) + '\n')
+
+    def record_usage(self, post_id: str, record: CallRecord):
+        """Add tokens spent on behalf of a call already recorded, such as by the losing request of a hedged pair."""
+        cost = self.cost(record)
+        for stats in (self.run, self.stages.setdefault(record.stage, CallStats()), self.posts.get(post_id)):
+            if stats is not None:
+                stats.prompt_tokens += record.prompt_tokens
+                stats.completion_tokens += record.completion_tokens
+                stats.cost += cost
+
+    def record_rejection(self, post_id: str, kind: str, reason: str):
+        # "invalid_phrase: <phrase>" counts under invalid_phrase, keeping the set of labels small
+        key = f"{kind}:{reason.split(':', 1)[0]}"
+        for stats in (self.run, self.posts.setdefault(post_id, CallStats())):
+            stats.rejections[key] += 1
+
+    def post_summary(self, post_id: str) -> typing.Dict[str, typing.Any]:
+        return self.posts.get(post_id, CallStats()).as_dict()
+
+    def drop_post(self, post_id: str):
+        # The run and stage totals keep its calls; a long-running server drops finished posts so memory stays bounded
+        self.posts.pop(post_id, None)
+
+    def summary(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "run": self.run.as_dict(),
+            "stages": {stage: stats.as_dict() for stage, stats in self.stages.items()},
+            "posts": {post_id: stats.as_dict() for post_id, stats in self.posts.items()},
+        }
+
+    def write(self, path: typing.Union[str, Path]):
+        path = Path(path)
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def prometheus_text(self) -> str:
+        lines = []
+
+        def counter(name: str, help_text: str, value_of: typing.Callable[[CallStats], float]):
+            lines.append(f"# HELP qa_{name} {help_text}")
+            lines.append(f"# TYPE qa_{name} counter")
+            for stage, stats in sorted(self.stages.items()):
+                lines.append(f'qa_{name}{{stage="{stage}"}} {value_of(stats)}')
+
+        def histogram(name: str, help_text: str, histogram_of: typing.Callable[[CallStats], Histogram]):
+            lines.append(f"# HELP qa_{name} {help_text}")
+            lines.append(f"# TYPE qa_{name} histogram")
+            for stage, stats in sorted(self.stages.items()):
+                hist = histogram_of(stats)
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    le = "+Inf" if math.isinf(bound) else repr(bound)
+                    lines.append(f'qa_{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'qa_{name}_sum{{stage="{stage}"}} {hist.sum}')
+                lines.append(f'qa_{name}_count{{stage="{stage}"}} {hist.count}')
+
+        counter("calls_total", "LLM calls, including cache hits.", lambda s: s.calls)
+        counter("cache_hits_total", "LLM calls answered from the response cache.", lambda s: s.cache_hits)
+        counter("errors_total", "LLM calls that failed after all retries.", lambda s: s.errors)
+        counter("retries_total", "Rate-limited or failed attempts that were retried.", lambda s: s.retries)
+        counter("hedges_total", "Calls that sent a duplicate request after running slower than usual.", lambda s: s.hedges)
+        counter("prompt_tokens_total", "Prompt tokens billed.", lambda s: s.prompt_tokens)
+        counter("completion_tokens_total", "Completion tokens billed.", lambda s: s.completion_tokens)
+        counter("cost_usd_total", "Estimated spend in USD.", lambda s: s.cost)
+        histogram("queue_wait_seconds", "Time spent waiting for the rate limiter and a connection slot.", lambda s: s.queue_wait)
+        histogram("request_latency_seconds", "Time from sending a request to its response.", lambda s: s.latency)
+
+        lines.append("# HELP qa_rejections_total Generated questions and answers rejected, by reason.")
+        lines.append("# TYPE qa_rejections_total counter")
+        for key, count in sorted(self.run.rejections.items()):
+            kind, reason = key.split(':', 1)
+            lines.append(f'qa_rejections_total{{kind="{kind}",reason="{reason}"}} {count}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,223 @@
+import re
+import json
+import math
+import time
+import uuid
+import random
+import typing
+import asyncio
+import argparse
+from collections import deque
+
+from aiohttp import web
+
+from chunking import count_tokens
+
+class LatencyModel:
+    """Response delay drawn from a distribution given as "constant:S", "uniform:LO,HI" or "lognormal:MEDIAN,SIGMA".
+
+    ``per_token`` adds that many seconds per completion token, like a streaming model's decode time.
+    """
+
+    def __init__(self, spec: str = "constant:0.05", per_token: float = 0.0, seed: typing.Optional[int] = None):
+        kind, _, params = spec.partition(':')
+        values = [float(v) for v in params.split(',') if v]
+        if kind == "constant" and len(values) == 1:
+            self.sample_base = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self.sample_base = lambda: self.rng.uniform(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            self.sample_base = lambda: self.rng.lognormvariate(math.log(values[0]), values[1])
+        else:
+            raise ValueError(f"Unknown latency distribution {spec!r}")
+        self.per_token = per_token
+        self.rng = random.Random(seed)
+
+    def sample(self, completion_tokens: int) -> float:
+        return self.sample_base() + self.per_token * completion_tokens
+
+class SlidingWindow:
+    """Requests and tokens admitted over the last minute, for enforcing RPM/TPM like the real API."""
+
+    def __init__(self, requests_per_minute: typing.Optional[int], tokens_per_minute: typing.Optional[int]):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.events: typing.Deque[typing.Tuple[float, int]] = deque()
+        self.tokens = 0
+
+    def expire(self, now: float):
+        while self.events and self.events[0][0] <= now - 60:
+            self.tokens -= self.events.popleft()[1]
+
+    def admit(self, tokens: int) -> bool:
+        now = time.monotonic()
+        self.expire(now)
+        if self.requests_per_minute is not None and len(self.events) >= self.requests_per_minute:
+            return False
+        if self.tokens_per_minute is not None and self.tokens + tokens > self.tokens_per_minute:
+            return False
+        self.events.append((now, tokens))
+        self.tokens += tokens
+        return True
+
+    def reset_seconds(self) -> float:
+        return max(0.0, self.events[0][0] + 60 - time.monotonic()) if self.events else 0.0
+
+    def headers(self) -> typing.Dict[str, str]:
+        headers = {}
+        reset = f"{self.reset_seconds():.3f}s"
+        if self.requests_per_minute is not None:
+            headers["x-ratelimit-limit-requests"] = str(self.requests_per_minute)
+            headers["x-ratelimit-remaining-requests"] = str(max(0, self.requests_per_minute - len(self.events)))
+            headers["x-ratelimit-reset-requests"] = reset
+        if self.tokens_per_minute is not None:
+            headers["x-ratelimit-limit-tokens"] = str(self.tokens_per_minute)
+            headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tokens_per_minute - self.tokens))
+            headers["x-ratelimit-reset-tokens"] = reset
+        return headers
+
+class MockOpenAI:
+    """Fake OpenAI-compatible API for benchmarks: /v1/chat/completions plus the Batch API endpoints.
+
+    Replies are shaped like the prompts expect (a question, an answer, or JSON pairs), with
+    distinct wording so deduplication keeps them. Requests beyond the RPM/TPM window, or picked
+    by ``rate_limit_rate``, get a 429 with rate-limit headers; ``error_rate`` injects 500s.
+    Token usage is counted per request and in total at GET /stats.
+    """
+
+    def __init__(
+        self,
+        latency: LatencyModel,
+        requests_per_minute: typing.Optional[int] = None,
+        tokens_per_minute: typing.Optional[int] = None,
+        rate_limit_rate: float = 0.0,
+        error_rate: float = 0.0,
+        answer_words: int = 80,
+        seed: typing.Optional[int] = None,
+    ):
+        self.latency = latency
+        self.window = SlidingWindow(requests_per_minute, tokens_per_minute)
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.answer_words = answer_words
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "completed": 0, "rate_limited": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.files: typing.Dict[str, bytes] = {}
+        self.batches: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+
+    def completion_for(self, prompt: str) -> str:
+        n = self.rng.randrange(10 ** 9)
+        if '{"questions"' in prompt:
+            count = len(re.findall(r'^\[Snippet \d+\]$', prompt, re.M))
+            return json.dumps({"questions": [f"How does snippet {n}-{i} work?" for i in range(1, count + 1)]})
+        if '{"answers"' in prompt:
+            count = len(re.findall(r'^\d+\. About \[Snippet \d+\]', prompt, re.M))
+            return json.dumps({"answers": [self.answer_text(n + i) for i in range(count)]})
+        if 'Respond with JSON only' in prompt:
+            pairs = [{"question": f"What does part {n}-{i} of the section cover?", "answer": self.answer_text(n + i)} for i in range(3)]
+            return json.dumps({"pairs": pairs})
+        if prompt.rstrip().endswith(('Question:', 'Output only the question.')):
+            return f"How does feature {n} described here work?"
+        return self.answer_text(n)
+
+    def answer_text(self, n: int) -> str:
+        words = ["the", "option", "controls", "how", "requests", "are", "retried", "and", "configured", "per", "section"]
+        return f"Answer {n}: " + ' '.join(self.rng.choice(words) for _ in range(self.answer_words)) + '.'
+
+    def completion_body(self, body: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        prompt = ''.join(message.get('content', '') for message in body.get('messages', []))
+        content = self.completion_for(prompt)
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(content)
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get('model', "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.stats["requests"] += 1
+        prompt = ''.join(message.get('content', '') for message in body.get('messages', []))
+        cost = count_tokens(prompt) + int(body.get('max_tokens') or 0)
+        injected = self.rng.random() < self.rate_limit_rate
+        if injected or not self.window.admit(cost):
+            self.stats["rate_limited"] += 1
+            # An over-limit request has to wait for the oldest one in the window to expire
+            retry_after = 1 if injected else max(1, math.ceil(self.window.reset_seconds()))
+            headers = {**self.window.headers(), "retry-after": str(retry_after)}
+            return web.json_response({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, status=429, headers=headers)
+        if self.rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response({"error": {"message": "Injected server error", "type": "server_error"}}, status=500)
+
+        response = self.completion_body(body)
+        await asyncio.sleep(self.latency.sample(response['usage']['completion_tokens']))
+        self.stats["completed"] += 1
+        return web.json_response(response, headers=self.window.headers())
+
+    async def upload_file(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.files[file_id] = form['file'].file.read()
+        return web.json_response({"id": file_id, "object": "file", "purpose": form.get('purpose', "batch")})
+
+    async def create_batch(self, request: web.Request) -> web.Response:
+        # Batches complete immediately; their requests are not rate limited or delayed
+        body = await request.json()
+        output = []
+        for line in self.files[body['input_file_id']].splitlines():
+            if line.strip():
+                batch_request = json.loads(line)
+                output.append(json.dumps({
+                    "custom_id": batch_request['custom_id'],
+                    "response": {"status_code": 200, "body": self.completion_body(batch_request['body'])},
+                    "error": None,
+                }))
+        output_file_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.files[output_file_id] = '\n'.join(output).encode()
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        self.batches[batch_id] = {"id": batch_id, "object": "batch", "status": "completed", "output_file_id": output_file_id}
+        return web.json_response({**self.batches[batch_id], "status": "validating"})
+
+    async def get_batch(self, request: web.Request) -> web.Response:
+        batch = self.batches.get(request.match_info['batch_id'])
+        return web.json_response(batch) if batch else web.json_response({"error": {"message": "No such batch"}}, status=404)
+
+    async def file_content(self, request: web.Request) -> web.Response:
+        data = self.files.get(request.match_info['file_id'])
+        return web.Response(body=data) if data is not None else web.json_response({"error": {"message": "No such file"}}, status=404)
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_post('/v1/files', self.upload_file)
+        app.router.add_post('/v1/batches', self.create_batch)
+        app.router.add_get('/v1/batches/{batch_id}', self.get_batch)
+        app.router.add_get('/v1/files/{file_id}/content', self.file_content)
+        app.router.add_get('/stats', self.get_stats)
+        return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible API for benchmarks.")
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--latency', type=str, default="constant:0.05", help='constant:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA (seconds)')
+    parser.add_argument('--latency-per-token', type=float, default=0.0, help='Extra seconds per completion token')
+    parser.add_argument('--rpm', type=int, default=None, help='Requests per minute before answering 429')
+    parser.add_argument('--tpm', type=int, default=None, help='Tokens per minute before answering 429')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of requests answered with a 429 regardless of load')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    mock = MockOpenAI(
+        LatencyModel(args.latency, args.latency_per_token, args.seed),
+        args.rpm, args.tpm, args.rate_limit_rate, args.error_rate, seed=args.seed,
+    )
+    web.run_app(mock.app(), host=args.host, port=args.port, print=None)
@@ -0,0 +1,112 @@
+import re
+import math
+import heapq
+import typing
+from collections import Counter
+
+from custom_config import (
+    PLANNER_WORDS_PER_QUESTION, PLANNER_MAX_QUESTIONS_PER_POST, PLANNER_MAX_QUESTIONS_PER_SECTION,
+    PLANNER_MIN_SECTION_WORDS, PLANNER_MIN_SNIPPET_WORDS, PLANNER_TERM_WEIGHT, PLANNER_TOP_LEVEL_WEIGHT,
+    PLANNER_SNIPPET_SHARE,
+)
+
+# Inline code, CamelCase, snake_case/dotted names, CLI flags and numbers: the terms questions get asked about
+TERM_PATTERN = re.compile(r'`[^`\n]+`|\b[A-Za-z]+[a-z0-9]*[A-Z]\w*|\b\w+(?:[_.:/]\w+)+|(?<!\w)--?[A-Za-z][\w-]*|\b\d[\d.,]*\b')
+CONTENT_WORD_PATTERN = re.compile(r'[a-z][a-z0-9_]{3,}')
+# Fenced code inside a section's text; the block is scored as its own snippet instead
+FENCED_CODE_PATTERN = re.compile(r'(`{3,}|~{3,}).*?(?:\1|$)', re.DOTALL)
+
+class ItemScore(typing.NamedTuple):
+    words: int
+    term_density: float  # Terms per word
+    novelty: float       # Share of the item's vocabulary the post's other items don't use, weighted by rarity
+    score: float
+
+class QuestionPlan(typing.NamedTuple):
+    section_questions: typing.List[int]  # Questions per section; 0 skips the section
+    snippet_kept: typing.List[bool]      # Whether each code block gets a question
+    scores: typing.List[ItemScore]       # Sections first, then code blocks
+
+    @property
+    def total(self) -> int:
+        return sum(self.section_questions) + sum(self.snippet_kept)
+
+class QuestionBudget:
+    """Questions left for the whole run; posts take what they planned until it runs out."""
+
+    def __init__(self, total: int):
+        self.remaining = total
+
+    def take(self, wanted: int) -> int:
+        granted = min(wanted, self.remaining)
+        self.remaining -= granted
+        return granted
+
+def score_items(texts: typing.List[str], weights: typing.List[float]) -> typing.List[ItemScore]:
+    """Score each text by its length, term density and novelty against the other texts, times its weight."""
+    vocabularies = [set(CONTENT_WORD_PATTERN.findall(text.lower())) for text in texts]
+    document_frequency = Counter(word for vocabulary in vocabularies for word in vocabulary)
+    scores = []
+    for text, vocabulary, weight in zip(texts, vocabularies, weights):
+        words = len(text.split())
+        term_density = min(1.0, len(TERM_PATTERN.findall(text)) / words) if words else 0.0
+        # A word every item shares adds nothing new; one only this item uses counts fully
+        novelty = sum(1 / document_frequency[word] for word in vocabulary) / len(vocabulary) if vocabulary else 0.0
+        score = words * (1 + PLANNER_TERM_WEIGHT * term_density) * (0.5 + 0.5 * novelty) * weight
+        scores.append(ItemScore(words, round(term_density, 3), round(novelty, 3), round(score, 1)))
+    return scores
+
+def allocate(scores: typing.List[float], caps: typing.List[int], budget: int, counts: typing.Optional[typing.List[int]] = None) -> typing.List[int]:
+    """Hand out ``budget`` questions one at a time to the item with the highest score per question it
+    would then have (the D'Hondt method), so the first questions go where the scores are highest.
+    ``counts`` continues an earlier allocation."""
+    counts = list(counts) if counts is not None else [0] * len(scores)
+    heap = [(-score / (counts[i] + 1), i) for i, score in enumerate(scores) if counts[i] < caps[i] and score > 0]
+    heapq.heapify(heap)
+    for _ in range(budget):
+        if not heap:
+            break
+        _, i = heapq.heappop(heap)
+        counts[i] += 1
+        if counts[i] < caps[i]:
+            heapq.heappush(heap, (-scores[i] / (counts[i] + 1), i))
+    return counts
+
+def plan_questions(
+    sections: typing.List[typing.Tuple[str, str]], heading_levels: typing.Dict[str, int], snippets: typing.List[str],
+    run_budget: typing.Optional[QuestionBudget] = None,
+) -> QuestionPlan:
+    """Decide how many questions each section and code block gets before any LLM call is made.
+
+    The post's budget grows with the scored content (one question per PLANNER_WORDS_PER_QUESTION
+    weighted words, and at least one per item worth asking about, capped per post and by what is
+    left of the run's budget). Sections can take several questions, code blocks one; items too
+    short to be worth a call get none. When the budget is capped, PLANNER_SNIPPET_SHARE of it goes
+    to code blocks first, since their few words would otherwise always lose to prose.
+    """
+    # A section's text includes its code blocks; scoring its prose alone counts each block once
+    texts = [FENCED_CODE_PATTERN.sub(' ', text) for _, text in sections] + snippets
+    weights = [PLANNER_TOP_LEVEL_WEIGHT if heading_levels.get(title, 1) <= 1 else 1.0 for title, _ in sections] + [1.0] * len(snippets)
+    scores = score_items(texts, weights)
+    caps = [
+        PLANNER_MAX_QUESTIONS_PER_SECTION if item.words >= PLANNER_MIN_SECTION_WORDS else 0
+        for item in scores[:len(sections)]
+    ] + [
+        1 if item.words >= PLANNER_MIN_SNIPPET_WORDS else 0
+        for item in scores[len(sections):]
+    ]
+
+    eligible = [item.score for item, cap in zip(scores, caps) if cap]
+    budget = min(
+        PLANNER_MAX_QUESTIONS_PER_POST, sum(caps),
+        max(len(eligible), round(sum(eligible) / PLANNER_WORDS_PER_QUESTION)),
+    )
+    if run_budget is not None:
+        budget = run_budget.take(budget)
+
+    item_scores = [item.score for item in scores]
+    snippet_caps = [0] * len(sections) + caps[len(sections):]
+    reserved = min(sum(snippet_caps), math.ceil(budget * PLANNER_SNIPPET_SHARE))
+    counts = allocate(item_scores, snippet_caps, reserved)
+    counts = allocate(item_scores, caps, budget - sum(counts), counts)
+    return QuestionPlan(counts[:len(sections)], [count > 0 for count in counts[len(sections):]], scores)
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import typing
+import argparse
+from pathlib import Path
+
+from custom_config import QA_STORE_FILE
+
+QAPair = typing.Dict[str, typing.Any]
+
+# Columns holding the Q/A pair itself; snippet pairs also fill code_snippet and context
+PAIR_FIELDS = ("section_title", "question", "answer", "code_snippet", "context")
+# Review statuses set after generation; "superseded" rows came from an item that was regenerated or removed
+STATUSES = ("new", "approved", "rejected", "superseded")
+
+class QAStore:
+    """Indexed SQLite store of generated Q/A pairs, one row per pair.
+
+    The generator only ever appends rows. When a section or snippet group is regenerated, or
+    disappears from its post, its earlier rows are marked "superseded" instead of deleted.
+    Rows are indexed by post ID, section hash and status, so looking up one post or section,
+    or every pair with a given status, only reads those rows. ``iter_pairs`` streams in ID
+    order without loading the corpus into memory.
+    """
+
+    def __init__(self, path: typing.Union[str, Path]):
+        self.path = Path(path)
+        self._conn: typing.Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.path.parent, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS qa_pairs ("
+                "id INTEGER PRIMARY KEY, post_id TEXT NOT NULL, section_hash TEXT NOT NULL, "
+                "section_title TEXT, question TEXT NOT NULL, answer TEXT NOT NULL, code_snippet TEXT, context TEXT, "
+                "status TEXT NOT NULL DEFAULT 'new', created REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS qa_pairs_post ON qa_pairs(post_id, section_hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS qa_pairs_section ON qa_pairs(section_hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS qa_pairs_status ON qa_pairs(status, post_id)")
+        return self._conn
+
+    def append(self, post_id: str, section_hash: str, qa_pair: QAPair) -> int:
+        cursor = self.conn.execute(
+            "INSERT INTO qa_pairs (post_id, section_hash, section_title, question, answer, code_snippet, context, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (post_id, section_hash, *(qa_pair.get(field) for field in PAIR_FIELDS), time.time()),
+        )
+        return cursor.lastrowid
+
+    def append_many(self, records: typing.Iterable[QAPair], batch_size: int = 1000) -> int:
+        """Append {post_id, section_hash, ...pair} records in batched transactions; returns how many."""
+        count = 0
+        batch: typing.List[typing.Tuple[typing.Any, ...]] = []
+
+        def flush():
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany(
+                    "INSERT INTO qa_pairs (post_id, section_hash, section_title, question, answer, code_snippet, context, status, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+            batch.clear()
+
+        for record in records:
+            batch.append((
+                str(record.get('post_id') or ""), record.get('section_hash') or record.get('item_hash') or "",
+                *(record.get(field) for field in PAIR_FIELDS), record.get('status') or "new", time.time(),
+            ))
+            count += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return count
+
+    def supersede(self, post_id: str, section_hash: typing.Optional[str] = None, keep: typing.Optional[typing.Iterable[str]] = None):
+        """Mark a section's rows (or all of a post's rows, except sections in ``keep``) as superseded."""
+        query, params = "UPDATE qa_pairs SET status = 'superseded' WHERE post_id = ? AND status != 'superseded'", [post_id]
+        if section_hash is not None:
+            query += " AND section_hash = ?"
+            params.append(section_hash)
+        if keep is not None:
+            keep = list(keep)
+            query += f" AND section_hash NOT IN ({', '.join('?' * len(keep))})"
+            params.extend(keep)
+        self.conn.execute(query, params)
+
+    def set_status(self, ids: typing.Iterable[int], status: str):
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status {status!r}")
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("UPDATE qa_pairs SET status = ? WHERE id = ?", ((status, row_id) for row_id in ids))
+
+    def where(
+        self, post_id: typing.Optional[str] = None, section_hash: typing.Optional[str] = None,
+        statuses: typing.Optional[typing.Iterable[str]] = None,
+    ) -> typing.Tuple[str, typing.List[typing.Any]]:
+        clauses, params = [], []
+        if post_id is not None:
+            clauses.append("post_id = ?")
+            params.append(post_id)
+        if section_hash is not None:
+            clauses.append("section_hash = ?")
+            params.append(section_hash)
+        if statuses is not None:
+            statuses = list(statuses)
+            clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def iter_pairs(
+        self, post_id: typing.Optional[str] = None, section_hash: typing.Optional[str] = None,
+        statuses: typing.Optional[typing.Iterable[str]] = ("new", "approved"), batch_size: int = 1000,
+    ) -> typing.Iterator[QAPair]:
+        """Yield matching pairs in ID order, reading ``batch_size`` rows at a time."""
+        where, params = self.where(post_id, section_hash, statuses)
+        last_id = 0
+        while True:
+            # Paging by ID keeps each query short and cheap, even with the generator appending meanwhile
+            rows = self.conn.execute(
+                "SELECT id, post_id, section_hash, status, " + ", ".join(PAIR_FIELDS) + " FROM qa_pairs"
+                + (where + " AND" if where else " WHERE") + " id > ? ORDER BY id LIMIT ?",
+                params + [last_id, batch_size],
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                record = {"id": row[0], "post_id": row[1], "section_hash": row[2], "status": row[3]}
+                record.update((field, value) for field, value in zip(PAIR_FIELDS, row[4:]) if value is not None)
+                yield record
+            last_id = rows[-1][0]
+
+    def pairs(self, post_id: str, section_hash: typing.Optional[str] = None, statuses: typing.Optional[typing.Iterable[str]] = ("new", "approved")) -> typing.List[QAPair]:
+        return list(self.iter_pairs(post_id, section_hash, statuses))
+
+    def counts(self, post_id: typing.Optional[str] = None) -> typing.Dict[str, int]:
+        where, params = self.where(post_id)
+        return dict(self.conn.execute(f"SELECT status, COUNT(*) FROM qa_pairs{where} GROUP BY status", params).fetchall())
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, import or export the Q/A store.")
+    parser.add_argument('--store', type=str, default=str(QA_STORE_FILE), help='Path of the SQLite store')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--stats', action='store_true', help='Print pair counts by status')
+    action.add_argument('--export', action='store_true', help='Stream matching pairs to stdout as JSONL')
+    action.add_argument('--import', dest='import_path', type=str, metavar='PATH', help='Append Q/A records from a JSON array or JSONL file')
+    parser.add_argument('--post-id', type=str, default=None, help='Only this post')
+    parser.add_argument('--section-hash', type=str, default=None, help='Only this section or snippet group')
+    parser.add_argument('--status', type=str, action='append', choices=STATUSES, help='Only these statuses (default: new and approved); repeatable')
+    args = parser.parse_args()
+
+    store = QAStore(args.store)
+    if args.stats:
+        json.dump(store.counts(args.post_id), sys.stdout, indent=2)
+        print()
+    elif args.export:
+        for record in store.iter_pairs(args.post_id, args.section_hash, args.status or ("new", "approved")):
+            sys.stdout.write(json.dumps(record) + '\n')
+    else:
+        from export_training_data import read_records
+        print(json.dumps({"imported": store.append_many(read_records(args.import_path))}))
@@ -0,0 +1,138 @@
+import re
+import time
+import asyncio
+import typing
+
+# Durations in x-ratelimit-reset-* headers look like "20ms", "1s", "6m0s" or "1h2m3.5s"
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_duration(value: typing.Optional[str]) -> typing.Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)  # Retry-After is plain seconds
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+def estimate_prompt_tokens(prompt: str) -> int:
+    # Roughly four characters per token for English text, which is how the API estimates it too
+    return len(prompt) // 4 + 1
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.refill_per_second = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        self.refill(now)
+        # A single request larger than the whole bucket still goes through once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_per_second
+
+    def consume(self, amount: float):
+        self.available -= min(amount, self.capacity)
+
+    def set_limit(self, per_minute: float):
+        if per_minute > 0 and per_minute != self.capacity:
+            self.capacity = float(per_minute)
+            self.refill_per_second = per_minute / 60.0
+            self.available = min(self.available, self.capacity)
+
+    def sync_remaining(self, remaining: float, reset_seconds: typing.Optional[float], now: float):
+        # The server knows about usage we can't see (other processes, other keys in the org)
+        self.refill(now)
+        if remaining < self.available:
+            self.available = remaining
+            if reset_seconds:
+                # Refill no faster than the server's own reset window allows
+                self.refill_per_second = min(self.capacity / 60.0, max(self.capacity - remaining, 1.0) / reset_seconds)
+        else:
+            self.refill_per_second = self.capacity / 60.0
+
+class RateLimiter:
+    """Async limiter enforcing requests-per-minute and tokens-per-minute budgets.
+
+    Callers are admitted in FIFO order, so a burst of waiting calls is released
+    at the budgeted rate instead of all at once. A limiter with a ``share`` below 1 (one of
+    several processes on the same key) uses that fraction of the budgets, including the limits
+    and remaining counts reported in response headers, which are for the whole key.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, share: float = 1.0):
+        self.share = share
+        self.requests = TokenBucket(requests_per_minute * share)
+        self.tokens = TokenBucket(tokens_per_minute * share)
+        self.paused_until = 0.0
+        self._lock: typing.Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created lazily so the limiter can be built at import time and used from any event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def acquire(self, token_cost: int) -> float:
+        """Wait until one request of ``token_cost`` tokens fits both budgets; returns seconds waited."""
+        start = time.monotonic()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                delay = max(
+                    self.paused_until - now,
+                    self.requests.delay_for(1, now),
+                    self.tokens.delay_for(token_cost, now),
+                )
+                if delay <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(token_cost)
+                    return now - start
+                await asyncio.sleep(delay)
+
+    def try_acquire(self, token_cost: int) -> bool:
+        """Take one request of ``token_cost`` tokens only if both budgets have room right now."""
+        if self.lock.locked():
+            return False
+        now = time.monotonic()
+        if max(self.paused_until - now, self.requests.delay_for(1, now), self.tokens.delay_for(token_cost, now)) > 0:
+            return False
+        self.requests.consume(1)
+        self.tokens.consume(token_cost)
+        return True
+
+    def pause(self, seconds: float):
+        # After a 429 every caller backs off together instead of retrying independently
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers: typing.Mapping[str, str]):
+        now = time.monotonic()
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            try:
+                if limit is not None:
+                    bucket.set_limit(float(limit) * self.share)
+                if remaining is not None:
+                    bucket.sync_remaining(float(remaining) * self.share, parse_duration(headers.get(f"x-ratelimit-reset-{kind}")), now)
+            except ValueError:
+                continue
+
+    def backoff_seconds(self, headers: typing.Mapping[str, str], default: float = 1.0) -> float:
+        for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+            seconds = parse_duration(headers.get(name))
+            if seconds:
+                return seconds
+        return default
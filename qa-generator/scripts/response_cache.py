@@ -0,0 +1,91 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import typing
+from pathlib import Path
+
+class ResponseCache:
+    """Persistent SQLite cache of LLM responses keyed by a hash of the request.
+
+    Entries older than ``max_age_seconds`` are dropped, and once the stored
+    responses exceed ``max_bytes`` the least recently used ones are evicted.
+    """
+
+    EVICT_EVERY_N_PUTS = 100
+
+    def __init__(self, path: typing.Union[str, Path], max_bytes: int, max_age_seconds: float):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._conn: typing.Optional[sqlite3.Connection] = None
+        self._puts = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Opened on first use so importing the generator never touches the disk
+        if self._conn is None:
+            os.makedirs(self.path.parent, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses(created)")
+            self.evict()
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, prompt: str, temperature: float, max_tokens: int, variant: int = 0, endpoint: str = "", json_mode: bool = False) -> str:
+        # variant distinguishes repeated samples of the same prompt (e.g. several questions per section);
+        # endpoint (the backend's base URL) and json_mode keep replies from other servers or without JSON mode apart
+        payload = json.dumps([endpoint, model, prompt, temperature, max_tokens, variant, json_mode], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> typing.Optional[str]:
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT response, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.max_age_seconds:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, response, len(response.encode('utf-8')), now, now),
+        )
+        self._puts += 1
+        if self._puts % self.EVICT_EVERY_N_PUTS == 0:
+            self.evict()
+
+    def evict(self):
+        conn = self._conn
+        conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        stale_keys = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            stale_keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,80 @@
+import os
+import time
+import json
+import sqlite3
+import typing
+from pathlib import Path
+
+class RetryQueue:
+    """Durable queue of failed question/answer calls, partitioned by post.
+
+    An entry keeps everything needed to retry it (section or snippet text, and the question if
+    one was generated). Its attempt count is stored before each retry and the entry is only
+    deleted after it succeeds, so a crash mid-retry never loses it. Entries that fail
+    ``max_attempts`` times are dead-lettered: kept with status 'dead' but no longer retried.
+    """
+
+    def __init__(self, path: typing.Union[str, Path], max_attempts: int):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self._conn: typing.Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.path.parent, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS failures ("
+                "id INTEGER PRIMARY KEY, post_id TEXT NOT NULL, item_hash TEXT NOT NULL, kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, question TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "status TEXT NOT NULL DEFAULT 'pending', updated REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS failures_post ON failures(post_id, status)")
+        return self._conn
+
+    def enqueue(self, post_id: str, key: str, kind: str, payload: typing.Dict[str, typing.Any], question: typing.Optional[str]):
+        self.conn.execute(
+            "INSERT INTO failures (post_id, item_hash, kind, payload, question, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (post_id, key, kind, json.dumps(payload), question, time.time()),
+        )
+
+    def pending(self, post_id: str) -> typing.List[typing.Dict[str, typing.Any]]:
+        rows = self.conn.execute(
+            "SELECT id, item_hash, kind, payload, question, attempts FROM failures "
+            "WHERE post_id = ? AND status = 'pending' ORDER BY id",
+            (post_id,),
+        ).fetchall()
+        return [
+            {"id": row[0], "item_hash": row[1], "kind": row[2], "payload": json.loads(row[3]), "question": row[4], "attempts": row[5]}
+            for row in rows
+        ]
+
+    def start_attempt(self, entry_id: int):
+        # The last allowed attempt dead-letters the entry up front, so one that crashes the process is not retried
+        # again; complete() still removes it if the attempt succeeds
+        self.conn.execute(
+            "UPDATE failures SET attempts = attempts + 1, updated = ?, "
+            "status = CASE WHEN attempts + 1 >= ? THEN 'dead' ELSE status END WHERE id = ?",
+            (time.time(), self.max_attempts, entry_id),
+        )
+
+    def fail(self, entry_id: int, question: typing.Optional[str]):
+        # Keep a question that was generated on this attempt so the next one only needs the answer
+        self.conn.execute(
+            "UPDATE failures SET question = COALESCE(?, question), updated = ?, "
+            "status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END WHERE id = ?",
+            (question, time.time(), self.max_attempts, entry_id),
+        )
+
+    def complete(self, entry_id: int):
+        self.conn.execute("DELETE FROM failures WHERE id = ?", (entry_id,))
+
+    def dead_letters(self, post_id: typing.Optional[str] = None) -> typing.List[typing.Dict[str, typing.Any]]:
+        query = "SELECT id, post_id, kind, payload, question, attempts FROM failures WHERE status = 'dead'"
+        rows = self.conn.execute(query + " AND post_id = ?", (post_id,)) if post_id is not None else self.conn.execute(query)
+        return [
+            {"id": row[0], "post_id": row[1], "kind": row[2], "payload": json.loads(row[3]), "question": row[4], "attempts": row[5]}
+            for row in rows
+        ]
@@ -0,0 +1,144 @@
+import time
+import heapq
+import typing
+import asyncio
+import itertools
+import contextlib
+
+class FairScheduler:
+    """Grants up to ``slots`` concurrent calls, shared fairly between keys (posts).
+
+    Waiters sit in one priority queue ordered by start-time fair queuing: a key's n-th
+    outstanding call gets round n, counted from the scheduler's virtual time when the key
+    became busy. Every busy post therefore gets a call in before any post gets its next one,
+    so a post with thousands of calls cannot starve small posts queued behind it, and a post
+    arriving late starts at the current round instead of jumping ahead of everyone.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.active = 0
+        self.virtual_time = 0
+        self.waiters: typing.List[typing.Tuple[int, int, asyncio.Future]] = []
+        self.sequence = itertools.count()
+        # Per busy key: the next round to hand out and how many of its calls are queued or running
+        self.next_round: typing.Dict[str, int] = {}
+        self.outstanding: typing.Dict[str, int] = {}
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self.waiters if not future.done())
+
+    def take_round(self, key: str) -> int:
+        call_round = max(self.next_round.get(key, 0), self.virtual_time)
+        self.next_round[key] = call_round + 1
+        self.outstanding[key] = self.outstanding.get(key, 0) + 1
+        return call_round
+
+    def forget(self, key: str):
+        self.outstanding[key] -= 1
+        if not self.outstanding[key]:
+            del self.outstanding[key]
+            del self.next_round[key]
+
+    async def acquire(self, key: str = ""):
+        """Wait for a slot in ``key``'s fair turn. Every acquire is paired with a ``release(key)``."""
+        call_round = self.take_round(key)
+        if self.active < self.slots and not self.waiters:
+            self.active += 1
+            self.virtual_time = max(self.virtual_time, call_round)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (call_round, next(self.sequence), future))
+        self.dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Cancelled just after being granted a slot; hand it on
+                self.release(key)
+            else:
+                self.forget(key)
+            raise
+
+    def try_acquire(self, key: str = "") -> bool:
+        """Take a slot only if one is free and nobody is waiting for it."""
+        if self.active >= self.slots or self.queued:
+            return False
+        self.active += 1
+        self.virtual_time = max(self.virtual_time, self.take_round(key))
+        return True
+
+    def release(self, key: str = ""):
+        self.active -= 1
+        self.forget(key)
+        self.dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key: str = ""):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def dispatch(self):
+        while self.waiters and self.active < self.slots:
+            call_round, _, future = heapq.heappop(self.waiters)
+            if future.cancelled():
+                continue
+            self.active += 1
+            self.virtual_time = max(self.virtual_time, call_round)
+            future.set_result(None)
+
+class PostClock:
+    """A post's running time, not counting stretches where it waits for its turn.
+
+    Posts in a corpus run share the scheduler, the rate limiter and the connections, so a post
+    can sit behind other posts' calls for most of its life. The clock stops while any of its
+    calls is queued for one of them: the post is then held back by the others, not by its own
+    work. It runs while calls are being sent or retried and while the post works locally.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.queued = 0
+        self.paused = 0.0
+        self.paused_since: typing.Optional[float] = None
+
+    def elapsed(self) -> float:
+        now = time.monotonic()
+        paused = self.paused + (now - self.paused_since if self.paused_since is not None else 0.0)
+        return now - self.started - paused
+
+    @contextlib.contextmanager
+    def waiting(self):
+        self.queued += 1
+        if self.paused_since is None:
+            self.paused_since = time.monotonic()
+        try:
+            yield
+        finally:
+            self.queued -= 1
+            if not self.queued:
+                self.paused += time.monotonic() - self.paused_since
+                self.paused_since = None
+
+async def run_with_deadline(awaitable: typing.Awaitable, clock: PostClock, deadline_seconds: typing.Optional[float]):
+    """Like asyncio.wait_for, but the deadline is measured on ``clock``, so queued time doesn't count."""
+    if deadline_seconds is None:
+        return await awaitable
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            remaining = deadline_seconds - clock.elapsed()
+            if remaining <= 0:
+                task.cancel()
+                await asyncio.wait([task])
+                raise asyncio.TimeoutError()
+            # Waking early is harmless: the clock may have been paused meanwhile, leaving time to spare
+            done, _ = await asyncio.wait([task], timeout=remaining)
+            if done:
+                return task.result()
+    finally:
+        task.cancel()
@@ -0,0 +1,28 @@
+import hashlib
+import typing
+
+def shard_of(post_id: str, shards: int) -> int:
+    """The shard a post belongs to; stable across runs and processes, unlike hash()."""
+    digest = hashlib.blake2b(post_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+def shard_backend_configs(backend_configs: typing.Dict[str, typing.Dict[str, typing.Any]], worker: int, workers: int) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    """LLM_BACKENDS as seen by shard worker ``worker`` of ``workers``.
+
+    A backend listing several keys in ``api_key_envs`` hands them out round-robin, so worker i
+    uses key i mod k, and the workers on one key split its request and token budgets evenly.
+    Connections are only split for backends without such budgets (a local server), whose
+    capacity they are; elsewhere a worker with a busier shard can still use its whole share.
+    """
+    shard_configs = {}
+    for name, config in backend_configs.items():
+        config = dict(config)
+        keys = config.pop("api_key_envs", None) or [config.get("api_key_env")]
+        key_index = worker % len(keys)
+        sharing = len(range(key_index, workers, len(keys)))
+        config["api_key_env"] = keys[key_index]
+        config["rate_limit_share"] = 1 / sharing
+        if config.get("max_concurrency") and not (config.get("requests_per_minute") or config.get("tokens_per_minute")):
+            config["max_concurrency"] = max(1, round(config["max_concurrency"] / sharing))
+        shard_configs[name] = config
+    return shard_configs
@@ -0,0 +1,98 @@
+import os
+
+from chunking import chunk_text, count_tokens, split_blocks
+from markdown_parser import CodeBlock, Section, parse_markdown
+
+# generate_qa builds its backend at import time and refuses to start without a key
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+def parse(content):
+    items = list(parse_markdown(content))
+    sections = [item for item in items if isinstance(item, Section)]
+    blocks = [item for item in items if isinstance(item, CodeBlock)]
+    return sections, blocks
+
+def test_shorter_fence_inside_longer_fence_is_code():
+    content = "# Title\n````markdown\n```python\nprint(1)\n```\n````\nafter\n"
+    sections, blocks = parse(content)
+    assert len(blocks) == 1
+    block = blocks[0]
+    assert block.language == "markdown"
+    assert (block.start_line, block.end_line) == (1, 5)
+    assert content[block.start:block.end] == "```python\nprint(1)\n```"
+    assert block.section == "Title"
+
+def test_fence_closes_only_on_same_character():
+    content = "```\n~~~\ncode\n```\n"
+    _, blocks = parse(content)
+    assert len(blocks) == 1
+    assert content[blocks[0].start:blocks[0].end] == "~~~\ncode"
+
+def test_fence_with_info_string_does_not_close():
+    content = "```\n```python\ncode\n```\n"
+    _, blocks = parse(content)
+    assert len(blocks) == 1
+    assert content[blocks[0].start:blocks[0].end] == "```python\ncode"
+
+def test_unclosed_fence_runs_to_end():
+    content = "# Title\n```sh\necho hi\n"
+    _, blocks = parse(content)
+    assert len(blocks) == 1
+    assert content[blocks[0].start:blocks[0].end] == "echo hi"
+
+def test_hash_inside_code_is_not_a_heading():
+    content = "# Setup\n```bash\n# install the deps\npip install x\n```\n## Usage\nrun it\n"
+    sections, blocks = parse(content)
+    assert [(s.title, s.level) for s in sections] == [("Setup", 1), ("Usage", 2)]
+    assert blocks[0].section == "Setup"
+    assert "# install the deps" in content[sections[0].start:sections[0].end]
+    assert content[sections[1].start:sections[1].end] == "run it\n"
+
+def test_headless_input_has_no_sections():
+    sections, blocks = parse("Plain text\nwith no headings at all.\n")
+    assert sections == []
+    assert blocks == []
+
+def test_parse_post_headless_input_becomes_one_section():
+    from generate_qa import HEADLESS_SECTION_TITLE, parse_post
+    sections, code_blocks, _ = parse_post("Plain text\nwith no headings at all.\n")
+    assert sections == [(HEADLESS_SECTION_TITLE, "Plain text with no headings at all.")]
+    assert code_blocks == []
+
+def test_parse_post_empty_input_has_no_sections():
+    from generate_qa import parse_post
+    sections, code_blocks, _ = parse_post("  \n")
+    assert sections == []
+    assert code_blocks == []
+
+def test_split_blocks_keeps_fence_with_blank_lines_whole():
+    text = "intro\n\n```\nline one\n\nline two\n```\n\noutro"
+    assert split_blocks(text) == ["intro", "```\nline one\n\nline two\n```", "outro"]
+
+def test_chunk_text_short_text_is_one_chunk():
+    assert chunk_text("a short paragraph", max_tokens=100) == ["a short paragraph"]
+
+def test_chunk_text_respects_max_tokens():
+    text = "\n\n".join(f"paragraph {i} " + "word " * 20 for i in range(10))
+    chunks = chunk_text(text, max_tokens=50)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+
+def test_chunk_text_does_not_cut_fence_that_fits():
+    fence = "```\n" + "\n".join(f"x = {i}" for i in range(5)) + "\n```"
+    text = "\n\n".join(["word " * 20, fence, "word " * 20])
+    chunks = chunk_text(text, max_tokens=count_tokens(fence) + 5)
+    assert any(fence in chunk for chunk in chunks)
+
+def test_chunk_text_overlap_repeats_trailing_blocks():
+    paragraphs = [f"p{i} " + "word " * 8 for i in range(6)]
+    chunks = chunk_text("\n\n".join(paragraphs), max_tokens=30, overlap_tokens=15)
+    assert len(chunks) > 1
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.split("\n\n")[0] in previous.split("\n\n")
+
+def test_chunk_text_splits_huge_line_between_words():
+    text = "word " * 500
+    chunks = chunk_text(text, max_tokens=40)
+    assert all(count_tokens(chunk) <= 40 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import typing
+import asyncio
+import weakref
+import contextlib
+import contextvars
+from collections import defaultdict
+from pathlib import Path
+
+class Span:
+    __slots__ = ("id", "name", "category", "start", "end", "parent", "pid", "lane", "args")
+
+    def __init__(self, span_id: int, name: str, category: str, start: float, parent: typing.Optional["Span"], pid: int, lane: int, args: typing.Dict[str, typing.Any]):
+        self.id = span_id
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = start
+        self.parent = parent
+        self.pid = pid
+        self.lane = lane
+        self.args = args
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+# The innermost open span; asyncio tasks copy it when created, so work fanned out to tasks nests under its caller
+current_span: contextvars.ContextVar[typing.Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+
+class Tracer:
+    """Records a timed span for each post, item, LLM call and each wait inside a call.
+
+    Spans nest through ``current_span`` rather than the call stack, so a span opened in a task
+    belongs to whatever span was open where the task was created. Each asyncio task gets its
+    own lane (a thread in the Chrome trace), since concurrent spans cannot share one.
+    ``write`` exports the Chrome trace event format, which Perfetto and chrome://tracing open;
+    ``summary_table`` totals time by stage and along each post's critical path. Tracers from
+    other processes can be ``merge``d in; each process keeps its own row of lanes.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        # Wall-clock time of the origin, to line up spans recorded by other processes
+        self.wall_origin = time.time()
+        self.pid = os.getpid()
+        self.spans: typing.List[Span] = []
+        self.lanes: "weakref.WeakKeyDictionary[asyncio.Task, int]" = weakref.WeakKeyDictionary()
+        # Lane 0 is code running outside any task
+        self.lane_names: typing.Dict[typing.Tuple[int, int], str] = {(self.pid, 0): "main"}
+        self.next_lane = 1
+        self.next_id = 0
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        state = dict(self.__dict__)
+        del state["lanes"]
+        return state
+
+    def __setstate__(self, state: typing.Dict[str, typing.Any]):
+        self.__dict__.update(state)
+        self.lanes = weakref.WeakKeyDictionary()
+
+    def lane(self, label: str) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            return 0
+        lane = self.lanes.get(task)
+        if lane is None:
+            lane = self.lanes[task] = self.next_lane
+            self.next_lane += 1
+            self.lane_names[(self.pid, lane)] = label
+        return lane
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args: typing.Any) -> typing.Iterator[Span]:
+        self.next_id += 1
+        span = Span(self.next_id, name, category, time.perf_counter() - self.origin, current_span.get(), self.pid, self.lane(f"{category} {name}"), args)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.args["error"] = type(e).__name__
+            raise
+        finally:
+            span.end = time.perf_counter() - self.origin
+            current_span.reset(token)
+            self.spans.append(span)
+
+    def merge(self, other: "Tracer"):
+        """Add another process's spans (e.g. a shard worker's), shifted onto this tracer's clock."""
+        shift = other.wall_origin - self.wall_origin
+        for span in other.spans:
+            span.id += self.next_id
+            span.start += shift
+            span.end += shift
+        self.next_id += other.next_id
+        self.spans.extend(other.spans)
+        self.lane_names.update(other.lane_names)
+
+    def trace_events(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        events: typing.List[typing.Dict[str, typing.Any]] = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": lane, "args": {"name": name}}
+            for (pid, lane), name in self.lane_names.items()
+        ]
+        for span in self.spans:
+            events.append({
+                "name": span.name, "cat": span.category, "ph": "X", "pid": span.pid, "tid": span.lane,
+                "ts": round(span.start * 1e6, 1), "dur": round(span.duration * 1e6, 1),
+                "args": {"id": span.id, "parent": span.parent.id if span.parent else None, **span.args},
+            })
+        return events
+
+    def write(self, path: typing.Union[str, Path]):
+        path = Path(path)
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+        os.replace(tmp_path, path)
+
+    def children(self) -> typing.Dict[typing.Optional[int], typing.List[Span]]:
+        children: typing.Dict[typing.Optional[int], typing.List[Span]] = defaultdict(list)
+        for span in self.spans:
+            children[span.parent.id if span.parent else None].append(span)
+        return children
+
+    def critical_path(self, span: Span, children: typing.Dict[typing.Optional[int], typing.List[Span]]) -> typing.List[typing.Tuple[Span, float]]:
+        """The spans that decided when ``span`` ended, each with the time it alone accounts for, in time order.
+
+        Walking back from the end, the child that finished last before the cursor held things up;
+        the path continues inside it and then from its start. Time no child covers is the span's own.
+        """
+        segments: typing.List[typing.Tuple[Span, float]] = []
+        cursor = span.end
+        for child in sorted(children.get(span.id, ()), key=lambda s: s.end, reverse=True):
+            if child.end > cursor or child.end <= span.start:
+                continue
+            segments.append((span, cursor - child.end))
+            segments.extend(reversed(self.critical_path(child, children)))
+            cursor = max(child.start, span.start)
+        segments.append((span, cursor - span.start))
+        segments.reverse()
+        return [(segment, seconds) for segment, seconds in segments if seconds > 0]
+
+    def summary(self, root_category: str = "post") -> typing.Dict[str, typing.Any]:
+        """Per stage: span count, summed and wall-clock time, and time on the roots' critical paths."""
+        children = self.children()
+        stages: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        intervals: typing.Dict[str, typing.List[typing.Tuple[float, float]]] = defaultdict(list)
+        for span in self.spans:
+            stage = stages.setdefault(span.category, {"spans": 0, "total": 0.0, "wall": 0.0, "critical": 0.0})
+            stage["spans"] += 1
+            stage["total"] += span.duration
+            intervals[span.category].append((span.start, span.end))
+        for category, spans in intervals.items():
+            # Concurrent spans overlap, so wall time is the length of their union
+            wall, reach = 0.0, float('-inf')
+            for start, end in sorted(spans):
+                if end > reach:
+                    wall += end - max(start, reach)
+                    reach = end
+            stages[category]["wall"] = wall
+
+        roots = [span for span in self.spans if span.category == root_category]
+        critical_total = 0.0
+        slowest: typing.Optional[Span] = None
+        slowest_path: typing.List[typing.Tuple[Span, float]] = []
+        for root in roots:
+            path = self.critical_path(root, children)
+            for segment, seconds in path:
+                stages[segment.category]["critical"] += seconds
+                critical_total += seconds
+            if slowest is None or root.duration > slowest.duration:
+                slowest, slowest_path = root, path
+
+        run_wall = max((span.end for span in self.spans), default=0.0) - min((span.start for span in self.spans), default=0.0)
+        return {
+            "wall": run_wall,
+            "critical": critical_total,
+            "stages": {category: {key: round(value, 4) if isinstance(value, float) else value for key, value in stage.items()} for category, stage in stages.items()},
+            "slowest": {
+                "name": slowest.name, "duration": round(slowest.duration, 4),
+                "path": [{"stage": segment.category, "name": segment.name, "seconds": round(seconds, 4)} for segment, seconds in slowest_path],
+            } if slowest is not None else None,
+        }
+
+    def summary_table(self, max_path_rows: int = 20, min_path_share: float = 0.005) -> str:
+        summary = self.summary()
+        critical_total = summary["critical"] or 1.0
+        lines = [
+            f"Profile: {len(self.spans)} spans over {summary['wall']:.3f}s",
+            f"{'stage':<12} {'spans':>7} {'total s':>10} {'wall s':>9} {'critical s':>11} {'critical %':>11}",
+        ]
+        for category, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["critical"]):
+            lines.append(
+                f"{category:<12} {stage['spans']:>7} {stage['total']:>10.3f} {stage['wall']:>9.3f} "
+                f"{stage['critical']:>11.3f} {100 * stage['critical'] / critical_total:>10.1f}%"
+            )
+
+        slowest = summary["slowest"]
+        if slowest is not None:
+            lines.append(f"Critical path of the slowest post {slowest['name']!r} ({slowest['duration']:.3f}s):")
+            # Slivers of bookkeeping between awaits are left out; consecutive segments of one span then read as one
+            shown = [segment for segment in slowest["path"] if segment["seconds"] >= min_path_share * slowest["duration"]]
+            merged: typing.List[typing.Dict[str, typing.Any]] = []
+            for segment in shown:
+                if merged and merged[-1]["stage"] == segment["stage"] and merged[-1]["name"] == segment["name"]:
+                    merged[-1]["seconds"] += segment["seconds"]
+                else:
+                    merged.append(dict(segment))
+            for segment in merged[:max_path_rows]:
+                lines.append(f"  {segment['seconds']:>8.3f}s  {segment['stage']:<11} {segment['name']}")
+            hidden = len(merged) - max_path_rows
+            omitted = slowest["duration"] - sum(segment["seconds"] for segment in merged[:max_path_rows])
+            if hidden > 0 or omitted > 0.0005:
+                lines.append(f"  {omitted:>8.3f}s  in {max(hidden, 0)} more and {len(slowest['path']) - len(shown)} shorter segments")
+        return '\n'.join(lines)
@@ -0,0 +1,64 @@
+import re
+import typing
+
+WORD_PATTERN = re.compile(r'\w+')
+LETTER_PATTERN = re.compile(r'[^\W\d_]')
+LATIN_LETTER_PATTERN = re.compile(r'[A-Za-zÀ-ɏ]')
+
+def phrase_pattern(phrase: str) -> str:
+    # Match straight and curly apostrophes and any run of whitespace between words
+    escaped = re.escape(phrase.strip())
+    return escaped.replace("'", "['’]").replace(r'\ ', r'\s+')
+
+class TextRules:
+    """Validation rules for generated questions or answers, compiled once.
+
+    All invalid phrases go into a single case-insensitive regex, so a check is one scan of
+    the text however many phrases are configured. ``rejection`` returns the reason a text
+    fails, or None if it passes.
+    """
+
+    def __init__(
+        self,
+        invalid_phrases: typing.Iterable[str] = (),
+        min_chars: int = 0,
+        max_chars: typing.Optional[int] = None,
+        min_latin_ratio: float = 0.0,
+        max_question_overlap: typing.Optional[float] = None,
+    ):
+        phrases = sorted({p for p in invalid_phrases if p.strip()}, key=len, reverse=True)
+        self.invalid_pattern = re.compile('|'.join(phrase_pattern(p) for p in phrases), re.IGNORECASE) if phrases else None
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.min_latin_ratio = min_latin_ratio
+        self.max_question_overlap = max_question_overlap
+
+    def rejection(self, text: typing.Optional[str], question: typing.Optional[str] = None) -> typing.Optional[str]:
+        if text is None:
+            return "missing"
+        text = text.strip()
+        if not text:
+            return "empty"
+        if len(text) < self.min_chars:
+            return "too_short"
+        if self.max_chars is not None and len(text) > self.max_chars:
+            return "too_long"
+
+        if self.invalid_pattern is not None:
+            match = self.invalid_pattern.search(text)
+            if match:
+                return f"invalid_phrase: {match.group(0).lower()}"
+
+        if self.min_latin_ratio:
+            letters = len(LETTER_PATTERN.findall(text))
+            if letters and len(LATIN_LETTER_PATTERN.findall(text)) / letters < self.min_latin_ratio:
+                return "language"
+
+        if question is not None and self.max_question_overlap is not None:
+            answer_words = set(WORD_PATTERN.findall(text.lower()))
+            question_words = set(WORD_PATTERN.findall(question.lower()))
+            # An answer made up almost entirely of the question's own words says nothing new
+            if answer_words and len(answer_words & question_words) / len(answer_words) >= self.max_question_overlap:
+                return "restates_question"
+
+        return None